@@ -1,42 +1,273 @@
 import os
+import json
+import math
+import uuid
+import asyncio
 import tempfile
 import shutil
 import logging
+import threading
 import time
+_IMPORT_START = time.time()
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
-import ffmpeg
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Query, Request
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from faster_whisper import WhisperModel
 from core.languages import get_text, LANGUAGES
-from config.sandbox_config import sandbox_manager, SandboxConfig
+from core.model_registry import model_registry, AVAILABLE_MODELS
+from core.whisper_transcribe import extract_audio, audio_duration, AUDIO_PIPELINE, SAMPLE_RATE
+from core.upload_stream import (
+    ReceivedUpload, UnsupportedMediaError, UploadTooLargeError, iter_multipart, receive_upload
+)
+from core.transcript_cache import transcript_cache, make_cache_key, file_sha256
+from core.postprocess import LoopConfig, LoopDetector
+from core.text_chunks import split_text
+from core.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics, stage_seconds, transcribe_realtime_factor, jobs_total,
+    llm_request_seconds, llm_first_token_seconds, llm_rate_limited_total
+)
+from core.llm_clients import llm_client_pool
+from core.llm_cache import llm_cache, make_llm_cache_key
+from core.rate_limit import RateLimitExceeded
+from config.sandbox_config import sandbox_manager
+from core.audit_log import audit_log
+from core.batch_upload import BatchItem, BatchLimitError, BatchStager
+from core.download_cache import download_cache, remove_stale_dirs
+from downloader.video_downloader import VideoDownloader
+from core.jobs import (
+    Job, JobQueueFullError, job_manager, EVENT_DONE, EVENT_PROGRESS, EVENT_STAGE, JOB_COMPLETED, JOB_FAILED
+)
 from starlette.concurrency import run_in_threadpool
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="视频转录生成器 MVP", version="1.0.0")
+# 配置Whisper模型
+# 可选模型: tiny, base, small, medium，请求可通过 model 参数选择，其他模型按需加载
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "tiny")  # 默认使用tiny模型，速度更快
 
-# 配置模板引擎
-templates = Jinja2Templates(directory="templates")
+# 默认模型状态和启动各阶段耗时（秒），供 /health 和 /ready 报告
+model_status = {"model": WHISPER_MODEL, "loaded": False, "warmed": False, "error": None}
+startup_timings = {"import": None, "model_load": None, "warmup": None}
 
-# 配置Whisper模型
-# 可选模型: tiny, base, small, medium, large
-WHISPER_MODEL = "tiny"  # 使用tiny模型，速度更快
-logger.info(f"正在加载Whisper模型: {WHISPER_MODEL}")
-model = WhisperModel(WHISPER_MODEL, device="cpu", compute_type="int8")
-logger.info("Whisper模型加载完成")
+def _warm_up_model(name: str):
+    """加载模型并用一秒的合成音频跑一次转录，让首个真实请求不再承担推理初始化的开销"""
+    start = time.time()
+    model = model_registry.get(name)
+    startup_timings["model_load"] = time.time() - start
+    model_status["loaded"] = True
+    
+    t = np.arange(SAMPLE_RATE, dtype=np.float32) / SAMPLE_RATE
+    audio = (0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    start = time.time()
+    segments, _ = model.transcribe(audio, beam_size=1, vad_filter=False)
+    list(segments)
+    startup_timings["warmup"] = time.time() - start
+    model_status["warmed"] = True
+    logger.info(f"Whisper模型就绪: {name}, 加载: {startup_timings['model_load']:.2f}秒, "
+                f"预热: {startup_timings['warmup']:.2f}秒")
+
+def _load_default_model():
+    try:
+        _warm_up_model(WHISPER_MODEL)
+    except Exception as e:
+        model_status["error"] = str(e)
+        logger.error(f"Whisper模型加载失败: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """端口绑定后在后台线程中加载并预热默认模型，完成前 /ready 返回503"""
+    threading.Thread(target=_load_default_model, name="whisper-warmup", daemon=True).start()
+    # 清理之前的进程异常退出时遗留的URL转录工作目录
+    remove_stale_dirs(tempfile.gettempdir(), URL_WORK_DIR_PREFIX)
+    yield
+    # 退出前写出缓冲中的审计日志
+    audit_log.close()
+
+app = FastAPI(title="视频转录生成器 MVP", version="1.0.0", lifespan=lifespan)
+
+# 配置模板引擎（首次渲染页面时才导入Jinja2，见 get_templates）
+@lru_cache(maxsize=None)
+def get_templates():
+    from fastapi.templating import Jinja2Templates
+    return Jinja2Templates(directory="templates")
+
+# 上传限制
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+VALID_LANGUAGES = ["auto", "zh", "en", "ru", "de", "fr", "ja"]
+
+# 按URL转录的下载器，下载大小与上传共用限制；URL_ALLOW_GENERIC=1 时允许YouTube/Bilibili以外的任意URL
+url_downloader = VideoDownloader(
+    allow_generic=os.getenv("URL_ALLOW_GENERIC", "0") == "1",
+    max_filesize=MAX_UPLOAD_BYTES
+)
+# URL转录工作目录前缀，启动时清理遗留目录
+URL_WORK_DIR_PREFIX = "transcribe_url_"
+
+# 长音频分块并行转录：时长超过阈值（秒）且工作进程数大于1时启用，仅适用于内存音频管道
+LONG_MEDIA_THRESHOLD = float(os.getenv("LONG_MEDIA_THRESHOLD_SECONDS", "600"))
+# 每个工作进程各持有一份模型，默认关闭；开启后实际进程数受可用CPU（cgroup配额）和模型内存预算限制
+LONG_MEDIA_WORKERS = int(os.getenv("LONG_MEDIA_WORKERS", "1"))
+LONG_MEDIA_SPLIT_METHOD = os.getenv("LONG_MEDIA_SPLIT_METHOD", "energy")  # energy, silero
+
+# Whisper解码参数（同时作为转录缓存键的一部分）
+TRANSCRIBE_PARAMS = {
+    'beam_size': 5,
+    'vad_filter': True,
+    'vad_parameters': dict(min_silence_duration_ms=500),
+    'word_timestamps': True,
+    'condition_on_previous_text': False,
+    'initial_prompt': None
+}
+
+# 上传接口直接解析请求体（见 core/upload_stream.py），在此声明表单结构供OpenAPI文档使用
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "language": {"type": "string", "enum": VALID_LANGUAGES, "default": "auto"},
+                        "model": {"type": "string", "enum": AVAILABLE_MODELS, "default": WHISPER_MODEL},
+                    },
+                }
+            }
+        },
+    }
+}
+
+BATCH_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {
+                        "files": {
+                            "type": "array", "items": {"type": "string", "format": "binary"},
+                            "description": "视频文件或包含视频的zip压缩包，可上传多个",
+                        },
+                        "language": {"type": "string", "enum": VALID_LANGUAGES, "default": "auto"},
+                        "model": {"type": "string", "enum": AVAILABLE_MODELS, "default": WHISPER_MODEL},
+                        "stream": {
+                            "type": "boolean", "default": False,
+                            "description": "为true时以NDJSON逐行返回每个文件的结果（按完成顺序）",
+                        },
+                    },
+                }
+            }
+        },
+    }
+}
+
+# 幻觉循环检测阈值（见 core/postprocess.py）
+LOOP_CONFIG = LoopConfig(
+    max_ngram=int(os.getenv("LOOP_MAX_NGRAM", "32")),
+    keep_repeats=int(os.getenv("LOOP_KEEP_REPEATS", "1")),
+)
+
+# 批量转录限制：文件数（zip内的视频逐个计数）和总大小
+MAX_BATCH_FILES = int(os.getenv("TRANSCRIBE_BATCH_MAX_FILES", "50"))
+# 默认值需远小于 /tmp 容量（k8s 中为 1Gi 的 emptyDir，还存放下载缓存和转录缓存）
+MAX_BATCH_BYTES = int(os.getenv("TRANSCRIBE_BATCH_MAX_MB", "256")) * 1024 * 1024
+# 转录队列已满且本批次没有进行中的任务时，重试提交的间隔（秒）
+BATCH_RETRY_INTERVAL = 0.5
+
+# 由其他组件状态计算的指标，在采集时读取
+metrics.gauge("transcribe_queue_depth", "排队中的转录任务数", callback=lambda: job_manager.queue_depth)
+metrics.gauge("transcribe_jobs_in_flight", "正在执行的转录任务数", callback=lambda: job_manager.in_flight)
+metrics.gauge("whisper_models_loaded", "常驻的Whisper模型数", callback=lambda: len(model_registry.loaded_models()))
+metrics.gauge(
+    "whisper_model_load_seconds", "Whisper模型最近一次加载耗时（秒）", ["model", "device", "compute_type"],
+    callback=lambda: dict(model_registry.load_times)
+)
+metrics.gauge("llm_clients_pooled", "池中复用的LLM客户端数", callback=lambda: len(llm_client_pool))
+metrics.gauge("polish_requests_in_flight", "进行中（含排队）的润色请求数", callback=lambda: sandbox_manager.active_requests)
+metrics.gauge("audit_log_queue_depth", "等待写入的审计日志记录数", callback=lambda: audit_log.queue_depth)
+metrics.counter(
+    "audit_log_records_total", "审计日志记录数", ["result"],
+    callback=lambda: {("written",): audit_log.written, ("dropped",): audit_log.dropped}
+)
+metrics.gauge(
+    "app_startup_seconds", "启动各阶段耗时（秒）: import, model_load, warmup", ["phase"],
+    callback=lambda: {(phase,): seconds for phase, seconds in startup_timings.items() if seconds is not None}
+)
+if transcript_cache is not None:
+    metrics.counter("transcript_cache_hits_total", "转录缓存命中次数", callback=lambda: transcript_cache.hits)
+    metrics.counter("transcript_cache_misses_total", "转录缓存未命中次数", callback=lambda: transcript_cache.misses)
+if download_cache is not None:
+    metrics.counter("download_cache_hits_total", "下载缓存命中次数", callback=lambda: download_cache.hits)
+    metrics.counter("download_cache_misses_total", "下载缓存未命中次数", callback=lambda: download_cache.misses)
+    metrics.counter(
+        "download_cache_deduplicated_total", "等待同一视频进行中下载的请求数",
+        callback=lambda: download_cache.deduplicated
+    )
+if llm_cache is not None:
+    metrics.counter("llm_cache_hits_total", "LLM结果缓存命中次数", callback=lambda: llm_cache.hits)
+    metrics.counter("llm_cache_misses_total", "LLM结果缓存未命中次数", callback=lambda: llm_cache.misses)
+
+# 转录缓存命中状态响应头
+CACHE_HEADER = "X-Transcript-Cache"
+# 润色请求ID响应头，与审计日志中的 request_id 对应
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# SSE事件轮询间隔（秒）
+SSE_POLL_INTERVAL = 0.2
 
 class TranscriptResponse(BaseModel):
     text: str
     segments: list
     language: str
 
+class URLTranscribeRequest(BaseModel):
+    """按URL转录请求"""
+    url: str
+    language: str = "auto"
+    model: str = WHISPER_MODEL
+
+class JobSubmitResponse(BaseModel):
+    """异步转录任务提交响应"""
+    job_id: str
+    status: str
+
+class JobStatusResponse(BaseModel):
+    """异步转录任务状态响应"""
+    job_id: str
+    filename: str
+    status: str  # queued, running, completed, failed
+    stage: str  # queued, extracting, transcribing, postprocessing
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[TranscriptResponse] = None
+    error: Optional[str] = None
+    cached: bool = False
+
+class BatchItemResponse(BaseModel):
+    """批量转录中单个文件的结果"""
+    index: int
+    filename: str
+    status: str  # completed, failed
+    result: Optional[TranscriptResponse] = None
+    error: Optional[str] = None
+    cached: bool = False
+
+class BatchResponse(BaseModel):
+    """批量转录响应，results 与上传顺序一致"""
+    results: List[BatchItemResponse]
+    processing_time: float
+
 class LLMRequest(BaseModel):
     """LLM润色请求模型"""
     text: str
@@ -54,6 +285,7 @@ class LLMResponse(BaseModel):
     style: str
     processing_time: float
     sandbox_validation: dict
+    cached: bool = False
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request, ui_lang: str = Query("zh", description="界面语言")):
@@ -86,6 +318,9 @@ async def read_root(request: Request, ui_lang: str = Query("zh", description="
         "transcription_content": get_text(ui_lang, "transcription_content"),
         "error": get_text(ui_lang, "error"),
         "upload_failed": get_text(ui_lang, "upload_failed"),
+        "progress": get_text(ui_lang, "progress"),
+        "segments": get_text(ui_lang, "segments"),
+        "chunks": get_text(ui_lang, "chunks"),
         "llm_section_title": get_text(ui_lang, "llm_section_title"),
         "llm_provider_label": get_text(ui_lang, "llm_provider_label"),
         "llm_style_label": get_text(ui_lang, "llm_style_label"),
@@ -116,288 +351,1027 @@ async def read_root(request: Request, ui_lang: str = Query("zh", description="
         "llm_download_button": get_text(ui_lang, "llm_download_button")
     }
     
-    return templates.TemplateResponse("index.html", template_vars)
+    return get_templates().TemplateResponse("index.html", template_vars)
 
-@app.post("/transcribe", response_model=TranscriptResponse)
-async def transcribe_video(file: UploadFile = File(...), language: str = Form("auto")):
-    """视频转录接口"""
-    
-    # 定义日志函数（这里只是占位符，实际日志会通过WebSocket或SSE发送）
-    def addLog(message, level='info'):
-        logger.info(f"[WEB] {message}")
+def _validate_params(language: str, model: str):
+    """校验语言和模型参数"""
+    # 验证语言参数
+    if language not in VALID_LANGUAGES:
+        logger.error(f"不支持的语言: {language}")
+        raise HTTPException(status_code=400, detail="不支持的语言")
     
-    start_time = time.time()
-    logger.info(f"收到文件上传请求: {file.filename}, 大小: {file.size} bytes, 语言: {language}")
+    # 验证模型参数
+    if model not in AVAILABLE_MODELS:
+        logger.error(f"不支持的模型: {model}")
+        raise HTTPException(status_code=400, detail="不支持的模型")
+
+async def _receive_upload(request: Request) -> ReceivedUpload:
+    """边接收边处理上传：可流式解析的容器直接送入ffmpeg提取音频，其余以异步IO落盘"""
+    # 检查文件大小 (限制为100MB)，请求头声明过大时直接拒绝，不读取请求体
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + 64 * 1024:
+        logger.error(f"文件过大: {content_length} bytes")
+        raise HTTPException(status_code=400, detail="文件大小不能超过100MB")
     
-    # 检查文件类型
-    if not file.content_type.startswith('video/'):
-        logger.error(f"不支持的文件类型: {file.content_type}")
+    try:
+        return await receive_upload(
+            request.headers, request.stream(), MAX_UPLOAD_BYTES,
+            stream_audio=AUDIO_PIPELINE == "memory"
+        )
+    except UnsupportedMediaError as e:
+        # 检查文件类型
+        logger.error(str(e))
         raise HTTPException(status_code=400, detail="只支持视频文件")
-    
-    # 检查文件大小 (限制为100MB)
-    if file.size > 100 * 1024 * 1024:
-        logger.error(f"文件过大: {file.size} bytes")
+    except UploadTooLargeError as e:
+        logger.error(str(e))
         raise HTTPException(status_code=400, detail="文件大小不能超过100MB")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        logger.error(f"音频提取失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"音频提取失败: {str(e)}")
+
+async def _submit_media(media: Union[np.ndarray, Path], sha256: str, filename: str, language: str, model: str,
+                        audio_time: float = 0.0, cleanup=None) -> Job:
+    """命中转录缓存时直接返回已完成的任务，否则提交到转录线程池（队列已满时抛出 JobQueueFullError）"""
+    cache_key = None
+    if transcript_cache is not None:
+        cache_key = make_cache_key(sha256, model=model, language=language, loop=vars(LOOP_CONFIG), **TRANSCRIBE_PARAMS)
+        cached = await run_in_threadpool(transcript_cache.get, cache_key)
+        if cached is not None:
+            logger.info(f"转录缓存命中: {filename} ({sha256[:12]})")
+            if cleanup is not None:
+                cleanup()
+            jobs_total.inc(status="cached")
+            return await run_in_threadpool(job_manager.add_completed, cached, filename=filename)
+    # 提交时会向共享状态后端发布任务状态，不在事件循环中执行
+    job = await run_in_threadpool(
+        job_manager.submit, _transcribe_file, media, language, model, audio_time, cache_key,
+        filename=filename,
+        cleanup=cleanup
+    )
+    job.future.add_done_callback(
+        lambda future: jobs_total.inc(status="failed" if future.exception() else "completed")
+    )
+    return job
+
+async def _submit_transcription(request: Request) -> Job:
+    """接收上传并校验参数，然后提交到转录线程池"""
+    upload = await _receive_upload(request)
+    language = upload.fields.get("language", "auto")
+    model = upload.fields.get("model", WHISPER_MODEL)
+    logger.info(f"收到文件上传请求: {upload.filename}, 大小: {upload.size} bytes, 语言: {language}, 模型: {model}, "
+                f"流式提取: {upload.streamed}")
+    # 上传耗时主要取决于客户端网络，单独记录，不计入音频提取阶段
+    stage_seconds.observe(upload.upload_time, stage="upload")
+    try:
+        _validate_params(language, model)
+        media = upload.audio if upload.audio is not None else upload.video_path
+        return await _submit_media(
+            media, upload.sha256, upload.filename, language, model,
+            audio_time=upload.audio_time,
+            cleanup=upload.cleanup
+        )
+    except JobQueueFullError as e:
+        upload.cleanup()
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        upload.cleanup()
+        raise
+
+def _transcribe_file(job: Job, media: Union[np.ndarray, Path], language: str, model_name: str,
+                     upload_audio_time: float = 0.0, cache_key: Optional[str] = None) -> dict:
+    """在工作线程中执行音频提取和Whisper转录，返回TranscriptResponse字段
+
+    media 为上传时已流式提取的音频数组，或落盘的视频文件路径；
+    指定 cache_key 时结果写入转录缓存。
+    """
     
-    # 验证语言参数
-    valid_languages = ["auto", "zh", "en", "ru", "de", "fr", "ja"]
-    if language not in valid_languages:
-        logger.error(f"不支持的语言: {language}")
-        raise HTTPException(status_code=400, detail="不支持的语言")
+    # 日志同时写入服务端日志和任务事件流（通过 /jobs/{id}/events 以SSE推送给前端）
+    def addLog(message, level='info'):
+        logger.info(f"[WEB] {message}")
+        job.log(message, level)
     
-    # 创建临时目录
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_path = Path(temp_dir)
-        logger.info(f"创建临时目录: {temp_path}")
-        
-        # 保存上传的视频文件
-        video_path = temp_path / f"input{Path(file.filename).suffix}"
-        logger.info(f"保存视频文件到: {video_path}")
-        with open(video_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 提取音频
-        audio_path = temp_path / "audio.wav"
+    start_time = time.time()
+    
+    if isinstance(media, np.ndarray):
+        # 音频已在接收上传时通过ffmpeg管道提取
+        audio = media
+        audio_time = upload_audio_time
+        addLog(f"音频已随上传流式提取完成，上传结束后耗时: {audio_time:.2f}秒", 'info')
+        job.emit(EVENT_PROGRESS, stage="extracting", audio_time=audio_time, streamed=True)
+    else:
+        # 提取音频（默认通过管道直接解码到内存，见 AUDIO_PIPELINE）
         logger.info("开始提取音频...")
-        addLog("开始提取音频...", 'info')
+        job.set_stage("extracting", "开始提取音频...")
         audio_start = time.time()
         try:
-            stream = ffmpeg.input(str(video_path))
-            stream = ffmpeg.output(stream, str(audio_path), acodec='pcm_s16le', ac=1, ar='16000')
-            ffmpeg.run(stream, overwrite_output=True, quiet=True)
+            audio = extract_audio(media, media.parent)
             audio_time = time.time() - audio_start
-            logger.info(f"音频提取完成: {audio_path}, 耗时: {audio_time:.2f}秒")
+            logger.info(f"音频提取完成: {AUDIO_PIPELINE}模式, 时长: {audio_duration(audio)}秒, 耗时: {audio_time:.2f}秒")
             addLog(f"音频提取完成，耗时: {audio_time:.2f}秒", 'info')
+            job.emit(EVENT_PROGRESS, stage="extracting", audio_time=audio_time, streamed=False)
         except Exception as e:
             logger.error(f"音频提取失败: {str(e)}")
             addLog(f"音频提取失败: {str(e)}", 'error')
-            raise HTTPException(status_code=500, detail=f"音频提取失败: {str(e)}")
+            raise RuntimeError(f"音频提取失败: {str(e)}")
+    stage_seconds.observe(audio_time, stage="extract")
+    
+    # 使用Whisper转录
+    logger.info("开始语音识别...")
+    job.set_stage("transcribing", "开始语音识别...")
+    whisper_start = time.time()
+    try:
+        # 准备转录参数
+        transcribe_params = dict(TRANSCRIBE_PARAMS)
         
-        # 使用Whisper转录
-        logger.info("开始语音识别...")
-        addLog("开始语音识别...", 'info')
-        whisper_start = time.time()
-        try:
-            # 准备转录参数
-            transcribe_params = {
-                'beam_size': 5,
-                'vad_filter': True,
-                'vad_parameters': dict(min_silence_duration_ms=500),
-                'word_timestamps': True,
-                'condition_on_previous_text': False,
-                'initial_prompt': None
-            }
-            
-            # 如果指定了语言，添加到参数中
-            if language != "auto":
-                transcribe_params['language'] = language
-                logger.info(f"使用指定语言: {language}")
-                addLog(f"使用指定语言: {language}", 'info')
-            else:
-                logger.info("使用自动语言检测")
-                addLog("使用自动语言检测", 'info')
-            
-            addLog("正在加载Whisper模型...", 'info')
-            segments, info = model.transcribe(str(audio_path), **transcribe_params)
-            whisper_time = time.time() - whisper_start
-            logger.info(f"识别完成，语言: {info.language}, 耗时: {whisper_time:.2f}秒")
-            addLog(f"语音识别完成，检测到语言: {info.language}, 耗时: {whisper_time:.2f}秒", 'info')
-            
-            # 收集转录结果，添加去重逻辑
-            text_segments = []
-            full_text = ""
-            seen_texts = set()  # 用于去重
-            processed_segments = 0
-            skipped_segments = 0
-            
-            addLog("开始处理转录结果...", 'info')
-            for segment in segments:
-                processed_segments += 1
-                segment_text = segment.text.strip()
-                
-                # 跳过空文本或重复文本
-                if not segment_text or segment_text in seen_texts:
-                    skipped_segments += 1
-                    continue
-                
-                # 跳过过长的重复模式（如 "livin' livin' livin'..."）
-                if len(segment_text.split()) > 50:  # 如果单段超过50个词
-                    words = segment_text.split()
-                    # 检查是否有重复模式
-                    if len(set(words)) < len(words) * 0.3:  # 如果重复词超过70%
-                        logger.warning(f"跳过重复模式文本: {segment_text[:100]}...")
-                        addLog(f"跳过重复模式文本: {segment_text[:100]}...", 'warning')
-                        skipped_segments += 1
-                        continue
-                
-                seen_texts.add(segment_text)
-                text_segments.append({
-                    "start": segment.start,
-                    "end": segment.end,
-                    "text": segment_text
-                })
-                full_text += segment_text + " "
-            
-            addLog(f"处理完成: 总段数 {processed_segments}, 有效段数 {len(text_segments)}, 跳过段数 {skipped_segments}", 'info')
-            
-            # 清理最终文本
-            full_text = full_text.strip()
-            addLog("开始清理文本...", 'info')
-            
-            # 移除重复的短语
-            words = full_text.split()
-            cleaned_words = []
-            removed_duplicates = 0
-            for i, word in enumerate(words):
-                # 检查是否与前一个词相同
-                if i > 0 and word == words[i-1]:
-                    removed_duplicates += 1
-                    continue
-                cleaned_words.append(word)
-            
-            full_text = " ".join(cleaned_words)
-            addLog(f"文本清理完成，移除了 {removed_duplicates} 个重复单词", 'info')
-            
-            total_time = time.time() - start_time
-            logger.info(f"转录完成，总长度: {len(full_text)} 字符, 总耗时: {total_time:.2f}秒")
-            logger.info(f"处理了 {len(text_segments)} 个音频段")
-            addLog(f"转录完成！总字符数: {len(full_text)}, 总耗时: {total_time:.2f}秒", 'info')
-            addLog(f"最终处理了 {len(text_segments)} 个有效音频段", 'info')
-            
-            return TranscriptResponse(
-                text=full_text,
-                segments=text_segments,
-                language=info.language
+        # 如果指定了语言，添加到参数中
+        if language != "auto":
+            transcribe_params['language'] = language
+            logger.info(f"使用指定语言: {language}")
+            addLog(f"使用指定语言: {language}", 'info')
+        else:
+            logger.info("使用自动语言检测")
+            addLog("使用自动语言检测", 'info')
+        
+        duration = audio_duration(audio)
+        segments = None
+        if LONG_MEDIA_WORKERS > 1 and duration is not None and duration >= LONG_MEDIA_THRESHOLD:
+            # 长音频：在静音处分块，由多个进程并行转录
+            from core.chunked_transcribe import chunked_transcriber
+            with chunked_transcriber(model_name, LONG_MEDIA_WORKERS, LONG_MEDIA_SPLIT_METHOD) as transcriber:
+                if transcriber is not None:
+                    addLog(f"长音频({duration:.0f}秒)，使用 {transcriber.workers} 个进程分块并行转录", 'info')
+                    segments, info = transcriber.transcribe(
+                        audio, transcribe_params,
+                        on_chunk_done=lambda done, total: job.emit(
+                            EVENT_PROGRESS, stage="transcribing", chunks=done, total_chunks=total,
+                            percent=done / total * 100
+                        )
+                    )
+        if segments is None:
+            if not model_registry.is_loaded(model_name):
+                addLog(f"正在加载Whisper模型: {model_name}...", 'info')
+            model = model_registry.get(model_name)
+            segments, info = model.transcribe(audio, **transcribe_params)
+        whisper_time = time.time() - whisper_start
+        logger.info(f"识别完成，语言: {info.language}, 耗时: {whisper_time:.2f}秒")
+        addLog(f"语音识别完成，检测到语言: {info.language}, 耗时: {whisper_time:.2f}秒", 'info')
+        
+        # 收集转录结果，随段增量去除幻觉循环（重复的词、短语或整段）
+        text_segments = []
+        detector = LoopDetector(LOOP_CONFIG)
+        # 循环检测随解码逐段进行，其耗时单独累计，计入后处理阶段而不是转录阶段
+        postprocess_time = 0.0
+        processed_segments = 0
+        skipped_segments = 0
+        
+        addLog("开始处理转录结果...", 'info')
+        # segments 是惰性生成器，实际解码在迭代时进行，每产出一段就上报一次进度
+        for segment in segments:
+            processed_segments += 1
+            job.emit(
+                EVENT_PROGRESS,
+                stage="transcribing",
+                segments=processed_segments,
+                position=segment.end,
+                duration=info.duration,
+                percent=min(100.0, segment.end / info.duration * 100) if info.duration else None
             )
             
+            # 跳过空文本或整段都是重复循环的文本
+            detect_start = time.time()
+            segment_text = detector.feed(segment.text.strip())
+            postprocess_time += time.time() - detect_start
+            if not segment_text:
+                skipped_segments += 1
+                continue
+            
+            text_segments.append({
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment_text
+            })
+        
+        # 解码在迭代 segments 时完成，转录阶段耗时以迭代结束为准
+        stage_seconds.observe(time.time() - whisper_start - postprocess_time, stage="transcribe")
+        addLog(f"处理完成: 总段数 {processed_segments}, 有效段数 {len(text_segments)}, 跳过段数 {skipped_segments}", 'info')
+        
+        job.set_stage("postprocessing", "开始清理文本...")
+        postprocess_start = time.time()
+        full_text = " ".join(segment["text"] for segment in text_segments)
+        stage_seconds.observe(postprocess_time + time.time() - postprocess_start, stage="postprocess")
+        addLog(f"文本清理完成，移除了 {detector.removed_tokens} 个重复词元", 'info')
+        
+        total_time = time.time() - start_time
+        stage_seconds.observe(total_time, stage="total")
+        if info.duration:
+            transcribe_realtime_factor.observe(total_time / info.duration)
+        logger.info(f"转录完成，总长度: {len(full_text)} 字符, 总耗时: {total_time:.2f}秒")
+        logger.info(f"处理了 {len(text_segments)} 个音频段")
+        addLog(f"转录完成！总字符数: {len(full_text)}, 总耗时: {total_time:.2f}秒", 'info')
+        addLog(f"最终处理了 {len(text_segments)} 个有效音频段", 'info')
+        
+        result = {
+            "text": full_text,
+            "segments": text_segments,
+            "language": info.language
+        }
+        if cache_key is not None:
+            transcript_cache.put(cache_key, result)
+        return result
+        
+    except Exception as e:
+        logger.error(f"转录失败: {str(e)}")
+        addLog(f"转录失败: {str(e)}", 'error')
+        raise RuntimeError(f"转录失败: {str(e)}")
+
+@app.post("/transcribe", response_model=TranscriptResponse, openapi_extra=UPLOAD_FORM_SCHEMA)
+async def transcribe_video(request: Request, response: Response):
+    """视频转录接口（同步等待结果，转录在线程池中执行，不阻塞事件循环）
+
+    multipart 表单字段: file（视频文件）, language（默认auto）, model（默认WHISPER_MODEL）
+    响应头 X-Transcript-Cache 标明是否命中转录缓存（hit/miss）
+    """
+    job = await _submit_transcription(request)
+    response.headers[CACHE_HEADER] = "hit" if job.cached else "miss"
+    try:
+        result = await asyncio.wrap_future(job.future)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return TranscriptResponse(**result)
+
+def _fetch_audio(url: str, work_dir: Path) -> Path:
+    """把URL的音频放入 work_dir：启用下载缓存时按视频ID复用已下载的文件，并合并同一视频的并发下载"""
+    if download_cache is None:
+        return Path(url_downloader.download_audio(url, str(work_dir)))
+    return download_cache.fetch(
+        url_downloader.extract_id(url),
+        lambda output_dir: url_downloader.download_audio(url, output_dir),
+        work_dir
+    )
+
+async def _download_audio(url: str, work_dir: Path) -> Path:
+    """在线程池中只下载URL的音频流，下载失败返回400"""
+    download_start = time.time()
+    try:
+        path = await run_in_threadpool(_fetch_audio, url, work_dir)
+    except Exception as e:
+        logger.error(f"下载失败: {url}, {str(e)}")
+        raise HTTPException(status_code=400, detail=f"下载失败: {str(e)}")
+    stage_seconds.observe(time.time() - download_start, stage="download")
+    logger.info(f"音频下载完成: {path.name}, 大小: {path.stat().st_size} bytes, 耗时: {time.time() - download_start:.2f}秒")
+    return path
+
+@app.post("/transcribe/url", response_model=TranscriptResponse)
+async def transcribe_url(request: URLTranscribeRequest, response: Response):
+    """按URL转录（YouTube等）：只下载音频流（bestaudio，不重新编码），下载完成后直接送入音频提取和转录
+
+    响应头 X-Transcript-Cache 标明是否命中转录缓存（hit/miss）
+    """
+    _validate_params(request.language, request.model)
+    if url_downloader.detect_platform(request.url) is None:
+        raise HTTPException(status_code=400, detail="不支持的视频平台")
+    logger.info(f"收到URL转录请求: {request.url}, 语言: {request.language}, 模型: {request.model}")
+    
+    work_dir = Path(tempfile.mkdtemp(prefix=URL_WORK_DIR_PREFIX))
+    cleanup = lambda: shutil.rmtree(work_dir, ignore_errors=True)
+    try:
+        audio_path = await _download_audio(request.url, work_dir)
+        sha256 = await run_in_threadpool(file_sha256, audio_path)
+        job = await _submit_media(audio_path, sha256, audio_path.name, request.language, request.model,
+                                  cleanup=cleanup)
+    except JobQueueFullError as e:
+        cleanup()
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception:
+        cleanup()
+        raise
+    
+    response.headers[CACHE_HEADER] = "hit" if job.cached else "miss"
+    try:
+        result = await asyncio.wrap_future(job.future)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return TranscriptResponse(**result)
+
+def _batch_item(index: int, filename: str, job: Optional[Job] = None, error: Optional[str] = None) -> dict:
+    if job is not None:
+        try:
+            return {"index": index, "filename": filename, "status": "completed",
+                    "result": job.future.result(), "error": None, "cached": job.cached}
         except Exception as e:
-            logger.error(f"转录失败: {str(e)}")
-            addLog(f"转录失败: {str(e)}", 'error')
-            raise HTTPException(status_code=500, detail=f"转录失败: {str(e)}")
+            error = str(e)
+    return {"index": index, "filename": filename, "status": "failed", "result": None, "error": error, "cached": False}
 
-@app.post("/polish", response_model=LLMResponse)
-def polish_text(request: LLMRequest):
+def _remove_when_done(work_dir: Path, jobs: List[Job]):
+    """批量请求提前结束（如客户端断开流式响应）时，等剩余任务结束后再删除临时目录"""
+    remaining = len(jobs)
+    
+    def on_done(_):
+        nonlocal remaining
+        remaining -= 1
+        if remaining == 0:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    for job in jobs:
+        job.future.add_done_callback(on_done)
+
+async def _run_batch(items: List[BatchItem], work_dir: Path, language: str, model: str) -> AsyncIterator[dict]:
+    """逐个提交批量中的文件并按完成顺序产出结果
+
+    转录队列已满时先等待本批次已提交的任务完成再继续提交，队列容量在整个批次中复用。
+    """
+    pending = {}  # asyncio future -> (index, filename, job)
+    
+    async def wait_any() -> List[dict]:
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finished = [pending.pop(future) for future in done]
+        return [_batch_item(index, filename, job) for index, filename, job in finished]
+    
+    try:
+        for index, item in enumerate(items):
+            if item.error is not None:
+                yield _batch_item(index, item.filename, error=item.error)
+                continue
+            while True:
+                try:
+                    job = await _submit_media(
+                        item.path, item.sha256, item.filename, language, model,
+                        cleanup=lambda path=item.path: path.unlink(missing_ok=True)
+                    )
+                    break
+                except JobQueueFullError:
+                    if not pending:
+                        await asyncio.sleep(BATCH_RETRY_INTERVAL)
+                        continue
+                    for result in await wait_any():
+                        yield result
+            pending[asyncio.wrap_future(job.future)] = (index, item.filename, job)
+        while pending:
+            for result in await wait_any():
+                yield result
+    finally:
+        if pending:
+            _remove_when_done(work_dir, [job for _, _, job in pending.values()])
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+async def _stage_batch(request: Request, stager: BatchStager) -> Tuple[List[BatchItem], Dict[str, str]]:
+    """边接收边把 files 字段的各文件part写入暂存目录，返回 (暂存结果, 其他表单字段)"""
+    items: List[BatchItem] = []
+    fields: Dict[str, str] = {}
+    part = None
+    try:
+        async for event in iter_multipart(request.headers, request.stream()):
+            kind = event[0]
+            if kind == "field":
+                fields[event[1]] = event[2]
+            elif kind == "file_start" and event[1] == "files":
+                part = await run_in_threadpool(stager.begin, event[2], event[3])
+            elif kind == "file_data" and part is not None:
+                await run_in_threadpool(part.write, event[1])
+            elif kind == "file_end" and part is not None:
+                current, part = part, None
+                items.extend(await run_in_threadpool(current.finish))
+        if part is not None:
+            raise ValueError("上传不完整：请求体在文件结束前中断")
+    except BaseException:
+        if part is not None:
+            part.abort()
+        raise
+    return items, fields
+
+@app.post("/transcribe/batch", response_model=BatchResponse, openapi_extra=BATCH_FORM_SCHEMA)
+async def transcribe_batch(request: Request):
+    """批量视频转录接口
+
+    multipart 表单字段: files（视频文件或zip压缩包，可重复）, language（默认auto）, model（默认WHISPER_MODEL），
+    stream（为true时以NDJSON逐行返回每个文件的结果，按完成顺序）。
+    所有文件共用一个临时目录和同一组参数，共享转录线程池并逐个命中转录缓存；
+    单个文件类型或大小不合法只标记该文件失败，超过批量文件数或总大小限制时整个请求返回400。
+    文件边接收边写入临时目录，请求头声明的大小超限时不读取请求体。
+    """
     start_time = time.time()
-    logger.info(f"收到LLM润色请求: provider={request.provider}, style={request.style}, base_url={request.base_url}")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_BATCH_BYTES + 64 * 1024:
+        logger.error(f"批量请求过大: {content_length} bytes")
+        raise HTTPException(status_code=400, detail=f"批量总大小不能超过{MAX_BATCH_BYTES // 1024 // 1024}MB")
+    
+    work_dir = Path(tempfile.mkdtemp(prefix="transcribe_batch_"))
+    stager = BatchStager(work_dir, MAX_UPLOAD_BYTES, MAX_BATCH_BYTES, MAX_BATCH_FILES)
+    try:
+        items, fields = await _stage_batch(request, stager)
+        if not items:
+            raise ValueError("缺少上传文件")
+        language = fields.get("language", "auto")
+        model = fields.get("model", WHISPER_MODEL)
+        stream = fields.get("stream", "false").strip().lower() in ("true", "1", "yes", "on")
+        _validate_params(language, model)
+    except (BatchLimitError, ValueError) as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        logger.error(str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    logger.info(f"收到批量转录请求: {len(items)} 个文件, {stager.total_bytes} bytes, 语言: {language}, 模型: {model}")
+    
+    if stream:
+        async def ndjson_stream():
+            async for item in _run_batch(items, work_dir, language, model):
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        
+        return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+    
+    results = [item async for item in _run_batch(items, work_dir, language, model)]
+    results.sort(key=lambda item: item["index"])
+    processing_time = time.time() - start_time
+    logger.info(f"批量转录完成: {len(results)} 个文件, 耗时: {processing_time:.2f}秒")
+    return BatchResponse(results=[BatchItemResponse(**item) for item in results], processing_time=processing_time)
+
+@app.post("/jobs", response_model=JobSubmitResponse, status_code=202, openapi_extra=UPLOAD_FORM_SCHEMA)
+async def create_job(request: Request, response: Response):
+    """提交异步转录任务，立即返回任务ID（表单字段同 /transcribe，缓存命中时任务直接完成）"""
+    job = await _submit_transcription(request)
+    response.headers[CACHE_HEADER] = "hit" if job.cached else "miss"
+    return JobSubmitResponse(job_id=job.id, status=job.status)
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    """查询转录任务状态和结果（包括共享状态后端中其他工作进程的任务）"""
+    status = await run_in_threadpool(job_manager.get_status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return JobStatusResponse(**status)
+
+def _sse_event(event: Dict[str, Any]) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
 
-    validation_result = sandbox_manager.validate_request(
-        api_key=request.api_key,
-        input_text=request.text
+async def _remote_job_events(job_id: str, request: Request):
+    """其他工作进程执行的任务：轮询共享状态快照，只能推送阶段变化和结束事件"""
+    event_id = 0
+    stage = None
+    while True:
+        status = await run_in_threadpool(job_manager.get_status, job_id)
+        if status is None:
+            return
+        if status["stage"] != stage:
+            stage = status["stage"]
+            event_id += 1
+            yield _sse_event({"id": event_id, "type": EVENT_STAGE, "time": time.time(), "level": "info",
+                              "message": "", "stage": stage})
+        if status["status"] in (JOB_COMPLETED, JOB_FAILED):
+            event_id += 1
+            yield _sse_event({"id": event_id, "type": EVENT_DONE, "time": time.time(),
+                              "level": "error" if status["error"] else "info", "message": status["error"] or "",
+                              "status": status["status"]})
+            return
+        if await request.is_disconnected():
+            return
+        await asyncio.sleep(SSE_POLL_INTERVAL)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """以SSE推送任务的阶段变化、日志和转录进度，支持 Last-Event-ID 断线续传"""
+    job = job_manager.get(job_id)
+    if job is None:
+        if await run_in_threadpool(job_manager.get_status, job_id) is None:
+            raise HTTPException(status_code=404, detail="任务不存在")
+        return StreamingResponse(
+            _remote_job_events(job_id, request),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    try:
+        last_id = int(request.headers.get("last-event-id", "0"))
+    except ValueError:
+        last_id = 0
+    
+    async def event_stream():
+        nonlocal last_id
+        while True:
+            for event in job.events_since(last_id):
+                last_id = event["id"]
+                yield _sse_event(event)
+                if event["type"] == EVENT_DONE:
+                    return
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(SSE_POLL_INTERVAL)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
+
+@app.get("/health")
+async def health():
+    """存活检查：进程能响应即为健康，同时报告模型和队列状态"""
+    return {
+        "status": "ok",
+        **model_status,
+        "startup_seconds": startup_timings,
+        "queue_depth": job_manager.queue_depth,
+        "in_flight": job_manager.in_flight,
+    }
+
+@app.get("/ready")
+async def ready(response: Response):
+    """就绪检查：默认模型加载并预热完成前返回503"""
+    is_ready = model_status["loaded"] and model_status["warmed"]
+    if not is_ready:
+        response.status_code = 503
+    return {"ready": is_ready, **model_status, "startup_seconds": startup_timings}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 指标"""
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+@lru_cache(maxsize=None)
+def _llm_semaphore() -> asyncio.Semaphore:
+    """限制同时进行的LLM调用数（SandboxConfig.max_concurrent_requests），超出的请求排队等待"""
+    return asyncio.Semaphore(sandbox_manager.config.max_concurrent_requests)
+
+# 各提供商使用的模型，同时作为LLM结果缓存键的一部分
+LLM_MODELS = {
+    "openai": "gpt-3.5-turbo",
+    "anthropic": "claude-3-sonnet-20240229",
+    "google": "models/gemini-pro",
+}
+
+# 长文本分块后每个请求同时进行的分块调用数（总并发仍受 _llm_semaphore 限制）
+LLM_CHUNK_CONCURRENCY = int(os.getenv("LLM_CHUNK_CONCURRENCY", "4"))
+# summarize 合并各块摘要时，摘要仍超长则继续分块总结的最大轮数
+LLM_MAX_REDUCE_ROUNDS = 3
+# 合并分块摘要使用的内部风格
+REDUCE_STYLE = "summarize_reduce"
+
+def _build_prompt(request: LLMRequest) -> str:
+    """按润色风格构建提示词"""
+    if request.style == "polish":
+        return f"请润色以下文本，使其更加流畅自然：\n\n{request.text}"
+    elif request.style == "summarize":
+        return f"请总结以下文本的主要内容：\n\n{request.text}"
+    elif request.style == REDUCE_STYLE:
+        return f"以下是一篇长文本各部分的摘要，请将它们合并成一份完整连贯的总结：\n\n{request.text}"
+    elif request.style == "translate":
+        return f"请将以下文本翻译成{request.target_language}：\n\n{request.text}"
+    else:
+        return f"请处理以下文本：\n\n{request.text}"
+
+async def _collect_stream(tokens: AsyncIterator[str], on_token: Callable[[str], None],
+                          provider: str, llm_start: float) -> str:
+    """转发流式调用的增量文本，返回完整结果"""
+    parts = []
+    async for token in tokens:
+        if not parts:
+            llm_first_token_seconds.observe(time.time() - llm_start, provider=provider)
+        parts.append(token)
+        on_token(token)
+    return "".join(parts)
+
+async def _call_llm(request: LLMRequest, on_token: Optional[Callable[[str], None]] = None) -> str:
+    """调用一次提供商API，占用一个LLM并发名额，超时和失败转换为HTTP错误；
+    传入 on_token 时使用流式接口，每收到一段文本就回调一次"""
+    providers = {
+        "openai": _call_openai_api,
+        "anthropic": _call_anthropic_api,
+        "google": _call_google_api,
+    }
+    stream_providers = {
+        "openai": _stream_openai_api,
+        "anthropic": _stream_anthropic_api,
+        "google": _stream_google_api,
+    }
+    timeout = sandbox_manager.config.max_execution_time_seconds
+    async with _llm_semaphore():
+        llm_start = time.time()
+        if on_token is None:
+            call = providers[request.provider](request)
+        else:
+            call = _collect_stream(stream_providers[request.provider](request), on_token, request.provider, llm_start)
+        try:
+            text = await asyncio.wait_for(call, timeout=timeout)
+        except asyncio.TimeoutError:
+            llm_request_seconds.observe(time.time() - llm_start, provider=request.provider, status="timeout")
+            logger.error(f"LLM润色超时: {timeout}秒")
+            raise HTTPException(status_code=504, detail=f"LLM润色超时（{timeout}秒）")
+        except Exception as e:
+            llm_request_seconds.observe(time.time() - llm_start, provider=request.provider, status="error")
+            logger.error(f"LLM润色失败: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"LLM润色失败: {str(e)}")
+    llm_request_seconds.observe(time.time() - llm_start, provider=request.provider, status="ok")
+    return text
+
+async def _map_chunks(request: LLMRequest, chunks: List[str]) -> List[str]:
+    """并发处理各块，结果与输入顺序一致；任一块失败时取消其余的块"""
+    limit = asyncio.Semaphore(LLM_CHUNK_CONCURRENCY)
+
+    async def run(chunk: str) -> str:
+        async with limit:
+            return await _call_llm(request.model_copy(update={"text": chunk}))
+
+    tasks = [asyncio.ensure_future(run(chunk)) for chunk in chunks]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+async def _summarize_chunks(request: LLMRequest, chunks: List[str], max_chars: int) -> str:
+    """summarize 的 map 阶段：总结各块，合并后的摘要仍超长时继续分块总结"""
+    combined = "\n\n".join(await _map_chunks(request, chunks))
+    for _ in range(LLM_MAX_REDUCE_ROUNDS):
+        if len(combined) <= max_chars:
+            break
+        combined = "\n\n".join(await _map_chunks(request.model_copy(update={"style": REDUCE_STYLE}),
+                                                   split_text(combined, max_chars)))
+    return combined
+
+async def _map_reduce(request: LLMRequest, max_chars: int) -> str:
+    """超长文本：分块并发处理，summarize 再合并各块摘要，其余风格按顺序拼接"""
+    chunks = split_text(request.text, max_chars)
+    logger.info(f"LLM输入超长（{len(request.text)}字符），分为 {len(chunks)} 块处理")
+    if request.style != "summarize":
+        return "\n".join(await _map_chunks(request, chunks))
+    combined = await _summarize_chunks(request, chunks, max_chars)
+    return await _call_llm(request.model_copy(update={"text": combined, "style": REDUCE_STYLE}))
+
+async def _stream_chunks(request: LLMRequest, chunks: List[str]) -> AsyncIterator[str]:
+    """并发流式处理各块并按顺序输出：当前块的文本实时转发，后面的块先缓冲，轮到时再输出"""
+    limit = asyncio.Semaphore(LLM_CHUNK_CONCURRENCY)
+    queues = [asyncio.Queue() for _ in chunks]
+
+    async def run(chunk: str, queue: asyncio.Queue):
+        try:
+            async with limit:
+                await _call_llm(request.model_copy(update={"text": chunk}), on_token=queue.put_nowait)
+            queue.put_nowait(None)
+        except Exception as e:
+            queue.put_nowait(e)
+
+    tasks = [asyncio.ensure_future(run(chunk, queue)) for chunk, queue in zip(chunks, queues)]
+    try:
+        for index, queue in enumerate(queues):
+            if index:
+                yield "\n"
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _stream_polish(request: LLMRequest, max_chars: int) -> AsyncIterator[str]:
+    """流式润色：超长的 summarize 先非流式总结各块，只流式输出最后的合并步骤"""
+    chunks = split_text(request.text, max_chars)
+    if len(chunks) > 1:
+        logger.info(f"LLM输入超长（{len(request.text)}字符），分为 {len(chunks)} 块处理")
+        if request.style == "summarize":
+            combined = await _summarize_chunks(request, chunks, max_chars)
+            request = request.model_copy(update={"text": combined, "style": REDUCE_STYLE})
+            chunks = [combined]
+    async for token in _stream_chunks(request, chunks):
+        yield token
+
+def _validate_chunks(api_key: str, chunks: List[str]) -> dict:
+    """逐块做沙箱校验（长度上限针对单次调用），合并错误信息"""
+    errors = []
+    for chunk in chunks:
+        for error in sandbox_manager.validate_request(api_key=api_key, input_text=chunk)["errors"]:
+            if error not in errors:
+                errors.append(error)
+    return {"valid": not errors, "errors": errors}
+
+async def _prepare_polish(request: LLMRequest):
+    """润色前的公共步骤：检查提供商、沙箱校验、查询结果缓存
+
+    返回 (校验结果, 缓存键, 缓存命中的结果)
+    """
+    logger.info(f"收到LLM润色请求: provider={request.provider}, style={request.style}, base_url={request.base_url}")
+    if request.provider not in LLM_MODELS:
+        raise HTTPException(status_code=400, detail="不支持的LLM提供商")
+
+    max_chars = sandbox_manager.config.max_input_length
+    chunks = split_text(request.text, max_chars)
+    # 每块都是一次LLM调用，在调用提供商之前拒绝块数过多的输入
+    max_chunks = sandbox_manager.config.max_chunks
+    if 0 < max_chunks < len(chunks):
+        raise HTTPException(
+            status_code=413,
+            detail=f"输入文本过长: {len(request.text)} 字符，超过 {max_chunks * max_chars} 字符上限"
+        )
+    validation_result = _validate_chunks(request.api_key, chunks)
     if not validation_result["valid"]:
         logger.warning(f"沙箱校验警告: {validation_result['errors']}")
 
-    try:
-        if request.provider == "openai":
-            polished_text = _call_openai_api(request)
-        elif request.provider == "anthropic":
-            polished_text = _call_anthropic_api(request)
-        elif request.provider == "google":
-            polished_text = _call_google_api(request)
-        else:
-            raise HTTPException(status_code=400, detail="不支持的LLM提供商")
+    if llm_cache is None:
+        return validation_result, None, None
+    cache_key = make_llm_cache_key(
+        request.provider, LLM_MODELS[request.provider], request.style,
+        request.target_language, request.text, request.base_url
+    )
+    # 本地SQLite或共享状态后端的读取不在事件循环中执行
+    cached_text = await run_in_threadpool(llm_cache.get, cache_key)
+    if cached_text is not None:
+        logger.info(f"LLM结果缓存命中: provider={request.provider}, style={request.style}")
+    return validation_result, cache_key, cached_text
 
-        processing_time = time.time() - start_time
+def _audit_polish(request: LLMRequest, request_id: str, start_time: float, status: str = "success",
+                  polished_text: Optional[str] = None, cached: bool = False, error: Optional[str] = None):
+    """记录一次润色请求的审计日志（只入队，不等待写盘）"""
+    sandbox_manager.log_request({
+        "request_id": request_id,
+        "provider": request.provider,
+        "input": request.text,
+        "api_key": request.api_key,
+        "style": request.style,
+        "base_url": request.base_url,
+        "status": status,
+        "output_length": len(polished_text) if polished_text is not None else None,
+        "duration_ms": round((time.time() - start_time) * 1000, 1),
+        "cached": cached,
+        "error": error
+    })
 
-        sandbox_manager.log_request({
-            "provider": request.provider,
-            "input": request.text,
-            "api_key": request.api_key,
-            "style": request.style,
-            "base_url": request.base_url
-        })
+async def _finish_polish(request: LLMRequest, request_id: str, start_time: float,
+                         cache_key: Optional[str], polished_text: str, cached: bool = False):
+    """润色完成后写入结果缓存并记录审计日志"""
+    if cache_key is not None and not cached:
+        await run_in_threadpool(llm_cache.put, cache_key, polished_text)
+    _audit_polish(request, request_id, start_time, polished_text=polished_text, cached=cached)
 
-        logger.info(f"LLM润色完成，耗时: {processing_time:.2f}秒")
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
+    """超出限流返回429，Retry-After 为建议的等待秒数"""
+    llm_rate_limited_total.inc()
+    logger.warning(f"请求被限流: {str(exc)}，{exc.retry_after:.1f}秒后重试")
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
 
+@app.post("/polish", response_model=LLMResponse)
+async def polish_text(request: LLMRequest, response: Response):
+    """LLM润色接口：异步调用提供商API，并发数和单次调用超时由沙箱配置决定；
+    超过 max_input_length 的文本分块并发处理，超出限流时返回429"""
+    request_id = uuid.uuid4().hex
+    response.headers[REQUEST_ID_HEADER] = request_id
+    async with sandbox_manager.track_request_async(request.api_key):
+        start_time = time.time()
+        try:
+            return await _polish(request, request_id, start_time)
+        except HTTPException as e:
+            _audit_polish(request, request_id, start_time, status="failed", error=str(e.detail))
+            raise
+
+async def _polish(request: LLMRequest, request_id: str, start_time: float) -> LLMResponse:
+    validation_result, cache_key, cached_text = await _prepare_polish(request)
+    if cached_text is not None:
+        await _finish_polish(request, request_id, start_time, cache_key, cached_text, cached=True)
         return LLMResponse(
             original_text=request.text,
-            polished_text=polished_text,
+            polished_text=cached_text,
             provider=request.provider,
             style=request.style,
-            processing_time=processing_time,
-            sandbox_validation=validation_result
+            processing_time=time.time() - start_time,
+            sandbox_validation=validation_result,
+            cached=True
         )
 
-    except Exception as e:
-        logger.error(f"LLM润色失败: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"LLM润色失败: {str(e)}")
+    max_chars = sandbox_manager.config.max_input_length
+    if len(request.text) > max_chars:
+        polished_text = await _map_reduce(request, max_chars)
+    else:
+        polished_text = await _call_llm(request)
+    await _finish_polish(request, request_id, start_time, cache_key, polished_text)
 
-def _call_openai_api(request: LLMRequest) -> str:
-    from openai import OpenAI
+    processing_time = time.time() - start_time
+    logger.info(f"LLM润色完成，耗时: {processing_time:.2f}秒")
 
-    client = OpenAI(
-        api_key=request.api_key,
-        base_url=request.base_url if request.base_url else None
+    return LLMResponse(
+        original_text=request.text,
+        polished_text=polished_text,
+        provider=request.provider,
+        style=request.style,
+        processing_time=processing_time,
+        sandbox_validation=validation_result
     )
 
+class _ClosingStreamingResponse(StreamingResponse):
+    """响应发送结束、出错或被取消时都会调用 on_close 一次
+
+    生成器的 finally 只有在开始迭代后才会执行，客户端在推送开始前断开时不可靠。
+    """
+
+    def __init__(self, content, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._on_close()
+
+def _sse(event_type: str, data: dict) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/polish/stream")
+async def polish_text_stream(request: LLMRequest):
+    """流式LLM润色：以SSE转发提供商生成的文本
+
+    事件: token {"text": 增量文本}；done 为完整的 LLMResponse；error {"status", "detail"}。
+    提供商和沙箱校验的错误在开始推送前以普通HTTP错误返回。
+    """
+    start_time = time.time()
+    request_id = uuid.uuid4().hex
+    await sandbox_manager.acquire_async(request.api_key)
     try:
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "你是一个有用的助手。"},
-                {"role": "user", "content": request.text}
-            ]
+        validation_result, cache_key, cached_text = await _prepare_polish(request)
+    except BaseException as e:
+        sandbox_manager.release()
+        if isinstance(e, HTTPException):
+            _audit_polish(request, request_id, start_time, status="failed", error=str(e.detail))
+        raise
+    max_chars = sandbox_manager.config.max_input_length
+    finished = False
+
+    def on_close():
+        # 响应结束（包括推送开始前客户端就已断开、生成器从未执行）时释放进行中的请求名额
+        sandbox_manager.release()
+        if not finished:
+            _audit_polish(request, request_id, start_time, status="cancelled")
+
+    async def event_stream():
+        nonlocal finished
+        if cached_text is not None:
+            polished_text = cached_text
+            yield _sse("token", {"text": cached_text})
+        else:
+            parts = []
+            try:
+                async for token in _stream_polish(request, max_chars):
+                    parts.append(token)
+                    yield _sse("token", {"text": token})
+            except HTTPException as e:
+                finished = True
+                _audit_polish(request, request_id, start_time, status="failed", error=str(e.detail))
+                yield _sse("error", {"status": e.status_code, "detail": e.detail})
+                return
+            polished_text = "".join(parts)
+        finished = True
+        await _finish_polish(request, request_id, start_time, cache_key, polished_text, cached=cached_text is not None)
+
+        processing_time = time.time() - start_time
+        logger.info(f"LLM流式润色完成，耗时: {processing_time:.2f}秒")
+        response = LLMResponse(
+            original_text=request.text,
+            polished_text=polished_text,
+            provider=request.provider,
+            style=request.style,
+            processing_time=processing_time,
+            sandbox_validation=validation_result,
+            cached=cached_text is not None
         )
-        return completion.choices[0].message.content
-    except Exception as e:
-        logger.error(f"OpenAI API调用失败: {str(e)}")
-        raise Exception(f"OpenAI API错误: {str(e)}")
+        yield _sse("done", response.model_dump())
+
+    return _ClosingStreamingResponse(
+        event_stream(),
+        on_close=on_close,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", REQUEST_ID_HEADER: request_id}
+    )
+
+async def _call_openai_api(request: LLMRequest) -> str:
+    """调用OpenAI API"""
+    prompt = _build_prompt(request)
+
+    with llm_client_pool.lease("openai", request.api_key, request.base_url) as client:
+        try:
+            completion = await client.chat.completions.create(
+                model=LLM_MODELS["openai"],
+                messages=[
+                    {"role": "system", "content": "你是一个有用的助手。"},
+                    {"role": "user", "content": prompt}
+                ]
+            )
+            return completion.choices[0].message.content
+        except Exception as e:
+            logger.error(f"OpenAI API调用失败: {str(e)}")
+            raise Exception(f"OpenAI API错误: {str(e)}")
 
 async def _call_anthropic_api(request: LLMRequest) -> str:
     """调用Anthropic API"""
-    import anthropic
+    prompt = _build_prompt(request)
     
-    client = anthropic.Anthropic(api_key=request.api_key)
-    
-    # 构建提示词
-    if request.style == "polish":
-        prompt = f"请润色以下文本，使其更加流畅自然：\n\n{request.text}"
-    elif request.style == "summarize":
-        prompt = f"请总结以下文本的主要内容：\n\n{request.text}"
-    elif request.style == "translate":
-        prompt = f"请将以下文本翻译成{request.target_language}：\n\n{request.text}"
-    else:
-        prompt = f"请处理以下文本：\n\n{request.text}"
-    
-    try:
-        response = await client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=2000,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
+    with llm_client_pool.lease("anthropic", request.api_key, request.base_url) as client:
+        try:
+            response = await client.messages.create(
+                model=LLM_MODELS["anthropic"],
+                max_tokens=2000,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            )
         
-        return response.content[0].text.strip()
+            return response.content[0].text.strip()
         
-    except Exception as e:
-        logger.error(f"Anthropic API调用失败: {str(e)}")
-        raise Exception(f"Anthropic API错误: {str(e)}")
+        except Exception as e:
+            logger.error(f"Anthropic API调用失败: {str(e)}")
+            raise Exception(f"Anthropic API错误: {str(e)}")
 
 async def _call_google_api(request: LLMRequest) -> str:
     """调用Google AI API"""
-    import google.generativeai as genai
-    
-    genai.configure(api_key=request.api_key)
-    model = genai.GenerativeModel('gemini-pro')
+    from google.ai import generativelanguage as glm
     
-    # 构建提示词
-    if request.style == "polish":
-        prompt = f"请润色以下文本，使其更加流畅自然：\n\n{request.text}"
-    elif request.style == "summarize":
-        prompt = f"请总结以下文本的主要内容：\n\n{request.text}"
-    elif request.style == "translate":
-        prompt = f"请将以下文本翻译成{request.target_language}：\n\n{request.text}"
-    else:
-        prompt = f"请处理以下文本：\n\n{request.text}"
+    prompt = _build_prompt(request)
     
-    try:
-        response = await model.generate_content_async(prompt)
-        return response.text.strip()
+    with llm_client_pool.lease("google", request.api_key, request.base_url) as client:
+        try:
+            response = await client.generate_content(
+                model=LLM_MODELS["google"],
+                contents=[glm.Content(parts=[glm.Part(text=prompt)])]
+            )
+            return response.candidates[0].content.parts[0].text.strip()
         
-    except Exception as e:
-        logger.error(f"Google AI API调用失败: {str(e)}")
-        raise Exception(f"Google AI API错误: {str(e)}")
+        except Exception as e:
+            logger.error(f"Google AI API调用失败: {str(e)}")
+            raise Exception(f"Google AI API错误: {str(e)}")
+
+async def _stream_openai_api(request: LLMRequest) -> AsyncIterator[str]:
+    """流式调用OpenAI API"""
+    prompt = _build_prompt(request)
+
+    with llm_client_pool.lease("openai", request.api_key, request.base_url) as client:
+        try:
+            stream = await client.chat.completions.create(
+                model=LLM_MODELS["openai"],
+                messages=[
+                    {"role": "system", "content": "你是一个有用的助手。"},
+                    {"role": "user", "content": prompt}
+                ],
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            logger.error(f"OpenAI API调用失败: {str(e)}")
+            raise Exception(f"OpenAI API错误: {str(e)}")
+
+async def _stream_anthropic_api(request: LLMRequest) -> AsyncIterator[str]:
+    """流式调用Anthropic API"""
+    prompt = _build_prompt(request)
+
+    with llm_client_pool.lease("anthropic", request.api_key, request.base_url) as client:
+        try:
+            async with client.messages.stream(
+                model=LLM_MODELS["anthropic"],
+                max_tokens=2000,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ]
+            ) as stream:
+                async for text in stream.text_stream:
+                    yield text
+        except Exception as e:
+            logger.error(f"Anthropic API调用失败: {str(e)}")
+            raise Exception(f"Anthropic API错误: {str(e)}")
+
+async def _stream_google_api(request: LLMRequest) -> AsyncIterator[str]:
+    """流式调用Google AI API"""
+    from google.ai import generativelanguage as glm
+
+    prompt = _build_prompt(request)
+
+    with llm_client_pool.lease("google", request.api_key, request.base_url) as client:
+        try:
+            stream = await client.stream_generate_content(
+                model=LLM_MODELS["google"],
+                contents=[glm.Content(parts=[glm.Part(text=prompt)])]
+            )
+            async for response in stream:
+                for candidate in response.candidates[:1]:
+                    for part in candidate.content.parts:
+                        if part.text:
+                            yield part.text
+        except Exception as e:
+            logger.error(f"Google AI API调用失败: {str(e)}")
+            raise Exception(f"Google AI API错误: {str(e)}")
+
+startup_timings["import"] = time.time() - _IMPORT_START
+logger.info(f"应用模块导入完成，耗时: {startup_timings['import']:.2f}秒")
 
 if __name__ == "__main__":
     import uvicorn
@@ -4,9 +4,59 @@
 """
 
 import os
-from typing import Dict, List, Any
+import asyncio
+from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
+from contextlib import asynccontextmanager, contextmanager
 import re
+import uuid
+import threading
+from datetime import datetime, timezone
+
+from core.audit_log import AuditLogWriter, audit_log
+from core.rate_limit import RateLimiter, RateLimitExceeded
+from core.state_backend import state_backend
+
+# 进行中的请求数达到上限时建议的重试等待秒数
+IN_FLIGHT_RETRY_AFTER = 1.0
+
+# 匹配敏感关键词时忽略的空白和标点
+SEPARATOR_CLASS = r"[\s\-，。,.、:：;；_~!@#$%^&*()\[\]{}|\\'\"<>?/]"
+# 常见敏感信息模式（如信用卡号、身份证号等），合并成一个以 \d{3} 开头的正则：
+#   \d{16}（信用卡）、\d{15,18}[xX]?（身份证）都等价于出现15位以上连续数字，
+#   \d{3,4}[- ]?\d{4}[- ]?\d{4}[- ]?\d{4}（信用卡分段）
+PII_PATTERN = re.compile(r"\d{3}(?:\d?[- ]?\d{4}[- ]?\d{4}[- ]?\d{4}|\d{12,15})")
+
+
+def _keyword_trie_pattern(node: Dict[str, Any]) -> str:
+    """把关键词前缀树转成正则，相邻字符之间允许任意分隔符；
+    较短的关键词已能命中时，以它为前缀的较长关键词不再展开"""
+    alternatives = []
+    for char, child in sorted(node.items()):
+        if "" in child:
+            alternatives.append(re.escape(char))
+        else:
+            alternatives.append(re.escape(char) + SEPARATOR_CLASS + "*" + _keyword_trie_pattern(child))
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return "(?:" + "|".join(alternatives) + ")"
+
+
+def compile_content_filter(blocked_keywords: List[str]) -> Optional["re.Pattern"]:
+    """把敏感关键词编译成一个前缀树正则，在小写文本上一次扫描即可检查所有关键词；
+    没有关键词时返回None"""
+    trie: Dict[str, Any] = {}
+    for keyword in blocked_keywords:
+        keyword_clean = re.sub(SEPARATOR_CLASS + "+", "", keyword.lower())
+        if not keyword_clean:
+            continue
+        node = trie
+        for char in keyword_clean:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    if not trie:
+        return None
+    return re.compile(_keyword_trie_pattern(trie))
 
 @dataclass
 class SandboxConfig:
@@ -14,8 +64,10 @@ class SandboxConfig:
     
     # 网络访问限制
     allowed_domains: List[str] = None
-    max_requests_per_minute: int = 60
+    max_requests_per_minute: int = 60  # 每个API密钥
+    max_global_requests_per_minute: int = 600  # 所有API密钥合计，0表示不限制
     max_concurrent_requests: int = 5
+    max_in_flight_requests: int = 50  # 进行中（含排队）的请求数上限，0表示不限制
     
     # 资源限制
     max_memory_mb: int = 512
@@ -31,6 +83,7 @@ class SandboxConfig:
     blocked_keywords: List[str] = None
     max_input_length: int = 4000
     max_output_length: int = 2000
+    max_chunks: int = 20  # 超长输入按 max_input_length 分块后的块数上限，0表示不限制
     
     # 审计日志
     audit_logging_enabled: bool = True
@@ -55,10 +108,67 @@ class SandboxConfig:
 class SandboxManager:
     """沙箱管理器"""
     
-    def __init__(self, config: SandboxConfig):
+    def __init__(self, config: SandboxConfig, audit_writer: Optional[AuditLogWriter] = None):
         self.config = config
+        self.audit_writer = audit_writer or audit_log
         self.request_count = 0
         self.active_requests = 0
+        # 共享状态后端下各工作进程共用限额，进行中请求数仍按进程统计
+        self.rate_limiter = RateLimiter(config.max_requests_per_minute, config.max_global_requests_per_minute,
+                                        backend=state_backend if state_backend.shared else None)
+        self._lock = threading.Lock()
+        # (关键词, 编译后的过滤正则)，关键词列表变化时重新编译
+        self._content_filter = None
+        
+    def acquire(self, api_key: str):
+        """登记一个进行中的请求，超出进行中请求数或每分钟请求数限制时抛出 RateLimitExceeded
+
+        先占用进行中的名额再检查限流，限流检查（可能访问共享状态后端）不在锁内进行。
+        """
+        with self._lock:
+            if 0 < self.config.max_in_flight_requests <= self.active_requests:
+                raise RateLimitExceeded("进行中的请求过多", IN_FLIGHT_RETRY_AFTER)
+            self.active_requests += 1
+        try:
+            wait = self.rate_limiter.acquire(self._hash_api_key(api_key))
+        except BaseException:
+            self.release()
+            raise
+        if wait > 0:
+            self.release()
+            raise RateLimitExceeded("超出每分钟请求数限制", wait)
+        with self._lock:
+            self.request_count += 1
+
+    async def acquire_async(self, api_key: str):
+        """在事件循环中调用的 acquire：使用共享状态后端时限流检查放到线程池执行"""
+        if self.rate_limiter.backend is None:
+            self.acquire(api_key)
+        else:
+            await asyncio.to_thread(self.acquire, api_key)
+    
+    def release(self):
+        """请求结束，与 acquire 成对调用"""
+        with self._lock:
+            self.active_requests -= 1
+    
+    @contextmanager
+    def track_request(self, api_key: str):
+        """在 with 块内把请求计入进行中的请求"""
+        self.acquire(api_key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def track_request_async(self, api_key: str):
+        """track_request 的异步版本，见 acquire_async"""
+        await self.acquire_async(api_key)
+        try:
+            yield
+        finally:
+            self.release()
         
     def validate_request(self, api_key: str, input_text: str) -> Dict[str, Any]:
         """验证请求是否安全"""
@@ -99,48 +209,49 @@ class SandboxManager:
         if len(text) > self.config.max_input_length:
             return False
         
-        # 预处理：去除空格和常见标点
-        text_clean = re.sub(r"[\s\-，。,.、:：;；_~!@#$%^&*()\[\]{}|\\'\"<>?/]+", "", text.lower())
-        # 检查敏感关键词（支持中英文、数字混合，忽略大小写和空格）
-        for keyword in self.config.blocked_keywords:
-            keyword_clean = re.sub(r"[\s\-，。,.、:：;；_~!@#$%^&*()\[\]{}|\\'\"<>?/]+", "", keyword.lower())
-            if keyword_clean in text_clean:
-                return False
-        # 针对常见敏感信息模式（如信用卡号、身份证号等）
-        patterns = [
-            r"\d{16}",  # 16位数字（信用卡）
-            r"\d{15,18}[xX]?",  # 15-18位身份证
-            r"\d{3,4}[- ]?\d{4}[- ]?\d{4}[- ]?\d{4}"  # 信用卡分段
-        ]
-        for pat in patterns:
-            if re.search(pat, text):
-                return False
-        return True
+        # 检查敏感关键词（支持中英文、数字混合，忽略大小写和分隔符）
+        keyword_pattern = self._keyword_pattern()
+        if keyword_pattern is not None and keyword_pattern.search(text.lower()):
+            return False
+        return PII_PATTERN.search(text) is None
+    
+    def _keyword_pattern(self) -> Optional["re.Pattern"]:
+        """返回当前关键词列表对应的过滤正则（编译结果缓存）"""
+        keywords = tuple(self.config.blocked_keywords)
+        cached = self._content_filter
+        if cached is None or cached[0] != keywords:
+            cached = self._content_filter = (keywords, compile_content_filter(list(keywords)))
+        return cached[1]
     
     def _check_resource_limits(self) -> bool:
         """检查资源限制"""
-        if self.active_requests >= self.config.max_concurrent_requests:
+        # 进行中的请求（含当前请求）超过并发上限时，多出的请求需要排队
+        if self.active_requests > self.config.max_concurrent_requests:
             return False
         
         # 这里可以添加更复杂的资源检查逻辑
         return True
     
     def log_request(self, request_data: Dict[str, Any]):
-        """记录请求日志"""
+        """记录请求审计日志：只放入写入队列，由后台线程写文件，不阻塞请求"""
         if self.config.audit_logging_enabled:
             # 记录请求信息（不包含敏感数据）
             log_entry = {
-                "timestamp": "2024-01-01T00:00:00Z",
-                "request_id": "req_123",
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                "request_id": request_data.get("request_id") or uuid.uuid4().hex,
                 "api_provider": request_data.get("provider"),
+                "style": request_data.get("style"),
                 "input_length": len(request_data.get("input", "")),
-                "status": "success"
+                "status": request_data.get("status", "success")
             }
+            for key in ("output_length", "duration_ms", "cached", "error"):
+                if request_data.get(key) is not None:
+                    log_entry[key] = request_data[key]
             
             if self.config.log_sensitive_data:
                 log_entry["api_key_hash"] = self._hash_api_key(request_data.get("api_key", ""))
             
-            print(f"沙箱审计日志: {log_entry}")
+            self.audit_writer.write(log_entry)
     
     def _hash_api_key(self, api_key: str) -> str:
         """对API密钥进行哈希处理"""
@@ -0,0 +1,168 @@
+"""
+审计日志
+请求路径只把记录放入有界内存队列，由后台线程批量序列化为JSONL写入文件，按大小轮转；
+队列满时按配置丢弃记录或限时阻塞等待
+"""
+
+import os
+import sys
+import json
+import queue
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 队列满时的处理策略
+OVERFLOW_DROP = "drop"    # 立即丢弃，请求路径不等待
+OVERFLOW_BLOCK = "block"  # 最多等待 block_timeout 秒，仍然满则丢弃
+
+# 写入标准输出而不是文件
+STDOUT_PATH = "-"
+
+_STOP = object()
+
+
+class AuditLogWriter:
+    """缓冲的JSONL审计日志写入器
+
+    write() 只做一次入队；后台线程每次取出队列中已有的记录（最多 batch_size 条）一起写入并刷新。
+    文件超过 max_bytes 时轮转为 path.1 ... path.{backup_count}。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 5,
+                 queue_size: int = 10000, overflow: str = OVERFLOW_DROP, block_timeout: float = 1.0,
+                 batch_size: int = 256):
+        if overflow not in (OVERFLOW_DROP, OVERFLOW_BLOCK):
+            raise ValueError(f"不支持的审计日志溢出策略: {overflow}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.written = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._stream = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def write(self, record: Dict[str, Any]) -> bool:
+        """提交一条记录，返回是否入队（入队后记录不应再被修改）"""
+        self._ensure_started()
+        try:
+            if self.overflow == OVERFLOW_BLOCK:
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self._count_dropped(1)
+            return False
+
+    def flush(self):
+        """等待已入队的记录全部写出"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """写出剩余记录并停止后台线程"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                self._thread.start()
+
+    def _count_dropped(self, count: int):
+        with self._lock:
+            self.dropped += count
+            dropped = self.dropped
+        # 只在第一次和之后每1000条时告警，避免日志本身刷屏
+        if dropped == count or dropped // 1000 != (dropped - count) // 1000:
+            logger.warning(f"审计日志队列已满或写入失败，累计丢弃 {dropped} 条记录")
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(record is _STOP for record in batch)
+            records = [record for record in batch if record is not _STOP]
+            try:
+                if records:
+                    self._write_batch(records)
+            except Exception as e:
+                logger.error(f"写入审计日志失败: {str(e)}")
+                self._count_dropped(len(records))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                self._close_stream()
+                return
+
+    def _write_batch(self, records: List[Dict[str, Any]]):
+        data = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        if self.path == STDOUT_PATH:
+            sys.stdout.write(data)
+            sys.stdout.flush()
+        else:
+            encoded = data.encode("utf-8")
+            stream = self._open_stream()
+            if self.max_bytes > 0 and 0 < stream.tell() and stream.tell() + len(encoded) > self.max_bytes:
+                self._rotate()
+                stream = self._open_stream()
+            stream.write(encoded)
+            stream.flush()
+        with self._lock:
+            self.written += len(records)
+
+    def _open_stream(self):
+        if self._stream is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._stream = open(self.path, "ab")
+        return self._stream
+
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def _rotate(self):
+        self._close_stream()
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+# 默认审计日志，AUDIT_LOG_PATH 为 "-" 时写入标准输出
+audit_log = AuditLogWriter(
+    path=os.getenv("AUDIT_LOG_PATH", "/tmp/audit/llm_audit.jsonl"),
+    max_bytes=int(os.getenv("AUDIT_LOG_MAX_MB", "50")) * 1024 * 1024,
+    backup_count=int(os.getenv("AUDIT_LOG_BACKUPS", "5")),
+    queue_size=int(os.getenv("AUDIT_LOG_QUEUE_SIZE", "10000")),
+    overflow=os.getenv("AUDIT_LOG_OVERFLOW", OVERFLOW_DROP),
+)
@@ -0,0 +1,193 @@
+"""
+批量上传处理
+把批量请求中的多个视频文件或zip压缩包解出到同一个临时目录，逐个校验类型和大小并计算内容哈希；
+上传的文件part可以边接收边写入临时目录（见 BatchStager.begin），不必先由框架整体缓冲
+"""
+
+import hashlib
+import logging
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, List, Optional
+
+logger = logging.getLogger(__name__)
+
+VIDEO_SUFFIXES = {
+    ".mp4", ".m4v", ".mov", ".avi", ".mkv", ".webm", ".flv",
+    ".ts", ".mts", ".m2ts", ".mpg", ".mpeg", ".ogv", ".3gp", ".wmv",
+}
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed", "application/x-zip"}
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class BatchLimitError(ValueError):
+    """批量请求超过文件数或总大小限制"""
+
+
+@dataclass
+class BatchItem:
+    """批量中的单个文件：校验通过时 path 有值，否则 error 说明原因"""
+
+    filename: str
+    path: Optional[Path] = None
+    sha256: str = ""
+    size: int = 0
+    error: Optional[str] = None
+
+
+def is_zip(filename: str, content_type: str) -> bool:
+    return content_type in ZIP_CONTENT_TYPES or Path(filename).suffix.lower() == ".zip"
+
+
+class BatchStager:
+    """把上传文件暂存到 work_dir
+
+    单个文件超过 max_file_bytes 时只记录该文件的错误；文件数或总大小超过限制时
+    抛出 BatchLimitError（zip中声明的大小不可信，以实际解压字节数为准）。
+    流式接收的zip在展开完成前压缩包本身也占用磁盘，其大小同样计入总大小。
+    """
+
+    def __init__(self, work_dir: Path, max_file_bytes: int, max_total_bytes: int, max_files: int):
+        self.work_dir = Path(work_dir)
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self.max_files = max_files
+        self.total_bytes = 0
+        self.count = 0
+
+    def add(self, fileobj: BinaryIO, filename: str, content_type: str) -> List[BatchItem]:
+        """暂存一个上传文件，zip压缩包展开为其中的每个视频文件"""
+        if is_zip(filename, content_type):
+            return self._add_zip(fileobj, filename)
+        if not content_type.startswith("video/"):
+            return [BatchItem(filename, error="只支持视频文件")]
+        return [self._copy(fileobj, filename, Path(filename).suffix)]
+
+    def begin(self, filename: str, content_type: str) -> "StagedPart":
+        """开始暂存一个流式接收的文件part，之后逐块调用 write，最后调用 finish"""
+        return StagedPart(self, filename, content_type)
+
+    def _add_zip(self, fileobj: BinaryIO, filename: str) -> List[BatchItem]:
+        try:
+            archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile:
+            return [BatchItem(filename, error="无效的zip文件")]
+
+        items = []
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                # 只使用文件名部分，避免路径穿越
+                name = PurePosixPath(info.filename).name
+                entry_name = f"{filename}/{info.filename}"
+                suffix = Path(name).suffix.lower()
+                if name.startswith(".") or suffix not in VIDEO_SUFFIXES:
+                    items.append(BatchItem(entry_name, error="只支持视频文件"))
+                    continue
+                if info.file_size > self.max_file_bytes:
+                    items.append(BatchItem(entry_name, error="文件大小不能超过100MB"))
+                    continue
+                with archive.open(info) as entry:
+                    items.append(self._copy(entry, entry_name, suffix))
+        return items
+
+    def _copy(self, source: BinaryIO, filename: str, suffix: str) -> BatchItem:
+        writer = _FileWriter(self, filename, suffix)
+        try:
+            while writer.size <= self.max_file_bytes:
+                chunk = source.read(COPY_CHUNK_BYTES)
+                if not chunk:
+                    break
+                writer.write(chunk)
+        except BaseException:
+            writer.file.close()
+            raise
+        return writer.close()
+
+    def _count_bytes(self, size: int):
+        self.total_bytes += size
+        if self.total_bytes > self.max_total_bytes:
+            raise BatchLimitError(f"批量总大小不能超过{self.max_total_bytes // 1024 // 1024}MB")
+
+
+class _FileWriter:
+    """把单个视频文件写入暂存目录，同时计算哈希；超过单文件大小限制后丢弃之后的数据"""
+
+    def __init__(self, stager: BatchStager, filename: str, suffix: str):
+        stager.count += 1
+        if stager.count > stager.max_files:
+            raise BatchLimitError(f"批量文件数不能超过{stager.max_files}个")
+        self.stager = stager
+        self.filename = filename
+        self.path = stager.work_dir / f"{stager.count:04d}{suffix.lower()}"
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.file = open(self.path, "wb")
+
+    def write(self, chunk: bytes):
+        if self.size > self.stager.max_file_bytes:
+            return
+        self.size += len(chunk)
+        self.stager._count_bytes(len(chunk))
+        if self.size > self.stager.max_file_bytes:
+            return
+        self.hasher.update(chunk)
+        self.file.write(chunk)
+
+    def close(self) -> BatchItem:
+        self.file.close()
+        if self.size > self.stager.max_file_bytes:
+            self.path.unlink(missing_ok=True)
+            self.stager.total_bytes -= self.size
+            return BatchItem(self.filename, size=self.size, error="文件大小不能超过100MB")
+        return BatchItem(self.filename, path=self.path, sha256=self.hasher.hexdigest(), size=self.size)
+
+
+class StagedPart:
+    """流式接收的一个文件part：视频直接写入暂存目录，zip先落盘再展开，其他类型丢弃数据"""
+
+    def __init__(self, stager: BatchStager, filename: str, content_type: str):
+        self.stager = stager
+        self.filename = filename
+        self.error: Optional[str] = None
+        self.writer: Optional[_FileWriter] = None
+        self.zip_file = None
+        self.zip_size = 0
+        if is_zip(filename, content_type):
+            self.zip_path = stager.work_dir / f"archive{stager.count:04d}.zip.part"
+            self.zip_file = open(self.zip_path, "wb")
+        elif not content_type.startswith("video/"):
+            self.error = "只支持视频文件"
+        else:
+            self.writer = _FileWriter(stager, filename, Path(filename).suffix)
+
+    def write(self, chunk: bytes):
+        if self.writer is not None:
+            self.writer.write(chunk)
+        elif self.zip_file is not None:
+            self.zip_size += len(chunk)
+            self.stager._count_bytes(len(chunk))
+            self.zip_file.write(chunk)
+
+    def finish(self) -> List[BatchItem]:
+        """part接收完毕，返回暂存结果（zip展开为其中的每个视频文件，压缩包随后删除）"""
+        if self.writer is not None:
+            return [self.writer.close()]
+        if self.zip_file is None:
+            return [BatchItem(self.filename, error=self.error)]
+        self.zip_file.close()
+        try:
+            with open(self.zip_path, "rb") as f:
+                return self.stager._add_zip(f, self.filename)
+        finally:
+            self.zip_path.unlink(missing_ok=True)
+            self.stager.total_bytes -= self.zip_size
+
+    def abort(self):
+        """出错时关闭已打开的文件（临时目录由调用方删除）"""
+        if self.writer is not None:
+            self.writer.file.close()
+        if self.zip_file is not None:
+            self.zip_file.close()
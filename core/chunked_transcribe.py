@@ -0,0 +1,275 @@
+"""
+长音频分块并行转录
+在静音处把音频切成约30-120秒的块，分发到多个工作进程（每个进程持有自己的Whisper模型）
+并行转录，再按块偏移修正时间戳并去除块边界处的重复段
+"""
+
+import os
+import logging
+import threading
+import multiprocessing
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from core.model_registry import MODEL_MEMORY_MB, ModelRegistry, model_registry
+from core.whisper_transcribe import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# 与 faster-whisper 的 Segment / TranscriptionInfo 保持相同的属性名，便于调用方统一处理
+Segment = namedtuple("Segment", ["start", "end", "text"])
+ChunkedInfo = namedtuple("ChunkedInfo", ["language", "duration"])
+
+MIN_CHUNK_SECONDS = 30.0
+MAX_CHUNK_SECONDS = 120.0
+# 能量检测的帧长和平滑窗口
+FRAME_SECONDS = 0.03
+SMOOTH_SECONDS = 0.5
+
+
+def _frame_energy(audio: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, int]:
+    """返回平滑后的逐帧RMS能量和帧长（采样数）"""
+    frame = max(1, int(FRAME_SECONDS * sample_rate))
+    n_frames = len(audio) // frame
+    energy = np.sqrt(np.mean(audio[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+    smooth = max(1, int(SMOOTH_SECONDS / FRAME_SECONDS))
+    return np.convolve(energy, np.ones(smooth) / smooth, mode="same"), frame
+
+
+def _quietest_sample(energy: np.ndarray, frame: int, lo: int, hi: int) -> int:
+    """在采样区间 [lo, hi) 内找到平滑能量最低的位置"""
+    lo_frame, hi_frame = lo // frame, max(lo // frame + 1, hi // frame)
+    return (lo_frame + int(np.argmin(energy[lo_frame:hi_frame]))) * frame
+
+
+def _energy_split_points(audio: np.ndarray, sample_rate: int, min_chunk: float, max_chunk: float) -> List[int]:
+    """能量检测：在每个 [min_chunk, max_chunk] 窗口内选择平滑后能量最低的位置切分"""
+    energy, frame = _frame_energy(audio, sample_rate)
+    min_samples, max_samples = int(min_chunk * sample_rate), int(max_chunk * sample_rate)
+    points = []
+    start = 0
+    while len(audio) - start > max_samples:
+        cut = _quietest_sample(energy, frame, start + min_samples, start + max_samples)
+        points.append(cut)
+        start = cut
+    return points
+
+
+def _silero_split_points(audio: np.ndarray, sample_rate: int, min_chunk: float, max_chunk: float) -> List[int]:
+    """Silero VAD：在语音段之间的静音中点切分，窗口内没有静音时退回能量检测"""
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    speech = get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=300))
+    gaps = [(prev["end"] + cur["start"]) // 2 for prev, cur in zip(speech, speech[1:])]
+
+    energy = None
+    min_samples, max_samples = int(min_chunk * sample_rate), int(max_chunk * sample_rate)
+    points = []
+    start = 0
+    while len(audio) - start > max_samples:
+        candidates = [g for g in gaps if start + min_samples <= g <= start + max_samples]
+        if candidates:
+            # 取窗口内最靠后的静音，使块尽量长
+            cut = candidates[-1]
+        else:
+            if energy is None:
+                energy, frame = _frame_energy(audio, sample_rate)
+            cut = _quietest_sample(energy, frame, start + min_samples, start + max_samples)
+        points.append(cut)
+        start = cut
+    return points
+
+
+def split_on_silence(audio: np.ndarray, sample_rate: int = SAMPLE_RATE,
+                     min_chunk: float = MIN_CHUNK_SECONDS, max_chunk: float = MAX_CHUNK_SECONDS,
+                     method: str = "energy") -> List[Tuple[int, int]]:
+    """返回 [(起始采样, 结束采样), ...]，除最后一块外每块长度在 [min_chunk, max_chunk] 内"""
+    if method == "silero":
+        points = _silero_split_points(audio, sample_rate, min_chunk, max_chunk)
+    elif method == "energy":
+        points = _energy_split_points(audio, sample_rate, min_chunk, max_chunk)
+    else:
+        raise ValueError(f"不支持的切分方法: {method}")
+    bounds = [0] + points + [len(audio)]
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def _normalize(text: str) -> str:
+    return "".join(ch for ch in text.lower() if ch.isalnum())
+
+
+def stitch_segments(chunks: List[List[Segment]], seam_tolerance: float = 1.0) -> List[Segment]:
+    """按块顺序拼接已修正偏移的段，去除块边界处与上一块末尾重复的段"""
+    stitched: List[Segment] = []
+    for segments in chunks:
+        if stitched and segments:
+            last = stitched[-1]
+            # 块边界附近、文本与上一块最后一段相同的段视为重复
+            while segments and segments[0].start - last.end <= seam_tolerance \
+                    and _normalize(segments[0].text) == _normalize(last.text):
+                segments = segments[1:]
+        stitched.extend(segments)
+    return stitched
+
+
+def available_cpus() -> int:
+    """本进程实际可用的CPU数：取CPU亲和性和cgroup CPU配额中较小者（容器内 os.cpu_count() 是宿主机核数）"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    # cgroup v2 为 "配额 周期"，v1 分为两个文件；配额为 max 或 -1 表示不限制
+    for quota_file, period_file in (("/sys/fs/cgroup/cpu.max", None),
+                                    ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us")):
+        try:
+            with open(quota_file) as f:
+                values = f.read().split()
+            if period_file is not None:
+                with open(period_file) as f:
+                    values.append(f.read().strip())
+            quota, period = values[0], values[1]
+            if quota not in ("max", "-1"):
+                cpus = min(cpus, max(1, int(quota) // int(period)))
+            break
+        except (OSError, ValueError, IndexError):
+            continue
+    return cpus
+
+
+# ---- 工作进程 ----
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, device: str, compute_type: str, cpu_threads: int):
+    """工作进程初始化：每个进程加载自己的模型"""
+    global _worker_model
+    from faster_whisper import WhisperModel
+    _worker_model = WhisperModel(model_name, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def _transcribe_chunk(audio: np.ndarray, offset: float, params: Dict) -> Tuple[List[Segment], str, float]:
+    segments, info = _worker_model.transcribe(audio, **params)
+    result = [Segment(seg.start + offset, seg.end + offset, seg.text) for seg in segments]
+    return result, info.language, len(audio) / SAMPLE_RATE
+
+
+class ChunkedTranscriber:
+    """持有一个进程池，池中每个进程加载同一个模型
+
+    指定 registry 时各进程的模型内存已在其中预留，shutdown 时释放。
+    """
+
+    def __init__(self, model_name: str, workers: int, device: str = "cpu", compute_type: str = "int8",
+                 split_method: str = "energy", registry: Optional[ModelRegistry] = None):
+        self.model_name = model_name
+        self.workers = workers
+        self.split_method = split_method
+        self.registry = registry
+        # 正在使用该进程池的任务数，以及是否已被其他模型的进程池替换（由模块锁保护）
+        self.users = 0
+        self.retired = False
+        # 平分CPU核心，避免各进程的CTranslate2线程相互抢占
+        cpu_threads = max(1, available_cpus() // workers)
+        # 使用spawn避免在已加载模型/已启动线程的进程中fork
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, device, compute_type, cpu_threads),
+        )
+
+    @property
+    def reservation(self) -> str:
+        return f"chunked:{self.model_name}:{id(self)}"
+
+    def transcribe(self, audio: np.ndarray, params: Dict,
+                   on_chunk_done: Optional[Callable[[int, int], None]] = None) -> Tuple[List[Segment], ChunkedInfo]:
+        """并行转录，返回拼接后的段和 (language, duration)
+
+        language 为 auto 时各块独立检测语言，结果取覆盖时长最多的语言。
+        """
+        bounds = split_on_silence(audio, method=self.split_method)
+        logger.info(f"长音频分块转录: {len(audio) / SAMPLE_RATE:.1f}秒, {len(bounds)} 块, {self.workers} 个进程")
+        futures = {
+            self._executor.submit(_transcribe_chunk, audio[a:b], a / SAMPLE_RATE, params): i
+            for i, (a, b) in enumerate(bounds)
+        }
+        chunks: List[List[Segment]] = [[] for _ in bounds]
+        languages: Counter = Counter()
+        for done, future in enumerate(as_completed(futures), 1):
+            segments, language, duration = future.result()
+            chunks[futures[future]] = segments
+            languages[language] += duration
+            if on_chunk_done is not None:
+                on_chunk_done(done, len(bounds))
+
+        language = languages.most_common(1)[0][0] if languages else params.get("language", "")
+        return stitch_segments(chunks), ChunkedInfo(language, len(audio) / SAMPLE_RATE)
+
+    def shutdown(self):
+        """关闭进程池并释放预留的内存，已提交的块仍会完成"""
+        self._executor.shutdown(wait=False)
+        if self.registry is not None:
+            self.registry.release(self.reservation)
+
+
+# 每个模型一个进程池，同一时间只保留一个模型的可用进程池
+_transcribers: Dict[str, ChunkedTranscriber] = {}
+_transcribers_lock = threading.Lock()
+
+
+def _start_transcriber(model_name: str, workers: int, split_method: str,
+                       registry: ModelRegistry) -> Optional[ChunkedTranscriber]:
+    """按可用CPU和内存预算确定进程数（至少2个，否则返回None）并启动进程池"""
+    workers = min(workers, available_cpus())
+    model_mb = MODEL_MEMORY_MB.get(model_name, 0)
+    while workers >= 2:
+        transcriber = ChunkedTranscriber(model_name, workers, split_method=split_method, registry=registry)
+        if registry.reserve(transcriber.reservation, model_mb * workers):
+            return transcriber
+        transcriber.shutdown()
+        workers -= 1
+    logger.warning(f"可用CPU或内存预算不足以启动分块转录进程池: {model_name}")
+    return None
+
+
+def _retire(transcriber: ChunkedTranscriber):
+    """标记进程池已被替换，没有任务使用时立即关闭，否则由最后一个任务关闭"""
+    transcriber.retired = True
+    if transcriber.users == 0:
+        transcriber.shutdown()
+
+
+@contextmanager
+def chunked_transcriber(model_name: str, workers: int, split_method: str = "energy",
+                        registry: Optional[ModelRegistry] = None) -> Iterator[Optional[ChunkedTranscriber]]:
+    """借用模型的进程池，复用进程和已加载的模型
+
+    进程池按引用计数管理：换用其他模型时旧进程池只有在没有任务使用时才关闭。
+    CPU或内存预算不足以启动至少2个工作进程时得到None，调用方应退回单进程转录。
+    """
+    registry = registry or model_registry
+    with _transcribers_lock:
+        transcriber = _transcribers.get(model_name)
+        if transcriber is None:
+            for other in _transcribers.values():
+                _retire(other)
+            _transcribers.clear()
+            transcriber = _start_transcriber(model_name, workers, split_method, registry)
+            if transcriber is not None:
+                _transcribers[model_name] = transcriber
+        if transcriber is not None:
+            transcriber.users += 1
+    try:
+        yield transcriber
+    finally:
+        if transcriber is not None:
+            with _transcribers_lock:
+                transcriber.users -= 1
+                if transcriber.retired and transcriber.users == 0:
+                    transcriber.shutdown()
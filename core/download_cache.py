@@ -0,0 +1,215 @@
+"""
+下载缓存
+按yt-dlp提取的规范视频ID缓存下载的音频文件：同一视频的并发请求共享一次下载（single-flight），
+缓存目录按总大小做LRU淘汰，并清理崩溃或中断后遗留的临时下载目录
+"""
+
+import os
+import re
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 下载进行中的临时目录前缀（位于缓存目录内，下载完成后文件原子移入缓存）
+PARTIAL_PREFIX = ".partial-"
+# 超过该时长（秒）的临时目录视为遗留目录，足够覆盖正常的下载和转录时长
+ORPHAN_MAX_AGE_SECONDS = 6 * 3600
+
+_UNSAFE_KEY_CHARS = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def remove_stale_dirs(parent, prefix: str, max_age: float = ORPHAN_MAX_AGE_SECONDS) -> int:
+    """删除 parent 下以 prefix 开头、最近修改时间早于 max_age 秒前的目录，返回删除的数量"""
+    parent = Path(parent)
+    if not parent.is_dir():
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for path in parent.glob(f"{prefix}*"):
+        try:
+            if not path.is_dir() or path.stat().st_mtime > cutoff:
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    if removed:
+        logger.info(f"已清理 {removed} 个遗留临时目录: {parent}/{prefix}*")
+    return removed
+
+
+class DownloadCache:
+    """磁盘下载缓存
+
+    每个视频保存为 cache_dir/<视频ID>.<扩展名>，文件修改时间即最近访问时间，
+    进程重启后按修改时间重建LRU顺序。总大小超过 max_bytes 时淘汰最久未访问的条目
+    （最新写入的条目总是保留）。取用时把缓存文件硬链接到调用方的工作目录，
+    之后淘汰缓存不影响正在使用该文件的任务。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024,
+                 orphan_max_age: float = ORPHAN_MAX_AGE_SECONDS):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        # 视频ID -> (文件名, 字节数)
+        self._entries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        remove_stale_dirs(self.cache_dir, PARTIAL_PREFIX, orphan_max_age)
+        self._load_index()
+
+    def fetch(self, video_id: str, download: Callable[[str], str], dest_dir) -> Path:
+        """返回 dest_dir 中该视频的文件
+
+        未缓存时调用 download(临时目录) 下载并返回文件路径；同一ID同时只有一个下载，
+        其他请求等待它完成后共享结果（下载失败时一起失败）。
+        """
+        key = _UNSAFE_KEY_CHARS.sub("_", video_id)
+        dest_dir = Path(dest_dir)
+        with self._lock:
+            path = self._link_cached(key, dest_dir)
+            if path is not None:
+                self.hits += 1
+                return path
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.deduplicated += 1
+
+        if leader:
+            try:
+                self._download(key, download)
+                future.set_result(None)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+        else:
+            logger.info(f"等待进行中的下载: {key}")
+            future.result()
+
+        with self._lock:
+            path = self._link_cached(key, dest_dir)
+        if path is None:
+            raise RuntimeError(f"下载缓存文件已被移除: {key}")
+        return path
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total_bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "deduplicated": self.deduplicated,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _link_cached(self, key: str, dest_dir: Path) -> Optional[Path]:
+        """已缓存时把文件链接到 dest_dir 并刷新访问时间，需持有锁"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        source = self.cache_dir / entry[0]
+        target = dest_dir / entry[0]
+        try:
+            try:
+                os.link(source, target)
+            except FileExistsError:
+                pass
+            except OSError:
+                # 工作目录与缓存目录不在同一文件系统
+                shutil.copyfile(source, target)
+            os.utime(source)
+        except OSError as e:
+            logger.warning(f"下载缓存读取失败: {key}, {str(e)}")
+            self._forget(key)
+            return None
+        self._entries.move_to_end(key)
+        return target
+
+    def _download(self, key: str, download: Callable[[str], str]):
+        partial_dir = tempfile.mkdtemp(prefix=PARTIAL_PREFIX, dir=self.cache_dir)
+        try:
+            source = Path(download(partial_dir))
+            filename = f"{key}{source.suffix}"
+            size = source.stat().st_size
+            os.replace(source, self.cache_dir / filename)
+        finally:
+            shutil.rmtree(partial_dir, ignore_errors=True)
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = (filename, size)
+            self._total_bytes += size
+            self._evict()
+        logger.info(f"下载已缓存: {filename}, {size} bytes")
+
+    def _forget(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, (filename, size) = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                (self.cache_dir / filename).unlink()
+            except OSError:
+                pass
+            logger.info(f"淘汰下载缓存: {key}")
+
+    def _load_index(self):
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if path.name.startswith(PARTIAL_PREFIX):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.is_file():
+                entries.append((stat.st_mtime, path.stem, path.name, stat.st_size))
+        for _, key, filename, size in sorted(entries):
+            self._entries[key] = (filename, size)
+            self._total_bytes += size
+        self._evict()
+        logger.info(f"下载缓存已加载: {len(self._entries)} 个文件, {self._total_bytes} bytes")
+
+
+# 默认下载缓存，DOWNLOAD_CACHE_DIR 设为空字符串时禁用。
+# 缓存与上传、转录临时文件共用 /tmp（k8s 中为 1Gi 的 emptyDir），默认上限需留出足够余量
+DOWNLOAD_CACHE_DIR = os.getenv("DOWNLOAD_CACHE_DIR", "/tmp/download_cache")
+download_cache = DownloadCache(
+    DOWNLOAD_CACHE_DIR,
+    max_bytes=int(os.getenv("DOWNLOAD_CACHE_MAX_MB", "256")) * 1024 * 1024,
+) if DOWNLOAD_CACHE_DIR else None
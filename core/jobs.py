@@ -0,0 +1,258 @@
+"""
+转录任务管理
+使用有界线程池在事件循环之外执行音频提取和转录，并提供任务状态查询和进度事件；
+配置共享状态后端时任务状态快照同时写入后端，其他工作进程也能查询
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from core.state_backend import StateBackend, state_backend
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+# 事件类型
+EVENT_STAGE = "stage"        # 阶段变化: queued, extracting, transcribing, postprocessing, ...
+EVENT_LOG = "log"            # 普通日志
+EVENT_PROGRESS = "progress"  # 转录进度（已产出段数、已处理时长）
+EVENT_DONE = "done"          # 任务结束，data中包含最终状态
+
+
+class JobQueueFullError(RuntimeError):
+    """等待中的任务数已达上限"""
+
+
+@dataclass
+class Job:
+    """单个转录任务"""
+
+    id: str
+    filename: str = ""
+    status: str = JOB_QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cached: bool = False
+    stage: str = JOB_QUEUED
+    events: List[Dict[str, Any]] = field(default_factory=list, repr=False)
+    future: Optional[Future] = field(default=None, repr=False)
+    # 阶段变化和任务结束时回调，用于发布状态快照
+    listener: Optional[Callable[["Job"], None]] = field(default=None, repr=False)
+    # 保护 events 和事件序号：进度回调可能来自多个线程（如分块转录的完成回调）
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+    _last_event_id: int = field(default=0, init=False, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def emit(self, event_type: str, message: str = "", level: str = "info", **data) -> Dict[str, Any]:
+        """记录一条任务事件，事件序号从1开始递增，供SSE断线重连续传
+
+        连续的进度事件只保留最新一条（序号仍递增），长音频逐段上报进度时事件列表不会无限增长。
+        """
+        with self._lock:
+            if event_type == EVENT_STAGE:
+                self.stage = data.get("stage", self.stage)
+            self._last_event_id += 1
+            event = {
+                "id": self._last_event_id,
+                "type": event_type,
+                "time": time.time(),
+                "level": level,
+                "message": message,
+                **data,
+            }
+            if event_type == EVENT_PROGRESS and self.events and self.events[-1]["type"] == EVENT_PROGRESS:
+                self.events[-1] = event
+            else:
+                self.events.append(event)
+        if self.listener is not None and event_type in (EVENT_STAGE, EVENT_DONE):
+            self.listener(self)
+        return event
+
+    def log(self, message: str, level: str = "info"):
+        """记录日志事件"""
+        self.emit(EVENT_LOG, message, level)
+
+    def set_stage(self, stage: str, message: str = "", **data):
+        """切换处理阶段"""
+        self.emit(EVENT_STAGE, message, stage=stage, **data)
+
+    def events_since(self, last_id: int) -> List[Dict[str, Any]]:
+        """返回序号大于 last_id 的事件"""
+        with self._lock:
+            return [event for event in self.events if event["id"] > last_id]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化的状态字典"""
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+            "cached": self.cached,
+        }
+
+
+class JobManager:
+    """转录任务管理器
+
+    max_workers 个线程并发执行任务，最多允许 max_pending 个任务排队或运行，
+    已结束的任务在 ttl_seconds 后被清理。
+    指定 backend 时任务状态快照以 "job:{id}" 写入共享状态后端（同样 ttl_seconds 后过期），
+    队列长度等统计仍只包含本进程的任务。
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, ttl_seconds: int = 3600,
+                 backend: Optional[StateBackend] = None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcribe")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, func: Callable[..., Dict[str, Any]], *args,
+               filename: str = "", cleanup: Optional[Callable[[], None]] = None, **kwargs) -> Job:
+        """提交任务，队列已满时抛出 JobQueueFullError
+
+        func 以 func(job, *args, **kwargs) 的形式调用，可通过 job.log / job.emit 上报进度。
+        """
+        with self._lock:
+            self._purge_expired()
+            if self._count_active() >= self.max_pending:
+                raise JobQueueFullError(f"任务队列已满 ({self.max_pending})")
+            job = Job(id=uuid.uuid4().hex, filename=filename, listener=self._listener)
+            self._jobs[job.id] = job
+        # 发布状态快照会访问共享状态后端，不在锁内进行
+        job.set_stage(JOB_QUEUED)
+
+        job.future = self._executor.submit(self._run, job, func, args, kwargs, cleanup)
+        logger.info(f"任务已提交: {job.id} ({filename})")
+        return job
+
+    def add_completed(self, result: Dict[str, Any], filename: str = "") -> Job:
+        """登记一个已有结果的任务（如缓存命中），不占用工作线程"""
+        now = time.time()
+        job = Job(id=uuid.uuid4().hex, filename=filename, status=JOB_COMPLETED,
+                  started_at=now, finished_at=now, result=result, cached=True, listener=self._listener)
+        job.future = Future()
+        job.future.set_result(result)
+        job.emit(EVENT_DONE, status=job.status, elapsed=0.0, cached=True)
+        with self._lock:
+            self._purge_expired()
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """按ID获取任务"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """按ID获取任务状态字典，本进程没有该任务时查询共享状态后端"""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.backend is None:
+            return None
+        try:
+            snapshot = self.backend.get(f"job:{job_id}")
+        except Exception as e:
+            logger.warning(f"读取共享任务状态失败: {job_id}, {str(e)}")
+            return None
+        return json.loads(snapshot) if snapshot else None
+
+    @property
+    def queue_depth(self) -> int:
+        """排队中（尚未开始执行）的任务数"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == JOB_QUEUED)
+
+    @property
+    def in_flight(self) -> int:
+        """正在执行的任务数"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == JOB_RUNNING)
+
+    def shutdown(self, wait: bool = True):
+        """关闭线程池"""
+        self._executor.shutdown(wait=wait)
+
+    @property
+    def _listener(self) -> Optional[Callable[[Job], None]]:
+        return self._publish if self.backend is not None else None
+
+    def _publish(self, job: Job):
+        """把任务状态快照写入共享状态后端，失败只记录日志，不影响任务执行"""
+        try:
+            self.backend.set(f"job:{job.id}", json.dumps(job.to_dict(), ensure_ascii=False, default=str),
+                             ttl=self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"发布任务状态失败: {job.id}, {str(e)}")
+
+    def _run(self, job: Job, func, args, kwargs, cleanup):
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        if self.backend is not None:
+            self._publish(job)
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = JOB_COMPLETED
+            return job.result
+        except Exception as e:
+            logger.error(f"任务失败: {job.id}, {str(e)}")
+            job.error = str(e)
+            job.status = JOB_FAILED
+            raise
+        finally:
+            job.finished_at = time.time()
+            if cleanup is not None:
+                try:
+                    cleanup()
+                except Exception as e:
+                    logger.warning(f"任务清理失败: {job.id}, {str(e)}")
+            job.emit(EVENT_DONE, job.error or "", "error" if job.error else "info",
+                     status=job.status, elapsed=job.finished_at - job.started_at)
+
+    def _count_active(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.done)
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.done and job.finished_at and now - job.finished_at > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# 默认任务管理器，工作线程数和队列长度可通过环境变量调整
+job_manager = JobManager(
+    max_workers=int(os.getenv("TRANSCRIBE_WORKERS", "2")),
+    max_pending=int(os.getenv("TRANSCRIBE_MAX_PENDING", "16")),
+    backend=state_backend if state_backend.shared else None,
+)
@@ -22,6 +22,9 @@ LANGUAGES = {
         "transcription_content": "转录内容:",
         "error": "错误:",
         "upload_failed": "上传失败:",
+        "progress": "进度:",
+        "segments": "转录段",
+        "chunks": "音频块",
         "file_too_large": "文件大小不能超过100MB",
         "unsupported_file": "只支持视频文件",
         "unsupported_language": "不支持的语言",
@@ -88,6 +91,9 @@ LANGUAGES = {
         "transcription_content": "Transcription content:",
         "error": "Error:",
         "upload_failed": "Upload failed:",
+        "progress": "Progress:",
+        "segments": "segments",
+        "chunks": "chunks",
         "file_too_large": "File size cannot exceed 100MB",
         "unsupported_file": "Only video files are supported",
         "unsupported_language": "Unsupported language",
@@ -154,6 +160,9 @@ LANGUAGES = {
         "transcription_content": "Содержание транскрипции:",
         "error": "Ошибка:",
         "upload_failed": "Ошибка загрузки:",
+        "progress": "Прогресс:",
+        "segments": "сегментов",
+        "chunks": "фрагментов",
         "file_too_large": "Размер файла не может превышать 100 МБ",
         "unsupported_file": "Поддерживаются только видеофайлы",
         "unsupported_language": "Неподдерживаемый язык",
@@ -209,6 +218,9 @@ LANGUAGES = {
         "transcription_content": "Transkriptionsinhalt:",
         "error": "Fehler:",
         "upload_failed": "Upload fehlgeschlagen:",
+        "progress": "Fortschritt:",
+        "segments": "Segmente",
+        "chunks": "Abschnitte",
         "file_too_large": "Dateigröße darf 100 MB nicht überschreiten",
         "unsupported_file": "Nur Videodateien werden unterstützt",
         "unsupported_language": "Nicht unterstützte Sprache",
@@ -264,6 +276,9 @@ LANGUAGES = {
         "transcription_content": "Contenu de la transcription:",
         "error": "Erreur:",
         "upload_failed": "Échec du téléchargement:",
+        "progress": "Progression:",
+        "segments": "segments",
+        "chunks": "blocs",
         "file_too_large": "La taille du fichier ne peut pas dépasser 100 Mo",
         "unsupported_file": "Seuls les fichiers vidéo sont pris en charge",
         "unsupported_language": "Langue non prise en charge",
@@ -319,6 +334,9 @@ LANGUAGES = {
         "transcription_content": "文字起こし内容:",
         "error": "エラー:",
         "upload_failed": "アップロード失敗:",
+        "progress": "進捗:",
+        "segments": "セグメント",
+        "chunks": "チャンク",
         "file_too_large": "ファイルサイズは100MBを超えることはできません",
         "unsupported_file": "動画ファイルのみサポートされています",
         "unsupported_language": "サポートされていない言語",
@@ -0,0 +1,194 @@
+"""
+LLM结果缓存
+以提供商、模型、风格、目标语言和输入文本哈希为键缓存润色结果，避免重复付费调用；
+内存LRU为一级缓存，可选SQLite持久化，两级都有TTL和条目数上限；
+配置共享状态后端时结果同时写入后端，供其他工作进程读取
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from core.state_backend import StateBackend, state_backend
+
+logger = logging.getLogger(__name__)
+
+
+def make_llm_cache_key(provider: str, model: str, style: str, target_language: str, text: str,
+                       base_url: Optional[str] = None) -> str:
+    """缓存键：不包含API密钥，同一文本的结果可在用户之间共享"""
+    payload = json.dumps({
+        "provider": provider,
+        "model": model,
+        "base_url": base_url or "",
+        "style": style,
+        "target_language": target_language,
+        "text": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMCache:
+    """两级LLM结果缓存
+
+    内存中最多保留 max_entries 条，指定 db_path 时同时写入SQLite（最多 max_db_entries 条），
+    内存未命中时从SQLite读取并回填。超过 ttl_seconds 的条目视为过期。
+    指定 backend 时结果也以 "llm:{key}" 写入共享状态后端，本地两级都未命中时再查后端。
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 86400,
+                 db_path: Optional[str] = None, max_db_entries: int = 10000,
+                 backend: Optional[StateBackend] = None):
+        self.max_entries = max_entries
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_db_entries = max_db_entries
+        self.hits = 0
+        self.misses = 0
+        # key -> (结果, 写入时间)
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._open_db(db_path)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+
+            value = self._db_get(key, now) if self._db is not None else None
+            if value is not None:
+                self._remember(key, value[0], value[1])
+                self.hits += 1
+                return value[0]
+
+        # 共享后端可能是网络服务，不在锁内访问
+        shared = self._backend_get(key) if self.backend is not None else None
+        with self._lock:
+            if shared is None:
+                self.misses += 1
+                return None
+            self._remember(key, shared, now)
+            self.hits += 1
+            return shared
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is not None:
+                self._db_put(key, value, now)
+        if self.backend is not None:
+            self._backend_put(key, value)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM llm_cache")
+
+    def _remember(self, key: str, value: str, created_at: float):
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _open_db(self, db_path: str):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+            logger.info(f"LLM缓存已打开: {db_path}")
+        except sqlite3.Error as e:
+            logger.warning(f"LLM缓存数据库打开失败，仅使用内存缓存: {str(e)}")
+            self._db = None
+
+    def _db_get(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        try:
+            row = self._db.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is not None:
+                with self._db:
+                    self._db.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return row
+        except sqlite3.Error as e:
+            logger.warning(f"LLM缓存读取失败: {str(e)}")
+            return None
+
+    def _db_put(self, key: str, value: str, now: float):
+        try:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                # 清理过期条目，并按最近访问时间保留 max_db_entries 条
+                self._db.execute("DELETE FROM llm_cache WHERE created_at <= ?", (now - self.ttl_seconds,))
+                self._db.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_db_entries,)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"LLM缓存写入失败: {str(e)}")
+
+    def _backend_get(self, key: str) -> Optional[str]:
+        try:
+            return self.backend.get(f"llm:{key}")
+        except Exception as e:
+            logger.warning(f"共享LLM缓存读取失败: {str(e)}")
+            return None
+
+    def _backend_put(self, key: str, value: str):
+        try:
+            self.backend.set(f"llm:{key}", value, ttl=self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"共享LLM缓存写入失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# 默认LLM结果缓存，LLM_CACHE_MAX_ENTRIES 设为0时禁用，LLM_CACHE_DB 为空时只使用内存，
+# STATE_BACKEND 为共享后端时各工作进程共享结果
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+llm_cache = LLMCache(
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400")),
+    db_path=os.getenv("LLM_CACHE_DB", ""),
+    max_db_entries=int(os.getenv("LLM_CACHE_DB_MAX_ENTRIES", "10000")),
+    backend=state_backend if state_backend.shared else None,
+) if LLM_CACHE_MAX_ENTRIES > 0 else None
@@ -0,0 +1,231 @@
+"""
+LLM客户端池
+按 (提供商, base_url, API密钥哈希) 复用异步客户端及其HTTP连接池，避免每次润色都重新握手；
+空闲超时的客户端和超出容量时最久未使用的客户端会被关闭（正在使用的客户端等调用结束后再关闭）
+"""
+
+import os
+import time
+import asyncio
+import inspect
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ClientKey = Tuple[str, str, str]
+
+# 每个客户端保持的长连接数
+MAX_KEEPALIVE_CONNECTIONS = 10
+
+
+def api_key_hash(api_key: str) -> str:
+    """池中只保存密钥的哈希，不保存明文"""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def _http_client(sdk, idle_timeout: float):
+    """按SDK自带的httpx封装创建连接池（新版SDK基于httpx2，不接受httpx的客户端），旧版SDK回退到httpx"""
+    if hasattr(sdk, "DefaultAsyncHttpxClient"):
+        limits_type = type(sdk.DEFAULT_CONNECTION_LIMITS)
+        return sdk.DefaultAsyncHttpxClient(
+            limits=limits_type(
+                max_connections=sdk.DEFAULT_CONNECTION_LIMITS.max_connections,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=idle_timeout,
+            ),
+            timeout=sdk.Timeout(60.0, connect=10.0),
+        )
+    import httpx
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS, keepalive_expiry=idle_timeout),
+        timeout=httpx.Timeout(60.0, connect=10.0),
+    )
+
+
+def _create_openai(api_key: str, base_url: Optional[str], idle_timeout: float):
+    import openai
+    return openai.AsyncOpenAI(api_key=api_key, base_url=base_url or None, http_client=_http_client(openai, idle_timeout))
+
+
+def _create_anthropic(api_key: str, base_url: Optional[str], idle_timeout: float):
+    import anthropic
+    return anthropic.AsyncAnthropic(
+        api_key=api_key, base_url=base_url or None, http_client=_http_client(anthropic, idle_timeout)
+    )
+
+
+def _create_google(api_key: str, base_url: Optional[str], idle_timeout: float):
+    # 使用底层 generativelanguage 客户端，密钥绑定在客户端上，而不是 genai.configure 的全局状态
+    from google.ai import generativelanguage as glm
+    client_options = {"api_key": api_key}
+    if base_url:
+        client_options["api_endpoint"] = base_url
+    return glm.GenerativeServiceAsyncClient(client_options=client_options)
+
+
+CLIENT_FACTORIES: Dict[str, Callable[[str, Optional[str], float], Any]] = {
+    "openai": _create_openai,
+    "anthropic": _create_anthropic,
+    "google": _create_google,
+}
+
+
+# 进行中的关闭任务；事件循环只保留任务的弱引用，这里持有强引用直到关闭完成
+_closing_tasks: Set["asyncio.Task"] = set()
+
+
+async def _await_close(closing):
+    try:
+        await closing
+    except Exception as e:
+        logger.warning(f"关闭LLM客户端失败: {str(e)}")
+
+
+def _close_client(client: Any):
+    """关闭客户端持有的连接（不同SDK的关闭方法不同，异步客户端的关闭在当前事件循环中进行）"""
+    try:
+        if hasattr(client, "close"):
+            closing = client.close()
+        elif hasattr(client, "transport") and hasattr(client.transport, "close"):
+            closing = client.transport.close()
+        else:
+            return
+    except Exception as e:
+        logger.warning(f"关闭LLM客户端失败: {str(e)}")
+        return
+    if not inspect.isawaitable(closing):
+        return
+    try:
+        task = asyncio.get_running_loop().create_task(_await_close(closing))
+        _closing_tasks.add(task)
+        task.add_done_callback(_closing_tasks.discard)
+    except RuntimeError:
+        # 不在事件循环中（如进程退出时）无法等待关闭，连接随客户端被回收
+        if inspect.iscoroutine(closing):
+            closing.close()
+
+
+class _PooledClient:
+    __slots__ = ("client", "last_used", "users", "retired")
+
+    def __init__(self, client: Any, last_used: float):
+        self.client = client
+        self.last_used = last_used
+        # 正在使用的调用数；已移出池（retired）的客户端在最后一个调用结束时关闭
+        self.users = 0
+        self.retired = False
+
+
+class LLMClientPool:
+    """线程安全的LLM客户端LRU池
+
+    通过 lease() 借用客户端，借用期间客户端不会被关闭：空闲超时只针对没有调用在使用的客户端，
+    超出容量被移出池的客户端等最后一个调用结束后再关闭。
+    """
+
+    def __init__(self, max_clients: int = 32, idle_timeout: float = 300.0,
+                 factories: Optional[Dict[str, Callable[[str, Optional[str], float], Any]]] = None):
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self._factories = factories or CLIENT_FACTORIES
+        self._clients: "OrderedDict[ClientKey, _PooledClient]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    @contextmanager
+    def lease(self, provider: str, api_key: str, base_url: Optional[str] = None) -> Iterator[Any]:
+        """借用客户端（不存在时创建），with 块结束时归还"""
+        entry = self._acquire(provider, api_key, base_url)
+        try:
+            yield entry.client
+        finally:
+            self._release(entry)
+
+    def _acquire(self, provider: str, api_key: str, base_url: Optional[str]) -> _PooledClient:
+        factory = self._factories.get(provider)
+        if factory is None:
+            raise ValueError(f"不支持的LLM提供商: {provider}")
+
+        key = (provider, base_url or "", api_key_hash(api_key))
+        now = time.monotonic()
+        with self._lock:
+            expired = self._pop_idle(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry.users += 1
+                entry.last_used = now
+                self._clients.move_to_end(key)
+        for old in expired:
+            _close_client(old)
+        if entry is not None:
+            return entry
+
+        # 在锁外创建客户端，并发创建同一个键时保留先写入的那个
+        client = factory(api_key, base_url, self.idle_timeout)
+        evicted = []
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                evicted.append(client)
+            else:
+                self.created += 1
+                entry = self._clients[key] = _PooledClient(client, now)
+                while len(self._clients) > self.max_clients:
+                    _, old = self._clients.popitem(last=False)
+                    evicted.extend(self._retire(old))
+            entry.users += 1
+            self._clients.move_to_end(key)
+        for old in evicted:
+            _close_client(old)
+        if entry.client is client:
+            logger.info(f"创建LLM客户端: {provider}, base_url={base_url}")
+        return entry
+
+    def _release(self, entry: _PooledClient):
+        with self._lock:
+            entry.users -= 1
+            entry.last_used = time.monotonic()
+            close = entry.retired and entry.users == 0
+        if close:
+            _close_client(entry.client)
+
+    @staticmethod
+    def _retire(entry: _PooledClient) -> List[Any]:
+        """移出池的客户端：空闲时立即关闭，否则由最后一个调用归还时关闭"""
+        entry.retired = True
+        return [entry.client] if entry.users == 0 else []
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+    def clear(self):
+        """移除所有客户端，空闲的立即关闭，使用中的在调用结束后关闭"""
+        with self._lock:
+            clients = [client for entry in self._clients.values() for client in self._retire(entry)]
+            self._clients.clear()
+        for client in clients:
+            _close_client(client)
+
+    def _pop_idle(self, now: float) -> List[Any]:
+        expired = []
+        # 按最近使用排序，最久未使用的在前；使用中的客户端不算空闲
+        for key, entry in list(self._clients.items()):
+            if now - entry.last_used < self.idle_timeout:
+                break
+            if entry.users == 0:
+                del self._clients[key]
+                expired.extend(self._retire(entry))
+        return expired
+
+
+# 进程级客户端池
+llm_client_pool = LLMClientPool(
+    max_clients=int(os.getenv("LLM_CLIENT_POOL_SIZE", "32")),
+    idle_timeout=float(os.getenv("LLM_CLIENT_IDLE_TIMEOUT", "300")),
+)
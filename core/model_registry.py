@@ -0,0 +1,185 @@
+"""
+Whisper模型注册表
+按需加载模型，在数量和内存预算内保留常驻模型，超出时淘汰最近最少使用的模型
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 各模型常驻内存估算（MB，int8量化，CPU）
+MODEL_MEMORY_MB = {
+    "tiny": 75,
+    "base": 145,
+    "small": 480,
+    "medium": 1500,
+}
+
+AVAILABLE_MODELS = list(MODEL_MEMORY_MB.keys())
+
+# 未设置 WHISPER_MEMORY_BUDGET_MB 时，从容器内存上限中为服务本身、ffmpeg和音频缓冲预留的内存（MB）
+MEMORY_HEADROOM_MB = 512
+# 不在容器中（或未限制内存）时的默认预算（MB）
+DEFAULT_MEMORY_BUDGET_MB = 2048
+
+ModelKey = Tuple[str, str, str]
+
+
+def _load_whisper_model(name: str, device: str, compute_type: str):
+    """默认加载器：构建 faster-whisper 模型"""
+    from faster_whisper import WhisperModel
+    return WhisperModel(name, device=device, compute_type=compute_type)
+
+
+def container_memory_limit_mb() -> Optional[int]:
+    """cgroup 内存上限（MB），未限制或无法读取时返回None"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value == "max":
+            return None
+        try:
+            limit = int(value) // (1024 * 1024)
+        except ValueError:
+            continue
+        # cgroup v1 未限制时为接近 2^63 的值
+        return limit if limit < (1 << 40) else None
+    return None
+
+
+def default_memory_budget_mb() -> int:
+    """默认内存预算：WHISPER_MEMORY_BUDGET_MB，否则为容器内存上限减去 MEMORY_HEADROOM_MB"""
+    configured = os.getenv("WHISPER_MEMORY_BUDGET_MB")
+    if configured:
+        return int(configured)
+    limit = container_memory_limit_mb()
+    if limit is None:
+        return DEFAULT_MEMORY_BUDGET_MB
+    return max(0, limit - MEMORY_HEADROOM_MB)
+
+
+class ModelRegistry:
+    """线程安全的Whisper模型LRU缓存
+
+    模型以 (name, device, compute_type) 为键。同一模型并发请求时只加载一次，
+    不同模型可以并行加载。被淘汰的模型只是从注册表中移除，正在使用它的任务
+    持有引用直到完成。注册表之外的模型副本（如分块转录的工作进程）通过 reserve 计入内存预算。
+    """
+
+    def __init__(self, max_models: int = 2, memory_budget_mb: int = 2048,
+                 device: str = "cpu", compute_type: str = "int8",
+                 loader: Optional[Callable[[str, str, str], Any]] = None):
+        self.max_models = max_models
+        self.memory_budget_mb = memory_budget_mb
+        self.device = device
+        self.compute_type = compute_type
+        self._loader = loader or _load_whisper_model
+        self._models: "OrderedDict[ModelKey, Any]" = OrderedDict()
+        self._load_locks: Dict[ModelKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.load_times: Dict[ModelKey, float] = {}
+        # 预留者 -> 预留内存（MB）
+        self._reserved: Dict[str, int] = {}
+
+    def get(self, name: str, device: Optional[str] = None, compute_type: Optional[str] = None):
+        """获取模型，未加载时按需加载"""
+        if name not in MODEL_MEMORY_MB:
+            raise ValueError(f"不支持的模型: {name}")
+        if MODEL_MEMORY_MB[name] > self.memory_budget_mb:
+            raise ValueError(f"模型 {name} 超出内存预算 ({self.memory_budget_mb}MB)")
+
+        key = (name, device or self.device, compute_type or self.compute_type)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # 等待锁期间其他线程可能已完成加载
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key]
+
+            # 先淘汰旧模型腾出预算，避免新旧模型同时驻留时超出内存上限
+            with self._lock:
+                self._evict(keep=None, incoming_mb=MODEL_MEMORY_MB[name])
+
+            logger.info(f"正在加载Whisper模型: {key}")
+            start = time.time()
+            model = self._loader(*key)
+            self.load_times[key] = time.time() - start
+            logger.info(f"Whisper模型加载完成: {key}, 耗时: {self.load_times[key]:.2f}秒")
+
+            with self._lock:
+                self._models[key] = model
+                self._evict(keep=key)
+                self._load_locks.pop(key, None)
+            return model
+
+    def is_loaded(self, name: str, device: Optional[str] = None, compute_type: Optional[str] = None) -> bool:
+        """模型是否常驻"""
+        key = (name, device or self.device, compute_type or self.compute_type)
+        with self._lock:
+            return key in self._models
+
+    def loaded_models(self) -> List[ModelKey]:
+        """按最近使用顺序（旧到新）返回常驻模型"""
+        with self._lock:
+            return list(self._models.keys())
+
+    @property
+    def memory_used_mb(self) -> int:
+        """常驻模型的估算内存"""
+        with self._lock:
+            return self._memory_used()
+
+    def reserve(self, owner: str, memory_mb: int) -> bool:
+        """为注册表之外的模型副本预留内存，超出预算时返回False；预留成功后淘汰常驻模型腾出空间"""
+        with self._lock:
+            reserved = sum(mb for other, mb in self._reserved.items() if other != owner)
+            if reserved + memory_mb > self.memory_budget_mb:
+                return False
+            self._reserved[owner] = memory_mb
+            self._evict(keep=None)
+            return True
+
+    def release(self, owner: str):
+        """释放 reserve 预留的内存"""
+        with self._lock:
+            self._reserved.pop(owner, None)
+
+    def clear(self):
+        """卸载全部模型"""
+        with self._lock:
+            self._models.clear()
+
+    def _memory_used(self) -> int:
+        return sum(MODEL_MEMORY_MB[key[0]] for key in self._models) + sum(self._reserved.values())
+
+    def _evict(self, keep: Optional[ModelKey], incoming_mb: int = 0):
+        """淘汰最近最少使用的模型，直到数量和内存（加上即将加载的 incoming_mb）都在限制内"""
+        max_models = self.max_models - 1 if incoming_mb else self.max_models
+        while self._models and (len(self._models) > max_models
+                                or self._memory_used() + incoming_mb > self.memory_budget_mb):
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                break
+            del self._models[oldest]
+            logger.info(f"淘汰Whisper模型: {oldest}")
+
+
+# 默认模型注册表，常驻数量和内存预算可通过环境变量调整，内存预算默认按容器内存上限计算
+model_registry = ModelRegistry(
+    max_models=int(os.getenv("WHISPER_MAX_MODELS", "2")),
+    memory_budget_mb=default_memory_budget_mb(),
+)
@@ -0,0 +1,146 @@
+"""
+转录后处理：重复循环检测
+Whisper 在静音或噪声处容易产生幻觉循环（"thank you thank you ..."、同一句话连续输出多段）。
+这里把文本切成词元并映射为整数ID，用多项式滚动哈希在常数时间内比较任意长度的词元块，
+丢弃紧接着重复前文的n-gram块；整体耗时与词元数成线性关系，并可随转录段增量运行。
+"""
+
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+# 中日韩文字没有空格分隔，逐字作为词元；其余按空白切分
+_TOKEN_RE = re.compile(
+    r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]|[^\s぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]+"
+)
+
+# 滚动哈希：模 2^61-1 的多项式哈希
+_MOD = (1 << 61) - 1
+_BASE = 1_000_003
+
+
+@dataclass
+class LoopConfig:
+    """循环检测阈值
+
+    max_ngram: 检测的最长重复块（词元数），整段重复的幻觉句子也在此范围内被发现
+    keep_repeats: 同一块允许连续出现的次数，超出部分被丢弃（1表示只保留一份）
+    min_block_chars: 重复块至少包含的字符数（忽略标点），避免误删"谢谢"、"看看"这类单字叠词
+    """
+
+    max_ngram: int = 32
+    keep_repeats: int = 1
+    min_block_chars: int = 2
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """返回 [(词元, 起始位置, 结束位置), ...]"""
+    return [(m.group(), m.start(), m.end()) for m in _TOKEN_RE.finditer(text)]
+
+
+def _normalize(token: str) -> str:
+    """忽略大小写和标点，使 "Thank you." 与 "thank you" 视为相同"""
+    stripped = "".join(ch for ch in token.lower() if not unicodedata.category(ch).startswith("P"))
+    return stripped or token
+
+
+class LoopDetector:
+    """增量重复循环检测器
+
+    按顺序喂入各段文本，返回去除循环后的文本。已输出的词元不会被撤回，
+    因此跨段的循环（下一段重复上一段的结尾）同样能被发现。
+    """
+
+    def __init__(self, config: LoopConfig = None):
+        self.config = config or LoopConfig()
+        self.removed_tokens = 0
+        self._ids: Dict[str, int] = {}
+        # 已输出词元的ID、前缀哈希和 BASE 的幂
+        self._out: List[int] = []
+        self._prefix: List[int] = [0]
+        self._powers: List[int] = [1]
+        # 每个词元ID最近出现的输出位置，用于只检查首词元匹配的块长度
+        self._positions: Dict[int, List[int]] = {}
+
+    def feed(self, text: str) -> str:
+        """处理一段文本，返回保留的部分（保持原文的分隔符）"""
+        tokens = tokenize(text)
+        keys = [_normalize(token) for token, _, _ in tokens]
+        ids = [self._token_id(key) for key in keys]
+        prefix = [0]
+        chars = [0]
+        for key, token_id in zip(keys, ids):
+            prefix.append((prefix[-1] * _BASE + token_id) % _MOD)
+            chars.append(chars[-1] + len(key))
+
+        kept: List[str] = []
+        prev_end = 0
+        # 被丢弃块之前的分隔符，用于连接其前后保留的词元
+        pending_sep = None
+        i = 0
+        while i < len(ids):
+            block = self._repeated_block(ids, prefix, chars, i)
+            if block:
+                if kept and pending_sep is None:
+                    pending_sep = text[prev_end:tokens[i][1]]
+                self.removed_tokens += block
+                i += block
+                continue
+            token, start, end = tokens[i]
+            if kept:
+                kept.append(pending_sep if pending_sep is not None else text[prev_end:start])
+            pending_sep = None
+            kept.append(token)
+            prev_end = end
+            self._emit(ids[i])
+            i += 1
+        return "".join(kept)
+
+    def _token_id(self, key: str) -> int:
+        token_id = self._ids.get(key)
+        if token_id is None:
+            token_id = self._ids[key] = len(self._ids) + 1
+        return token_id
+
+    def _power(self, n: int) -> int:
+        while len(self._powers) <= n:
+            self._powers.append(self._powers[-1] * _BASE % _MOD)
+        return self._powers[n]
+
+    def _out_hash(self, start: int, end: int) -> int:
+        return (self._prefix[end] - self._prefix[start] * self._power(end - start)) % _MOD
+
+    def _repeated_block(self, ids: List[int], prefix: List[int], chars: List[int], i: int) -> int:
+        """若 ids[i:i+n] 与已输出的最后 n 个词元相同（且已连续出现 keep_repeats 次），返回 n，否则返回 0"""
+        out_len = len(self._out)
+        max_ngram = self.config.max_ngram
+        keep = self.config.keep_repeats
+        positions = self._positions.get(ids[i])
+        if not positions:
+            return 0
+        for pos in reversed(positions):
+            n = out_len - pos
+            if n > max_ngram:
+                break
+            if n * keep > out_len or i + n > len(ids) or chars[i + n] - chars[i] < self.config.min_block_chars:
+                continue
+            block_hash = (prefix[i + n] - prefix[i] * self._power(n)) % _MOD
+            if all(self._out_hash(out_len - k * n, out_len - (k - 1) * n) == block_hash
+                   for k in range(1, keep + 1)):
+                return n
+        return 0
+
+    def _emit(self, token_id: int):
+        self._out.append(token_id)
+        self._prefix.append((self._prefix[-1] * _BASE + token_id) % _MOD)
+        positions = self._positions.setdefault(token_id, [])
+        positions.append(len(self._out) - 1)
+        # 只需要最近 max_ngram 个位置之内的出现
+        if len(positions) > 2 * self.config.max_ngram:
+            del positions[:self.config.max_ngram]
+
+
+def collapse_loops(text: str, config: LoopConfig = None) -> str:
+    """一次性处理整段文本"""
+    return LoopDetector(config).feed(text)
@@ -0,0 +1,129 @@
+"""
+令牌桶限流
+按键（API密钥哈希）和全局两级限流，每分钟补充固定数量的令牌；
+检查和扣减在同一把锁内完成（临界区只有几次算术运算，可在线程和事件循环中直接调用）。
+多个工作进程需要共享限额时，令牌桶保存在共享状态后端中（见 core/state_backend.py）
+"""
+
+import time
+import logging
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from core.state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """超出限流，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def refilled_tokens(tokens: float, updated: float, per_minute: float, now: float) -> float:
+    """按经过的时间补充令牌，不超过桶容量"""
+    return min(per_minute, tokens + max(0.0, now - updated) * per_minute / 60.0)
+
+
+def wait_seconds(tokens: float, per_minute: float) -> float:
+    """令牌不足一个时，补足一个令牌需要等待的秒数"""
+    return (1.0 - tokens) * 60.0 / per_minute
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """每个键一个令牌桶，另有一个所有键共享的全局桶
+
+    per_key_per_minute / global_per_minute 为每分钟补充的令牌数，也是桶的容量（允许的突发量），
+    为0时不限制。键数超过 max_keys 时清理已经补满（长时间空闲）的桶。
+    传入 backend 时令牌桶保存在共享状态后端中，多个进程共用同一份限额。
+    后端不可用时放行请求（fail-open）并记录警告：限流只是保护措施，不应让后端故障变成服务不可用。
+    """
+
+    def __init__(self, per_key_per_minute: float, global_per_minute: float = 0, max_keys: int = 10000,
+                 clock: Callable[[], float] = time.monotonic, backend: Optional["StateBackend"] = None):
+        self.per_key_per_minute = per_key_per_minute
+        self.global_per_minute = global_per_minute
+        self.max_keys = max_keys
+        self.backend = backend
+        # 共享后端需要各进程一致的时钟
+        self._clock = time.time if backend is not None and clock is time.monotonic else clock
+        self._buckets: Dict[str, _Bucket] = {}
+        self._global = _Bucket(global_per_minute, clock())
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _refill(bucket: _Bucket, per_minute: float, now: float):
+        bucket.tokens = refilled_tokens(bucket.tokens, bucket.updated, per_minute, now)
+        bucket.updated = now
+
+    @staticmethod
+    def _wait_seconds(bucket: _Bucket, per_minute: float) -> float:
+        return wait_seconds(bucket.tokens, per_minute)
+
+    def acquire(self, key: str) -> float:
+        """尝试为 key 扣减一个令牌：成功返回0，否则不扣减并返回需要等待的秒数"""
+        now = self._clock()
+        if self.backend is not None:
+            buckets = []
+            if self.per_key_per_minute > 0:
+                buckets.append((f"rate:key:{key}", self.per_key_per_minute))
+            if self.global_per_minute > 0:
+                buckets.append(("rate:global", self.global_per_minute))
+            if not buckets:
+                return 0.0
+            try:
+                return self.backend.take_tokens(buckets, now)
+            except Exception as e:
+                logger.warning(f"共享状态后端限流失败，本次请求不限流: {str(e)}")
+                return 0.0
+        with self._lock:
+            bucket = None
+            wait = 0.0
+            if self.per_key_per_minute > 0:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    if len(self._buckets) >= self.max_keys:
+                        self._sweep(now)
+                    bucket = self._buckets[key] = _Bucket(self.per_key_per_minute, now)
+                else:
+                    self._refill(bucket, self.per_key_per_minute, now)
+                if bucket.tokens < 1.0:
+                    wait = self._wait_seconds(bucket, self.per_key_per_minute)
+            if self.global_per_minute > 0:
+                self._refill(self._global, self.global_per_minute, now)
+                if self._global.tokens < 1.0:
+                    wait = max(wait, self._wait_seconds(self._global, self.global_per_minute))
+            if wait > 0:
+                return wait
+            if bucket is not None:
+                bucket.tokens -= 1.0
+            if self.global_per_minute > 0:
+                self._global.tokens -= 1.0
+            return 0.0
+
+    def _sweep(self, now: float):
+        """清理已补满的桶；仍然超出时丢弃最久未更新的一半"""
+        for key in [key for key, bucket in self._buckets.items()
+                    if refilled_tokens(bucket.tokens, bucket.updated, self.per_key_per_minute, now)
+                    >= self.per_key_per_minute]:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:
+            oldest: List[str] = sorted(self._buckets, key=lambda k: self._buckets[k].updated)
+            for key in oldest[:len(oldest) // 2]:
+                del self._buckets[key]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._buckets)
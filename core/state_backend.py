@@ -0,0 +1,246 @@
+"""
+共享状态后端
+多个uvicorn工作进程共用的限流令牌桶、任务状态和结果缓存：
+内存后端只在本进程内有效（默认），SQLite后端在同一主机的进程间共享，Redis后端可跨主机共享。
+通过环境变量 STATE_BACKEND 选择: memory, sqlite:///path/to/state.db, redis://host:6379/0
+"""
+
+import os
+import time
+import random
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+from core.rate_limit import refilled_tokens, wait_seconds
+
+logger = logging.getLogger(__name__)
+
+# 令牌桶规格: (键, 每分钟令牌数)
+BucketSpec = Tuple[str, float]
+
+# SQLite后端每写入多少次清理一次过期键
+SQLITE_PURGE_EVERY = 100
+
+
+class StateBackend:
+    """状态后端接口：带过期时间的键值存储，以及原子的多令牌桶扣减"""
+
+    # 是否在多个进程间共享；不共享时各组件使用自己的进程内状态
+    shared = False
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def take_tokens(self, buckets: Sequence[BucketSpec], now: Optional[float] = None) -> float:
+        """所有桶都有令牌时各扣减一个并返回0，否则都不扣减，返回需要等待的最长秒数
+
+        桶不存在时视为满的（容量等于每分钟令牌数）。
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def _take(states: Dict[str, Tuple[float, float]], buckets: Sequence[BucketSpec],
+          now: float) -> Tuple[float, Dict[str, Tuple[float, float]]]:
+    """令牌桶扣减的公共计算：返回 (等待秒数, 扣减后的 {键: (令牌数, 更新时间)})"""
+    wait = 0.0
+    updated = {}
+    for key, per_minute in buckets:
+        tokens, last = states.get(key, (per_minute, now))
+        tokens = refilled_tokens(tokens, last, per_minute, now)
+        if tokens < 1.0:
+            wait = max(wait, wait_seconds(tokens, per_minute))
+        updated[key] = (tokens - 1.0, now)
+    return wait, updated
+
+
+class MemoryStateBackend(StateBackend):
+    """进程内状态后端"""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                del self._values[key]
+                return None
+            return entry[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def take_tokens(self, buckets: Sequence[BucketSpec], now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        with self._lock:
+            wait, updated = _take(self._buckets, buckets, now)
+            if wait == 0:
+                self._buckets.update(updated)
+            return wait
+
+
+class SQLiteStateBackend(StateBackend):
+    """SQLite状态后端，同一主机上的多个进程打开同一个数据库文件即可共享状态
+
+    令牌桶扣减在 BEGIN IMMEDIATE 事务中完成，跨进程也是原子的。
+    """
+
+    shared = True
+
+    def __init__(self, path: str, timeout: float = 10.0):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # 自动提交模式，需要原子性的操作显式开启事务
+        self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS state_kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS state_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM state_kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO state_kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + ttl if ttl else None)
+            )
+            if random.randrange(SQLITE_PURGE_EVERY) == 0:
+                self._db.execute("DELETE FROM state_kv WHERE expires_at <= ?", (now,))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM state_kv WHERE key = ?", (key,))
+
+    def take_tokens(self, buckets: Sequence[BucketSpec], now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        keys = [key for key, _ in buckets]
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    f"SELECT key, tokens, updated FROM state_buckets WHERE key IN ({','.join('?' * len(keys))})",
+                    keys
+                ).fetchall()
+                wait, updated = _take({key: (tokens, last) for key, tokens, last in rows}, buckets, now)
+                if wait == 0:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO state_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                        [(key, tokens, last) for key, (tokens, last) in updated.items()]
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return wait
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# Redis中的令牌桶扣减脚本，KEYS 为桶的键，ARGV 为 [当前时间, 各桶每分钟令牌数...]
+_REDIS_TAKE_TOKENS = """
+local now = tonumber(ARGV[1])
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local per_minute = tonumber(ARGV[i + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'updated')
+    local current = tonumber(state[1]) or per_minute
+    local updated = tonumber(state[2]) or now
+    current = math.min(per_minute, current + math.max(0, now - updated) * per_minute / 60)
+    if current < 1 then
+        wait = math.max(wait, (1 - current) * 60 / per_minute)
+    end
+    tokens[i] = current
+end
+if wait == 0 then
+    for i, key in ipairs(KEYS) do
+        redis.call('HSET', key, 'tokens', tostring(tokens[i] - 1), 'updated', tostring(now))
+        -- 桶在60秒内会补满，之后不再需要保存
+        redis.call('EXPIRE', key, 120)
+    end
+end
+return tostring(wait)
+"""
+
+
+class RedisStateBackend(StateBackend):
+    """Redis（及兼容协议的服务）状态后端，令牌桶扣减由Lua脚本原子执行"""
+
+    shared = True
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("使用Redis状态后端需要安装 redis 包: pip install redis")
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._take_script = self._client.register_script(_REDIS_TAKE_TOKENS)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self._client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key: str):
+        self._client.delete(key)
+
+    def take_tokens(self, buckets: Sequence[BucketSpec], now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        result = self._take_script(
+            keys=[key for key, _ in buckets],
+            args=[now] + [per_minute for _, per_minute in buckets]
+        )
+        return float(result)
+
+    def close(self):
+        self._client.close()
+
+
+def create_state_backend(url: str) -> StateBackend:
+    """按URL创建状态后端"""
+    if not url or url == "memory":
+        return MemoryStateBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteStateBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateBackend(url)
+    raise ValueError(f"不支持的状态后端: {url}")
+
+
+# 进程级状态后端
+state_backend = create_state_backend(os.getenv("STATE_BACKEND", "memory"))
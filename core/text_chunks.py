@@ -0,0 +1,57 @@
+"""
+长文本分块
+把超过LLM输入上限的转录文本按片段（换行）和句子边界切成不超过上限的块，
+分块后按顺序拼接能还原原文
+"""
+
+import re
+from typing import List
+
+# 句末标点之后切分；英文句号等后面需跟空白，避免切开小数和缩写
+SENTENCE_BOUNDARY = re.compile(r"(?<=[。！？；…!?;])|(?<=[.!?])(?=\s)")
+
+
+def _hard_split(text: str, max_chars: int) -> List[str]:
+    """没有句子边界的超长文本：尽量在空白处切开，否则按长度硬切"""
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars) + 1
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut])
+        text = text[cut:]
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def _pieces(text: str, max_chars: int) -> List[str]:
+    """切成不超过 max_chars 的最小单位：片段，过长的片段再按句子切"""
+    pieces = []
+    for segment in text.splitlines(keepends=True):
+        if len(segment) <= max_chars:
+            pieces.append(segment)
+            continue
+        for sentence in SENTENCE_BOUNDARY.split(segment):
+            if sentence:
+                pieces.extend(_hard_split(sentence, max_chars))
+    return pieces
+
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """把文本贪心地合并成尽量少的块，每块不超过 max_chars 个字符"""
+    if max_chars <= 0:
+        raise ValueError("max_chars 必须大于0")
+    if len(text) <= max_chars:
+        return [text]
+
+    chunks = []
+    current = ""
+    for piece in _pieces(text, max_chars):
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return chunks
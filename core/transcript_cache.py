@@ -0,0 +1,176 @@
+"""
+转录结果缓存
+以上传内容的SHA-256和解码参数为键，将转录结果持久化到磁盘，按总大小做LRU淘汰；
+多个工作进程可以共用同一个缓存目录
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(media_sha256: str, **params) -> str:
+    """由媒体内容哈希和影响转录结果的参数（模型、语言、beam_size、VAD等）生成缓存键"""
+    payload = json.dumps({"media": media_sha256, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def file_sha256(path, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件内容的SHA-256（用于非上传来源的媒体，如按URL下载的音频）"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class TranscriptCache:
+    """磁盘转录缓存
+
+    每条结果保存为 cache_dir/<key前2位>/<key>.json，文件修改时间即最近访问时间，
+    进程重启后按修改时间重建LRU顺序。总大小超过 max_bytes 时淘汰最久未访问的条目。
+
+    多个工作进程共用缓存目录时，内存索引中没有的键会再查磁盘（其他进程写入的结果），
+    写入时每隔 sync_interval 秒按磁盘重建索引，使淘汰按整个目录的大小进行
+    （目录大小最多超出 max_bytes 一个同步周期内其他进程写入的量）。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024, sync_interval: float = 60.0):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+        self._load_index()
+        logger.info(f"转录缓存已加载: {len(self._entries)} 条, {self._total_bytes} bytes")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存，命中时刷新访问时间；索引中没有时查找其他进程写入的文件"""
+        path = self._path(key)
+        with self._lock:
+            indexed = key in self._entries
+            if indexed:
+                self._entries.move_to_end(key)
+        try:
+            data = path.read_bytes()
+            value = json.loads(data.decode("utf-8"))
+            os.utime(path)
+        except FileNotFoundError:
+            # 未缓存，或已被其他进程淘汰
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"转录缓存读取失败: {key}, {str(e)}")
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = len(data)
+                self._total_bytes += len(data)
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """写入缓存（先写临时文件再原子替换），然后按大小淘汰"""
+        path = self._path(key)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"转录缓存写入失败: {key}, {str(e)}")
+            return
+        with self._lock:
+            if time.monotonic() - self._synced_at >= self.sync_interval:
+                # 纳入其他进程写入的条目，按整个目录的大小淘汰
+                self._load_index()
+            else:
+                self._forget(key)
+                self._entries[key] = len(data)
+                self._total_bytes += len(data)
+            self._evict()
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total_bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _forget(self, key: str):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+            logger.info(f"淘汰转录缓存: {key}")
+
+    def _load_index(self):
+        """按磁盘上的文件重建索引（按修改时间排列LRU顺序），需持有锁或在初始化时调用"""
+        self._synced_at = time.monotonic()
+        if not self.cache_dir.exists():
+            return
+        entries = []
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        self._entries.clear()
+        self._total_bytes = 0
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+        logger.debug(f"转录缓存索引已同步: {len(self._entries)} 条, {self._total_bytes} bytes")
+
+
+# 默认转录缓存，TRANSCRIPT_CACHE_DIR 设为空字符串时禁用
+TRANSCRIPT_CACHE_DIR = os.getenv("TRANSCRIPT_CACHE_DIR", "/tmp/transcript_cache")
+transcript_cache = TranscriptCache(
+    TRANSCRIPT_CACHE_DIR,
+    max_bytes=int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "256")) * 1024 * 1024,
+) if TRANSCRIPT_CACHE_DIR else None
@@ -0,0 +1,345 @@
+"""
+流式上传处理
+边接收 multipart 上传边把视频数据写入 ffmpeg 的标准输入，使音频提取与网络传输重叠；
+无法从管道解析的容器（如 moov 在文件末尾的 MP4）则以异步IO落盘，之后再提取音频
+"""
+
+import time
+import shutil
+import hashlib
+import asyncio
+import logging
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import anyio
+import numpy as np
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from core.whisper_transcribe import SAMPLE_RATE, pcm_to_float32
+
+logger = logging.getLogger(__name__)
+
+# 可以直接从管道顺序解析的容器
+STREAMABLE_SUFFIXES = {".webm", ".mkv", ".ts", ".mts", ".m2ts", ".flv", ".mpg", ".mpeg", ".ogv", ".ogg"}
+# ISO BMFF 容器，只有 moov 在 mdat 之前（faststart）或分片MP4时才能流式解析
+ISO_BMFF_SUFFIXES = {".mp4", ".m4v", ".mov", ".m4a", ".3gp"}
+# 判断是否可流式处理前缓冲的字节数
+SNIFF_BYTES = 64 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    """上传超过大小限制"""
+
+
+class UnsupportedMediaError(ValueError):
+    """上传文件类型不支持"""
+
+
+def _iso_bmff_moov_first(head: bytes) -> bool:
+    """扫描顶层box，moov（或分片MP4的moof）出现在mdat之前时返回True"""
+    offset = 0
+    while offset + 8 <= len(head):
+        size = int.from_bytes(head[offset:offset + 4], "big")
+        box_type = head[offset + 4:offset + 8]
+        if box_type in (b"moov", b"moof"):
+            return True
+        if box_type == b"mdat":
+            return False
+        if size == 1:
+            if offset + 16 > len(head):
+                return False
+            size = int.from_bytes(head[offset + 8:offset + 16], "big")
+        if size < 8:
+            # size为0表示box延伸到文件末尾，无法继续判断
+            return False
+        offset += size
+    return False
+
+
+def is_streamable(suffix: str, head: bytes) -> bool:
+    """根据扩展名和文件头判断容器能否从管道解析"""
+    suffix = suffix.lower()
+    if suffix in STREAMABLE_SUFFIXES:
+        return True
+    if suffix in ISO_BMFF_SUFFIXES:
+        return _iso_bmff_moov_first(head)
+    return False
+
+
+class PipeAudioExtractor:
+    """通过标准输入向 ffmpeg 喂入视频数据，从标准输出收集 16kHz 单声道 s16le 音频"""
+
+    def __init__(self, ffmpeg_binary: str = "ffmpeg"):
+        self.ffmpeg_binary = ffmpeg_binary
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._stdout = bytearray()
+        self._stderr = bytearray()
+        self._readers: List[asyncio.Task] = []
+        self._stdin_closed = False
+
+    async def start(self):
+        self._process = await asyncio.create_subprocess_exec(
+            self.ffmpeg_binary, "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0",
+            "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+            "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        # 同时读取stdout和stderr，避免管道缓冲区写满导致ffmpeg阻塞
+        self._readers = [
+            asyncio.create_task(self._drain(self._process.stdout, self._stdout)),
+            asyncio.create_task(self._drain(self._process.stderr, self._stderr)),
+        ]
+
+    async def feed(self, chunk: bytes):
+        if self._stdin_closed:
+            return
+        try:
+            self._process.stdin.write(chunk)
+            await self._process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg 已退出（通常是输入无法解析），错误在 finish 中报告
+            self._stdin_closed = True
+
+    async def finish(self) -> np.ndarray:
+        """关闭标准输入并等待 ffmpeg 结束，返回 float32 音频"""
+        if not self._stdin_closed:
+            self._stdin_closed = True
+            try:
+                self._process.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        await asyncio.gather(*self._readers)
+        returncode = await self._process.wait()
+        if returncode != 0:
+            lines = self._stderr.decode(errors="ignore").strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f"ffmpeg退出码 {returncode}")
+        return pcm_to_float32(bytes(self._stdout))
+
+    async def abort(self):
+        """终止 ffmpeg 进程"""
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
+        for reader in self._readers:
+            reader.cancel()
+
+    @staticmethod
+    async def _drain(stream: asyncio.StreamReader, buffer: bytearray):
+        while True:
+            data = await stream.read(65536)
+            if not data:
+                break
+            buffer.extend(data)
+
+
+async def iter_multipart(headers, stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple]:
+    """增量解析 multipart 请求体
+
+    依次产出:
+        ("field", name, value)
+        ("file_start", name, filename, content_type)
+        ("file_data", chunk)
+        ("file_end",)
+    """
+    _, params = parse_options_header(headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise ValueError("缺少multipart boundary")
+
+    events: List[Tuple] = []
+    part: Dict = {}
+    header_name = bytearray()
+    header_value = bytearray()
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, data=bytearray(), is_file=False)
+
+    def on_header_field(data, start, end):
+        header_name.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        part["headers"][bytes(header_name).lower()] = bytes(header_value)
+        header_name.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = options.get(b"name", b"").decode("utf-8", errors="replace")
+        if b"filename" in options:
+            part["is_file"] = True
+            content_type = part["headers"].get(b"content-type", b"").decode("latin-1")
+            filename = options[b"filename"].decode("utf-8", errors="replace")
+            events.append(("file_start", part["name"], filename, content_type))
+
+    def on_part_data(data, start, end):
+        if part["is_file"]:
+            events.append(("file_data", bytes(data[start:end])))
+        else:
+            part["data"].extend(data[start:end])
+
+    def on_part_end():
+        if part["is_file"]:
+            events.append(("file_end",))
+        else:
+            events.append(("field", part["name"], part["data"].decode("utf-8", errors="replace")))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    async for chunk in stream:
+        parser.write(chunk)
+        for event in events:
+            yield event
+        events.clear()
+    parser.finalize()
+    for event in events:
+        yield event
+
+
+@dataclass
+class ReceivedUpload:
+    """接收完成的上传：audio（已流式提取）和 video_path（已落盘）二者之一有值"""
+
+    filename: str = ""
+    content_type: str = ""
+    size: int = 0
+    fields: Dict[str, str] = field(default_factory=dict)
+    audio: Optional[np.ndarray] = None
+    video_path: Optional[Path] = None
+    work_dir: Optional[Path] = None
+    streamed: bool = False
+    # 接收文件part的耗时（包含客户端上传的网络时间）
+    upload_time: float = 0.0
+    # 流式提取时，上传结束（关闭ffmpeg标准输入）到音频提取完成的耗时
+    audio_time: float = 0.0
+    sha256: str = ""
+
+    def cleanup(self):
+        """删除落盘的临时目录"""
+        if self.work_dir is not None:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+class _UploadSink:
+    """单个文件part的写入目标：先缓冲文件头判断容器类型，再选择ffmpeg管道或磁盘"""
+
+    def __init__(self, upload: ReceivedUpload, max_bytes: int, stream_audio: bool):
+        self.upload = upload
+        self.max_bytes = max_bytes
+        self.stream_audio = stream_audio
+        self.head = bytearray()
+        self.extractor: Optional[PipeAudioExtractor] = None
+        self.file = None
+        self.started_at = time.time()
+        self.hasher = hashlib.sha256()
+
+    async def write(self, chunk: bytes):
+        self.upload.size += len(chunk)
+        if self.upload.size > self.max_bytes:
+            raise UploadTooLargeError(f"文件大小超过限制: {self.max_bytes} bytes")
+        self.hasher.update(chunk)
+        if self.extractor is None and self.file is None:
+            self.head.extend(chunk)
+            if len(self.head) >= SNIFF_BYTES:
+                await self._open()
+            return
+        await self._write(chunk)
+
+    async def close(self):
+        self.upload.sha256 = self.hasher.hexdigest()
+        if self.extractor is None and self.file is None:
+            await self._open()
+        received_at = time.time()
+        self.upload.upload_time = received_at - self.started_at
+        if self.extractor is not None:
+            self.upload.audio = await self.extractor.finish()
+            self.upload.audio_time = time.time() - received_at
+        else:
+            await self.file.aclose()
+
+    async def abort(self):
+        if self.extractor is not None:
+            await self.extractor.abort()
+        if self.file is not None:
+            await self.file.aclose()
+
+    async def _open(self):
+        suffix = Path(self.upload.filename).suffix
+        if self.stream_audio and is_streamable(suffix, bytes(self.head)):
+            logger.info(f"流式提取音频: {self.upload.filename}")
+            self.upload.streamed = True
+            self.extractor = PipeAudioExtractor()
+            await self.extractor.start()
+        else:
+            self.upload.work_dir = Path(tempfile.mkdtemp(prefix="transcribe_"))
+            self.upload.video_path = self.upload.work_dir / f"input{suffix}"
+            logger.info(f"容器不支持流式解析，保存视频文件到: {self.upload.video_path}")
+            self.file = await anyio.open_file(self.upload.video_path, "wb")
+        head, self.head = bytes(self.head), bytearray()
+        if head:
+            await self._write(head)
+
+    async def _write(self, chunk: bytes):
+        if self.extractor is not None:
+            await self.extractor.feed(chunk)
+        else:
+            await self.file.write(chunk)
+
+
+async def receive_upload(headers, stream: AsyncIterator[bytes], max_bytes: int,
+                         file_field: str = "file", stream_audio: bool = True) -> ReceivedUpload:
+    """接收单文件 multipart 上传
+
+    文件part的 Content-Type 必须为 video/*，否则抛出 UnsupportedMediaError；
+    超过 max_bytes 时抛出 UploadTooLargeError；缺少文件part或请求体在文件结束前中断时抛出 ValueError。
+    出错时已创建的临时文件和进程都会被清理。
+    """
+    upload = ReceivedUpload()
+    sink: Optional[_UploadSink] = None
+    receiving = False
+    try:
+        async for event in iter_multipart(headers, stream):
+            kind = event[0]
+            if kind == "field":
+                upload.fields[event[1]] = event[2]
+            elif kind == "file_start" and event[1] == file_field and sink is None:
+                upload.filename, upload.content_type = event[2], event[3]
+                if not upload.content_type.startswith("video/"):
+                    raise UnsupportedMediaError(f"不支持的文件类型: {upload.content_type}")
+                sink = _UploadSink(upload, max_bytes, stream_audio)
+                receiving = True
+            elif kind == "file_data" and receiving:
+                await sink.write(event[1])
+            elif kind == "file_end" and receiving:
+                receiving = False
+                await sink.close()
+        if sink is None:
+            raise ValueError("缺少上传文件")
+        if receiving:
+            raise ValueError("上传不完整：请求体在文件结束前中断")
+        return upload
+    except BaseException:
+        if sink is not None:
+            await sink.abort()
+        upload.cleanup()
+        raise
@@ -1,33 +1,107 @@
+import os
 import tempfile
 from pathlib import Path
-import ffmpeg
-from faster_whisper import WhisperModel
+from typing import Optional, Union
 import logging
+import numpy as np
+from core.model_registry import model_registry
 
-def whisper_transcribe(video_path: str, language: str = "auto") -> str:
+DEFAULT_MODEL = "tiny"
+
+# Whisper输入格式：16kHz 单声道
+SAMPLE_RATE = 16000
+
+# 音频提取模式
+# memory: ffmpeg 输出 s16le 到管道，直接转为 float32 数组交给 faster-whisper，不落盘
+# file:   ffmpeg 写入临时WAV文件，再由 faster-whisper 读取解码
+AUDIO_PIPELINE = os.getenv("AUDIO_PIPELINE", "memory")
+
+AudioInput = Union[np.ndarray, str]
+
+def get_model(name: str = DEFAULT_MODEL, device: str = "cpu", compute_type: str = "int8"):
+    """
+    获取进程内共享的Whisper模型。按 (name, device, compute_type) 缓存，线程安全，
+    首次调用时加载，之后的调用直接复用。
+    """
+    return model_registry.get(name, device=device, compute_type=compute_type)
+
+def pcm_to_float32(data: bytes) -> np.ndarray:
+    """
+    将 s16le PCM 字节转换为 [-1, 1) 范围的 float32 数组（faster-whisper 的数组输入格式）。
+    """
+    return np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+
+def extract_audio_pcm(video_path: str) -> np.ndarray:
+    """
+    通过管道提取 16kHz 单声道音频，返回 float32 数组。
+    """
+    import ffmpeg
+    
+    try:
+        out, _ = (
+            ffmpeg.input(str(video_path))
+            .output('pipe:', format='s16le', acodec='pcm_s16le', ac=1, ar=str(SAMPLE_RATE))
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+    except ffmpeg.Error as e:
+        stderr = e.stderr.decode(errors="ignore").strip().splitlines() if e.stderr else []
+        raise RuntimeError(stderr[-1] if stderr else str(e))
+    return pcm_to_float32(out)
+
+def extract_audio_file(video_path: str, audio_path: str) -> str:
+    """
+    提取 16kHz 单声道 WAV 文件，返回文件路径。
+    """
+    import ffmpeg
+    
+    stream = ffmpeg.input(str(video_path))
+    stream = ffmpeg.output(stream, str(audio_path), acodec='pcm_s16le', ac=1, ar=str(SAMPLE_RATE))
+    ffmpeg.run(stream, overwrite_output=True, quiet=True)
+    return str(audio_path)
+
+def extract_audio(video_path: str, work_dir: Optional[str] = None, mode: Optional[str] = None) -> AudioInput:
+    """
+    按 AUDIO_PIPELINE 模式提取音频，返回值可直接传给 model.transcribe：
+    memory 模式返回 float32 数组，file 模式返回 work_dir 下的 WAV 路径
+    （文件名取自输入文件名，同一目录中的多个输入可以并发提取）。
+    """
+    mode = mode or AUDIO_PIPELINE
+    if mode == "memory":
+        return extract_audio_pcm(video_path)
+    if mode == "file":
+        if work_dir is None:
+            raise ValueError("file 模式需要指定 work_dir")
+        return extract_audio_file(video_path, str(Path(work_dir) / f"{Path(video_path).stem}.audio.wav"))
+    raise ValueError(f"不支持的音频提取模式: {mode}")
+
+def audio_duration(audio: AudioInput) -> Optional[float]:
+    """
+    返回音频时长（秒），仅内存模式可直接得到。
+    """
+    if isinstance(audio, np.ndarray):
+        return len(audio) / SAMPLE_RATE
+    return None
+
+def whisper_transcribe(video_path: str, language: str = "auto", model_name: str = DEFAULT_MODEL) -> str:
     """
     输入视频文件路径，返回转录文本。language为'auto'时自动检测，否则指定语言。
     """
     logger = logging.getLogger(__name__)
     # 1. 提取音频
     with tempfile.TemporaryDirectory() as temp_dir:
-        temp_path = Path(temp_dir)
-        audio_path = temp_path / "audio.wav"
         try:
-            stream = ffmpeg.input(str(video_path))
-            stream = ffmpeg.output(stream, str(audio_path), acodec='pcm_s16le', ac=1, ar='16000')
-            ffmpeg.run(stream, overwrite_output=True, quiet=True)
+            audio = extract_audio(video_path, temp_dir)
         except Exception as e:
             logger.error(f"音频提取失败: {str(e)}")
             raise RuntimeError(f"音频提取失败: {str(e)}")
 
-        # 2. 加载Whisper模型
+        # 2. 获取共享的Whisper模型（仅首次调用时加载）
         try:
-            model = WhisperModel("tiny", device="cpu", compute_type="int8")
+            model = get_model(model_name)
             transcribe_params = {}
             if language != "auto":
                 transcribe_params["language"] = language
-            segments, info = model.transcribe(str(audio_path), **transcribe_params)
+            segments, info = model.transcribe(audio, **transcribe_params)
             text = " ".join([seg.text.strip() for seg in segments if seg.text.strip()])
             return text
         except Exception as e:
@@ -1,47 +1,126 @@
 import os
+import hashlib
 import tempfile
-import yt_dlp
+from urllib.parse import urlsplit
 from pathlib import Path
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 转录只需要音频：选择最好的纯音频流，直接保存原始容器（m4a/webm等），不重新编码；
+# 没有纯音频流时退回到包含音频的最好格式
+AUDIO_FORMAT = 'bestaudio/best'
+
+# 各平台允许使用的yt-dlp提取器（按提取器名匹配的正则）；未开启 allow_generic 时只加载这些提取器，
+# 避免yt-dlp退回通用提取器去访问任意地址
+PLATFORM_EXTRACTORS = {
+    'youtube': ['youtube'],
+    'bilibili': ['bilibili.*'],
+}
+
+# 各平台的单视频提取器。下载时设置了 noplaylist，带播放列表参数的单视频URL（watch?v=...&list=...）
+# 下载的是该视频本身，规范ID也必须按单视频提取器解析，而不是播放列表提取器
+PLATFORM_VIDEO_EXTRACTORS = {
+    'youtube': 'Youtube',
+    'bilibili': 'BiliBili',
+}
+
 class VideoDownloader:
-    """视频下载器，支持YouTube和Bilibili"""
+    """视频下载器，支持YouTube和Bilibili
+
+    allow_generic 为 True 时其他 http(s) URL 交给 yt-dlp 的通用提取器处理
+    （会访问任意地址，只应在受信任的环境中开启）；
+    max_filesize 限制下载的文件大小（字节）。
+    """
     
-    def __init__(self):
+    def __init__(self, allow_generic=False, max_filesize=None):
         self.supported_platforms = {
             'youtube': ['youtube.com', 'youtu.be'],
             'bilibili': ['bilibili.com', 'b23.tv']
         }
+        self.allow_generic = allow_generic
+        self.max_filesize = max_filesize
     
     def detect_platform(self, url):
-        """检测视频平台"""
-        url_lower = url.lower()
+        """按URL的主机名检测视频平台（主机名等于平台域名或是其子域名），只接受 http/https"""
+        try:
+            parts = urlsplit(url.strip())
+            hostname = parts.hostname
+        except ValueError:
+            return None
+        if parts.scheme.lower() not in ('http', 'https') or not hostname:
+            return None
         for platform, domains in self.supported_platforms.items():
-            if any(domain in url_lower for domain in domains):
+            if any(hostname == domain or hostname.endswith('.' + domain) for domain in domains):
                 return platform
+        if self.allow_generic:
+            return 'generic'
         return None
     
-    def download_youtube(self, url, output_dir):
-        """下载YouTube视频"""
+    def extract_id(self, url):
+        """返回 "提取器-视频ID" 形式的规范ID，同一视频的不同URL写法（如 youtu.be 短链）得到相同ID
+
+        ID按平台单视频提取器的URL规则解析，不访问网络（与下载一致忽略播放列表参数）；
+        其他URL（通用提取器、播放列表等）无法据此确定视频，改用完整URL的哈希。
+        """
+        from yt_dlp.extractor import get_info_extractor
+        
+        ie_key = PLATFORM_VIDEO_EXTRACTORS.get(self.detect_platform(url))
+        if ie_key is not None:
+            ie = get_info_extractor(ie_key)
+            # suitable() 对带 list 参数的URL返回 False（交给播放列表提取器），这里直接匹配URL规则
+            if ie._match_valid_url(url):
+                video_id = ie.get_temp_id(url)
+                if video_id:
+                    return f"{ie_key}-{video_id}"
+        return f"Generic-{hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]}"
+    
+    def _download(self, url, output_dir, format_spec, outtmpl, label):
+        """用yt-dlp下载单个视频，返回保存的文件路径"""
+        # yt-dlp 导入较慢，只在实际下载时导入
+        import yt_dlp
+        
         ydl_opts = {
-            'format': 'best[height<=720]',  # 限制质量
-            'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'),
+            'format': format_spec,
+            'outtmpl': os.path.join(output_dir, outtmpl),
+            'noplaylist': True,
             'quiet': True,
+            'noprogress': True,
             'no_warnings': True
         }
+        if self.max_filesize:
+            ydl_opts['max_filesize'] = self.max_filesize
+        if not self.allow_generic:
+            platform = self.detect_platform(url)
+            if platform not in PLATFORM_EXTRACTORS:
+                raise ValueError(f"不支持的视频平台: {url}")
+            ydl_opts['allowed_extractors'] = PLATFORM_EXTRACTORS[platform]
         
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                logger.info(f"开始下载YouTube视频: {url}")
+                logger.info(f"开始下载{label}: {url}")
                 info = ydl.extract_info(url, download=True)
-                video_path = ydl.prepare_filename(info)
-                logger.info(f"YouTube视频下载完成: {video_path}")
-                return video_path
+                path = ydl.prepare_filename(info)
         except Exception as e:
-            logger.error(f"YouTube下载失败: {str(e)}")
+            logger.error(f"{label}下载失败: {str(e)}")
             raise
+        if not os.path.exists(path):
+            # 超过 max_filesize 时yt-dlp跳过下载，不会报错
+            raise RuntimeError(f"{label}下载失败: 未生成文件，可能超过大小限制")
+        logger.info(f"{label}下载完成: {path}")
+        return path
+    
+    def download_youtube(self, url, output_dir, audio_only=False):
+        """下载YouTube视频，audio_only 时只下载音频流"""
+        if audio_only:
+            return self._download(url, output_dir, AUDIO_FORMAT, '%(id)s.%(ext)s', "YouTube音频")
+        # 限制质量
+        return self._download(url, output_dir, 'best[height<=720]', '%(title)s.%(ext)s', "YouTube视频")
+    
+    def download_generic(self, url, output_dir, audio_only=False):
+        """通过yt-dlp通用提取器下载（直链媒体文件或内嵌视频的网页）"""
+        format_spec = AUDIO_FORMAT if audio_only else 'best'
+        return self._download(url, output_dir, format_spec, '%(id)s.%(ext)s', "音频" if audio_only else "视频")
     
     def download_bilibili(self, url, output_dir):
         """下载Bilibili视频（需要额外实现）"""
@@ -50,21 +129,27 @@ class VideoDownloader:
         logger.warning("Bilibili下载功能需要额外实现")
         raise NotImplementedError("Bilibili下载功能暂未实现")
     
-    def download_video(self, url, output_dir=None):
-        """通用视频下载接口"""
+    def download_video(self, url, output_dir=None, audio_only=False):
+        """通用视频下载接口，audio_only 时只下载音频（用于转录）"""
         if output_dir is None:
-            output_dir = tempfile.mkdtemp()
+            output_dir = tempfile.mkdtemp(prefix='video_download_')
         
         platform = self.detect_platform(url)
         if not platform:
             raise ValueError(f"不支持的视频平台: {url}")
         
         if platform == 'youtube':
-            return self.download_youtube(url, output_dir)
+            return self.download_youtube(url, output_dir, audio_only=audio_only)
         elif platform == 'bilibili':
             return self.download_bilibili(url, output_dir)
+        elif platform == 'generic':
+            return self.download_generic(url, output_dir, audio_only=audio_only)
         else:
             raise ValueError(f"不支持的平台: {platform}")
+    
+    def download_audio(self, url, output_dir=None):
+        """只下载音频，数据量通常不到完整视频的十分之一"""
+        return self.download_video(url, output_dir, audio_only=True)
 
 # 使用示例
 if __name__ == "__main__":
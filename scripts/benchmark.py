@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+转录流水线离线基准测试
+
+用 ffmpeg lavfi 数据源在本地生成确定性的合成音视频样本（无需网络），
+分别计时 ffmpeg 音频提取、模型加载、model.transcribe 和后处理，
+按模型输出实时率(RTF)、峰值RSS和每秒段数，结果为JSON，便于在版本之间比较回归。
+
+用法:
+    python -m scripts.benchmark --models tiny base --durations 30 120 --output bench.json
+    python -m scripts.benchmark --baseline bench.json   # RTF 比基线慢超过容差时以非零状态退出
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from core.whisper_transcribe import extract_audio, audio_duration
+from core.model_registry import ModelRegistry, AVAILABLE_MODELS
+from core.postprocess import LoopDetector
+
+# 与 app.TRANSCRIBE_PARAMS 保持一致
+BENCH_PARAMS = {
+    'beam_size': 5,
+    'vad_filter': True,
+    'vad_parameters': dict(min_silence_duration_ms=500),
+    'word_timestamps': True,
+    'condition_on_previous_text': False,
+}
+
+# 合成音频：带停顿的调幅音调 + 少量固定种子噪声，模拟语音的起伏和静音，使VAD和分段有事可做
+AUDIO_SOURCE = (
+    "sine=frequency=220:duration={d}:sample_rate=44100,"
+    "volume='if(lt(mod(t,4),3),0.5*(1+sin(2*PI*3*t)),0)':eval=frame[tone];"
+    "anoisesrc=duration={d}:color=pink:amplitude=0.02:seed=42:sample_rate=44100[noise];"
+    "[tone][noise]amix=inputs=2:duration=shortest"
+)
+VIDEO_SOURCE = "testsrc=duration={d}:size=320x240:rate=15"
+
+DEFAULT_DURATIONS = [30, 120]
+DEFAULT_FIXTURE_DIR = Path("/tmp/transcribe_bench")
+
+
+def make_fixture(duration: int, fixture_dir: Path = DEFAULT_FIXTURE_DIR) -> Path:
+    """生成 duration 秒的合成MP4（H.264 + AAC），已存在则直接复用"""
+    fixture_dir.mkdir(parents=True, exist_ok=True)
+    path = fixture_dir / f"synthetic_{duration}s.mp4"
+    if path.exists():
+        return path
+    tmp_path = path.with_suffix(".tmp.mp4")
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", VIDEO_SOURCE.format(d=duration),
+        "-f", "lavfi", "-i", AUDIO_SOURCE.format(d=duration),
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "64k", "-shortest",
+        "-fflags", "+bitexact", "-map_metadata", "-1",
+        str(tmp_path)
+    ], check=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def peak_rss_mb() -> Optional[float]:
+    """当前进程的峰值常驻内存（MB），不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 为字节
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def benchmark_fixture(model, fixture: Path, params: Dict[str, Any] = None) -> Dict[str, Any]:
+    """对单个样本分别计时提取、转录和后处理"""
+    start = time.perf_counter()
+    audio = extract_audio(fixture, fixture.parent)
+    extract_seconds = time.perf_counter() - start
+    duration = audio_duration(audio)
+
+    start = time.perf_counter()
+    segments, info = model.transcribe(audio, **(params or BENCH_PARAMS))
+    # segments 是惰性生成器，解码在迭代时进行
+    segments = list(segments)
+    transcribe_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    detector = LoopDetector()
+    texts = [detector.feed(segment.text.strip()) for segment in segments]
+    full_text = " ".join(text for text in texts if text)
+    postprocess_seconds = time.perf_counter() - start
+
+    total = extract_seconds + transcribe_seconds + postprocess_seconds
+    return {
+        "fixture": fixture.name,
+        "audio_seconds": duration,
+        "extract_seconds": extract_seconds,
+        "transcribe_seconds": transcribe_seconds,
+        "postprocess_seconds": postprocess_seconds,
+        "total_seconds": total,
+        "rtf": total / duration if duration else None,
+        "segments": len(segments),
+        "characters": len(full_text),
+        "segments_per_second": len(segments) / transcribe_seconds if transcribe_seconds else None,
+    }
+
+
+def benchmark_model(model_name: str, fixtures: List[Path],
+                    loader: Optional[Callable[[str, str, str], Any]] = None) -> Dict[str, Any]:
+    """在当前进程中加载模型并跑完所有样本"""
+    registry = ModelRegistry(max_models=1, memory_budget_mb=1 << 20, loader=loader)
+    start = time.perf_counter()
+    model = registry.get(model_name)
+    load_seconds = time.perf_counter() - start
+    runs = [benchmark_fixture(model, fixture) for fixture in fixtures]
+    return {
+        "model": model_name,
+        "load_seconds": load_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+        "runs": runs,
+    }
+
+
+def run_suite(models: List[str], durations: List[int], fixture_dir: Path = DEFAULT_FIXTURE_DIR) -> Dict[str, Any]:
+    """每个模型在独立的子进程中运行，使峰值RSS和加载耗时互不影响"""
+    fixtures = [make_fixture(duration, fixture_dir) for duration in durations]
+    results = []
+    for model_name in models:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results.append(executor.submit(benchmark_model, model_name, fixtures).result())
+    return {"meta": _environment(), "results": results}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """返回RTF相对基线变慢超过 tolerance 的条目"""
+    base_rtf = {
+        (result["model"], run["fixture"]): run["rtf"]
+        for result in baseline["results"] for run in result["runs"]
+    }
+    regressions = []
+    for result in current["results"]:
+        for run in result["runs"]:
+            before = base_rtf.get((result["model"], run["fixture"]))
+            if before and run["rtf"] and run["rtf"] > before * (1 + tolerance):
+                regressions.append(f"{result['model']}/{run['fixture']}: RTF {before:.3f} -> {run['rtf']:.3f}")
+    return regressions
+
+
+def _environment() -> Dict[str, Any]:
+    try:
+        ffmpeg_version = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.split("\n")[0]
+    except OSError:
+        ffmpeg_version = None
+    try:
+        import faster_whisper
+        faster_whisper_version = getattr(faster_whisper, "__version__", None)
+    except ImportError:
+        faster_whisper_version = None
+    return {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version,
+        "faster_whisper": faster_whisper_version,
+        "params": BENCH_PARAMS,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="转录流水线离线基准测试")
+    parser.add_argument("--models", nargs="+", default=["tiny"], choices=AVAILABLE_MODELS)
+    parser.add_argument("--durations", nargs="+", type=int, default=DEFAULT_DURATIONS, help="合成样本时长（秒）")
+    parser.add_argument("--fixture-dir", type=Path, default=DEFAULT_FIXTURE_DIR)
+    parser.add_argument("--output", type=Path, help="结果JSON输出路径，默认打印到标准输出")
+    parser.add_argument("--baseline", type=Path, help="与之比较的历史结果JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的RTF变慢比例")
+    args = parser.parse_args()
+
+    report = run_suite(args.models, args.durations, args.fixture_dir)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(output, encoding="utf-8")
+    else:
+        print(output)
+
+    for result in report["results"]:
+        for run in result["runs"]:
+            rtf = f"{run['rtf']:.3f}" if run["rtf"] is not None else "n/a"
+            print(f"{result['model']:>6} {run['fixture']:>20}  RTF {rtf}  "
+                  f"提取 {run['extract_seconds']:.2f}s  转录 {run['transcribe_seconds']:.2f}s  "
+                  f"后处理 {run['postprocess_seconds'] * 1000:.1f}ms  {run['segments_per_second'] or 0:.1f} 段/秒",
+                  file=sys.stderr)
+        rss = result["peak_rss_mb"]
+        print(f"{result['model']:>6} 加载 {result['load_seconds']:.2f}s  峰值RSS {f'{rss:.0f}MB' if rss else '未知'}",
+              file=sys.stderr)
+
+    if args.baseline:
+        regressions = compare(report, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        for line in regressions:
+            print(f"性能回归: {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
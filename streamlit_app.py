@@ -1,6 +1,5 @@
 import streamlit as st
-from openai import OpenAI
-from core.whisper_transcribe import whisper_transcribe
+# openai 和转录依赖（numpy、ffmpeg、faster-whisper）在首次使用时才导入，打开页面不必等待这些导入
 from core.languages import LANGUAGES, get_text
 import tempfile
 import time
@@ -32,6 +31,7 @@ if video_file:
         for percent in range(0, 100, 10):
             time.sleep(0.1)
             progress_bar.progress(percent)
+        from core.whisper_transcribe import whisper_transcribe
         text = whisper_transcribe(video_path, language=transcribe_lang)
         progress_bar.progress(100)
         st.success(get_text(lang, "transcribe_success"))
@@ -47,6 +47,7 @@ if video_file:
         api_key = api_key.strip()
         base_url = base_url.strip()
         if st.button(get_text(lang, "llm_btn")):
+            from openai import OpenAI
             client = OpenAI(api_key=api_key, base_url=base_url)
             try:
                 completion = client.chat.completions.create(
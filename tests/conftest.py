@@ -0,0 +1,18 @@
+"""
+测试公共夹具
+"""
+
+import pytest
+
+from config.sandbox_config import sandbox_manager
+from core.rate_limit import RateLimiter
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limiter(monkeypatch):
+    """每个测试使用新的限流器，避免不同测试的请求累计到同一个令牌桶"""
+    config = sandbox_manager.config
+    monkeypatch.setattr(
+        sandbox_manager, "rate_limiter",
+        RateLimiter(config.max_requests_per_minute, config.max_global_requests_per_minute)
+    )
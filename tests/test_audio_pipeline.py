@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+音频提取管道测试
+"""
+
+import shutil
+import subprocess
+import wave
+
+import numpy as np
+import pytest
+
+from core.whisper_transcribe import SAMPLE_RATE, extract_audio, pcm_to_float32
+
+
+def test_pcm_to_float32():
+    """s16le 字节转换为 [-1, 1) 范围的 float32"""
+    pcm = np.array([0, 16384, -32768, 32767], dtype=np.int16).tobytes()
+    audio = pcm_to_float32(pcm)
+    assert audio.dtype == np.float32
+    np.testing.assert_allclose(audio, [0.0, 0.5, -1.0, 32767 / 32768], rtol=1e-6)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="需要ffmpeg")
+def test_memory_pipeline_matches_wav(tmp_path):
+    """内存管道与WAV文件模式得到相同的采样"""
+    video_path = tmp_path / "tone.mkv"
+    subprocess.run(
+        ["ffmpeg", "-y", "-f", "lavfi", "-i", "sine=frequency=440:duration=2",
+         "-f", "lavfi", "-i", "color=size=64x64:duration=2", "-shortest", str(video_path)],
+        check=True, capture_output=True
+    )
+
+    audio = extract_audio(str(video_path), mode="memory")
+    wav_path = extract_audio(str(video_path), str(tmp_path), mode="file")
+    with wave.open(wav_path) as wav:
+        assert wav.getframerate() == SAMPLE_RATE
+        expected = pcm_to_float32(wav.readframes(wav.getnframes()))
+
+    assert audio.dtype == np.float32
+    assert abs(len(audio) / SAMPLE_RATE - 2.0) < 0.1
+    np.testing.assert_array_equal(audio, expected)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="需要ffmpeg")
+def test_file_pipeline_outputs_do_not_collide(tmp_path):
+    """同一目录中的多个输入（如批量上传）在 file 模式下提取到不同的WAV，不会相互覆盖"""
+    durations = {"0001.mkv": 1, "0002.mkv": 2}
+    for name, duration in durations.items():
+        subprocess.run(
+            ["ffmpeg", "-y", "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}", str(tmp_path / name)],
+            check=True, capture_output=True
+        )
+
+    paths = {name: extract_audio(str(tmp_path / name), str(tmp_path), mode="file") for name in durations}
+    assert len(set(paths.values())) == 2
+    for name, wav_path in paths.items():
+        with wave.open(wav_path) as wav:
+            assert abs(wav.getnframes() / SAMPLE_RATE - durations[name]) < 0.1
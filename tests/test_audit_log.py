@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+审计日志测试：JSONL格式、轮转、队列溢出策略，以及请求路径上的写入开销
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from config.sandbox_config import SandboxConfig, SandboxManager
+from core.audit_log import OVERFLOW_BLOCK, AuditLogWriter
+
+# 请求路径上单次写入（入队）的平均耗时预算（微秒）
+WRITE_BUDGET_US = float(os.getenv("AUDIT_WRITE_BUDGET_US", "20"))
+
+
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_have_real_ids_and_timestamps(tmp_path):
+    """每条记录都有独立的请求ID和当前时间戳，不包含API密钥"""
+    writer = AuditLogWriter(str(tmp_path / "audit.jsonl"))
+    manager = SandboxManager(SandboxConfig(), audit_writer=writer)
+    for i in range(3):
+        manager.log_request({"provider": "openai", "input": "文本" * i, "api_key": "sk-secret", "style": "polish"})
+    manager.log_request({"request_id": "abc", "provider": "google", "input": "", "status": "failed", "error": "超时"})
+    writer.close()
+
+    records = read_records(tmp_path / "audit.jsonl")
+    assert len(records) == 4
+    assert len({record["request_id"] for record in records}) == 4
+    assert records[-1]["request_id"] == "abc"
+    assert records[-1]["status"] == "failed"
+    assert [record["input_length"] for record in records[:3]] == [0, 2, 4]
+    for record in records:
+        assert abs(datetime.fromisoformat(record["timestamp"]).timestamp() - time.time()) < 60
+    assert "sk-secret" not in (tmp_path / "audit.jsonl").read_text(encoding="utf-8")
+
+
+def test_rotation(tmp_path):
+    """文件超过上限时轮转，只保留 backup_count 个旧文件"""
+    path = tmp_path / "audit.jsonl"
+    writer = AuditLogWriter(str(path), max_bytes=200, backup_count=2, batch_size=1)
+    for i in range(20):
+        writer.write({"index": i, "padding": "x" * 40})
+    writer.close()
+
+    assert sorted(os.listdir(tmp_path)) == ["audit.jsonl", "audit.jsonl.1", "audit.jsonl.2"]
+    assert all(os.path.getsize(tmp_path / name) <= 200 for name in os.listdir(tmp_path))
+    # 当前文件中是最新的记录
+    assert read_records(path)[-1]["index"] == 19
+
+
+def blocked_writer(tmp_path, **kwargs):
+    """后台线程卡在写入中的写入器，返回 (writer, 放行事件)"""
+    writer = AuditLogWriter(str(tmp_path / "audit.jsonl"), queue_size=2, batch_size=1, **kwargs)
+    release = threading.Event()
+    write_batch = writer._write_batch
+
+    def slow_write_batch(records):
+        release.wait()
+        write_batch(records)
+
+    writer._write_batch = slow_write_batch
+    return writer, release
+
+
+def test_overflow_drop(tmp_path):
+    """drop 策略下队列满时立即丢弃，不等待磁盘"""
+    writer, release = blocked_writer(tmp_path)
+    writer.write({"index": 0})
+    # 等后台线程取走第一条并卡在写入中
+    while writer.queue_depth:
+        time.sleep(0.001)
+    results = [True] + [writer.write({"index": i}) for i in range(1, 10)]
+    start = time.perf_counter()
+    assert writer.write({"index": 10}) is False
+    assert time.perf_counter() - start < 0.01
+    release.set()
+    writer.close()
+
+    # 1条正在写入，2条在队列中
+    assert results.count(True) == 3
+    assert writer.dropped == 8
+    assert writer.written == 3
+
+
+def test_overflow_block(tmp_path):
+    """block 策略下队列满时最多等待 block_timeout"""
+    writer, release = blocked_writer(tmp_path, overflow=OVERFLOW_BLOCK, block_timeout=0.1)
+    writer.write({"index": 0})
+    while writer.queue_depth:
+        time.sleep(0.001)
+    for i in range(1, 3):
+        writer.write({"index": i})
+    start = time.perf_counter()
+    assert writer.write({"index": 3}) is False
+    assert time.perf_counter() - start >= 0.1
+
+    threading.Timer(0.05, release.set).start()
+    assert writer.write({"index": 4}) is True
+    writer.close()
+    assert writer.written == 4
+
+
+def test_write_latency_under_load(tmp_path):
+    """4个线程持续写入时，请求路径上的单次写入仍在微秒级，记录全部落盘"""
+    writer = AuditLogWriter(str(tmp_path / "audit.jsonl"), queue_size=1_000_000)
+    threads_count, per_thread = 4, 20000
+    record = {"timestamp": "2024-01-01T00:00:00.000+00:00", "api_provider": "openai", "input_length": 1000}
+
+    def worker():
+        for _ in range(per_thread):
+            writer.write(record)
+
+    threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    writer.close()
+
+    per_write_us = elapsed / (threads_count * per_thread) * 1e6
+    print(f"\n审计日志入队: {per_write_us:.2f}µs/条（预算 {WRITE_BUDGET_US:.0f}µs），"
+          f"共写入 {writer.written} 条")
+    assert writer.written == threads_count * per_thread
+    assert writer.dropped == 0
+    assert per_write_us <= WRITE_BUDGET_US
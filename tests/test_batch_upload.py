@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+批量上传暂存测试：zip展开、大小和数量限制，以及 /transcribe/batch 边接收边暂存（使用假的转录提交）
+"""
+
+import asyncio
+import hashlib
+import io
+import tempfile
+import zipfile
+from pathlib import Path
+
+import httpx
+import pytest
+
+import app as app_module
+from core.batch_upload import BatchLimitError, BatchStager
+
+
+def make_zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def test_zip_entries_staged_inside_work_dir(tmp_path):
+    """zip中的视频解出到工作目录（忽略条目路径），非视频文件标记为失败"""
+    stager = BatchStager(tmp_path, max_file_bytes=1024, max_total_bytes=4096, max_files=10)
+    archive = make_zip({"../../evil.mp4": b"a" * 100, "dir/clip.mkv": b"b" * 50, "readme.txt": b"hi"})
+    items = stager.add(archive, "videos.zip", "application/zip")
+
+    assert [item.error is None for item in items] == [True, True, False]
+    for item in items[:2]:
+        assert item.path.parent == tmp_path
+    assert items[0].sha256 == hashlib.sha256(b"a" * 100).hexdigest()
+    assert stager.total_bytes == 150
+
+
+def test_per_file_and_batch_limits(tmp_path):
+    """单个文件超限只标记该文件，超过批量文件数或总大小时抛出 BatchLimitError"""
+    stager = BatchStager(tmp_path, max_file_bytes=100, max_total_bytes=150, max_files=10)
+    too_big = stager.add(io.BytesIO(b"x" * 150), "big.mp4", "video/mp4")
+    assert too_big[0].error is not None and too_big[0].path is None
+    assert list(tmp_path.iterdir()) == []
+    assert stager.add(io.BytesIO(b"x" * 10), "notes.txt", "text/plain")[0].error is not None
+
+    stager.add(io.BytesIO(b"x" * 100), "a.mp4", "video/mp4")
+    with pytest.raises(BatchLimitError):
+        stager.add(io.BytesIO(b"x" * 100), "b.mp4", "video/mp4")
+
+
+def test_streamed_parts_staged(tmp_path):
+    """逐块写入的视频直接落到工作目录，zip落盘展开后删除压缩包"""
+    stager = BatchStager(tmp_path, max_file_bytes=1024, max_total_bytes=4096, max_files=10)
+    part = stager.begin("a.mp4", "video/mp4")
+    for chunk in (b"a" * 60, b"a" * 40):
+        part.write(chunk)
+    items = part.finish()
+    assert items[0].sha256 == hashlib.sha256(b"a" * 100).hexdigest()
+
+    part = stager.begin("videos.zip", "application/zip")
+    part.write(make_zip({"clip.mkv": b"b" * 50}).getvalue())
+    items += part.finish()
+    assert [item.error for item in items] == [None, None]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["0001.mp4", "0002.mkv"]
+    assert stager.total_bytes == 150
+
+
+def post_batch(files, fields, headers=None):
+    async def main():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/transcribe/batch", files=files, data=fields, headers=headers)
+    return asyncio.run(main())
+
+
+def test_batch_endpoint_streams_parts(monkeypatch):
+    """/transcribe/batch 边接收边暂存，表单字段在文件之后也能读取；请求头声明过大时直接拒绝"""
+    submitted = []
+
+    async def fake_submit(path, sha256, filename, language, model, cleanup=None):
+        submitted.append((Path(path).read_bytes(), language))
+        cleanup()
+        return app_module.job_manager.add_completed({"text": filename, "segments": [], "language": language},
+                                                    filename=filename)
+
+    monkeypatch.setattr(app_module, "_submit_media", fake_submit)
+    work_dirs = set(Path(tempfile.gettempdir()).glob("transcribe_batch_*"))
+    files = [
+        ("files", ("a.mp4", b"a" * 100, "video/mp4")),
+        ("files", ("notes.txt", b"hi", "text/plain")),
+        ("files", ("videos.zip", make_zip({"clip.mkv": b"b" * 50}).getvalue(), "application/zip")),
+    ]
+    response = post_batch(files, {"language": "zh"})
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [item["status"] for item in results] == ["completed", "failed", "completed"]
+    assert results[2]["filename"] == "videos.zip/clip.mkv"
+    assert submitted == [(b"a" * 100, "zh"), (b"b" * 50, "zh")]
+
+    headers = {"content-length": str(app_module.MAX_BATCH_BYTES + 1024 * 1024)}
+    assert post_batch(files, {}, headers=headers).status_code == 400
+    assert post_batch(files, {"model": "huge"}).status_code == 400
+    assert set(Path(tempfile.gettempdir()).glob("transcribe_batch_*")) == work_dirs
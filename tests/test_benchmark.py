@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+离线基准测试脚本的测试（使用假模型，需要ffmpeg）
+"""
+
+import hashlib
+import shutil
+from types import SimpleNamespace
+
+import pytest
+
+from scripts.benchmark import benchmark_model, compare, make_fixture
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="需要ffmpeg")
+
+
+class FakeModel:
+    def transcribe(self, audio, **params):
+        duration = len(audio) / 16000
+        segments = (SimpleNamespace(start=i, end=i + 1.0, text=" thank you") for i in range(int(duration)))
+        return segments, SimpleNamespace(language="en", duration=duration)
+
+
+def test_fixtures_are_deterministic(tmp_path):
+    """同样参数生成的合成样本逐字节相同"""
+    first = make_fixture(2, tmp_path / "a")
+    second = make_fixture(2, tmp_path / "b")
+    assert hashlib.sha256(first.read_bytes()).digest() == hashlib.sha256(second.read_bytes()).digest()
+
+
+def test_benchmark_report(tmp_path):
+    """报告包含各阶段耗时、RTF和段数，并能与基线比较"""
+    fixture = make_fixture(3, tmp_path)
+    result = benchmark_model("tiny", [fixture], loader=lambda *key: FakeModel())
+    run = result["runs"][0]
+    assert run["audio_seconds"] == pytest.approx(3.0, abs=0.1)
+    assert run["segments"] == 3
+    assert run["rtf"] == pytest.approx(run["total_seconds"] / run["audio_seconds"])
+
+    report = {"results": [result]}
+    assert compare(report, report, tolerance=0.0) == []
+    slower = {"results": [dict(result, runs=[dict(run, rtf=run["rtf"] * 2)])]}
+    assert len(compare(slower, report, tolerance=0.2)) == 1
+    # 文件模式下无法得到音频时长，RTF 为 None 时跳过比较
+    unknown = {"results": [dict(result, runs=[dict(run, rtf=None)])]}
+    assert compare(unknown, report, tolerance=0.0) == []
+    assert compare(report, unknown, tolerance=0.0) == []
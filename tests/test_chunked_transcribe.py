@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+长音频分块转录测试（切分和拼接逻辑，不依赖faster-whisper）
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+
+import core.chunked_transcribe as chunked
+from core.chunked_transcribe import Segment, split_on_silence, stitch_segments
+from core.whisper_transcribe import SAMPLE_RATE
+
+
+def make_speech_like_audio(total_seconds: int, silence_every: float = 7.0, silence_len: float = 0.8):
+    """合成音频：持续的噪声（模拟语音），每隔 silence_every 秒插入一段静音"""
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal(total_seconds * SAMPLE_RATE) * 0.3).astype(np.float32)
+    silences = []
+    t = silence_every
+    while t + silence_len < total_seconds:
+        a, b = int(t * SAMPLE_RATE), int((t + silence_len) * SAMPLE_RATE)
+        audio[a:b] = 0.0
+        silences.append((a, b))
+        t += silence_every
+    return audio, silences
+
+
+def test_split_on_silence_chunk_lengths():
+    """除最后一块外，每块长度都在 30-120 秒之间，且切点落在静音中"""
+    audio, silences = make_speech_like_audio(600)
+    bounds = split_on_silence(audio)
+    assert bounds[0][0] == 0 and bounds[-1][1] == len(audio)
+    for (a, b), (c, _) in zip(bounds, bounds[1:]):
+        assert b == c
+    for a, b in bounds[:-1]:
+        assert 30 <= (b - a) / SAMPLE_RATE <= 120
+        assert any(s <= b <= e for s, e in silences), f"切点 {b / SAMPLE_RATE:.2f}s 不在静音中"
+    assert (bounds[-1][1] - bounds[-1][0]) / SAMPLE_RATE <= 120
+
+
+def test_short_audio_is_single_chunk():
+    """短于最大块长的音频不切分"""
+    audio, _ = make_speech_like_audio(90)
+    assert split_on_silence(audio) == [(0, len(audio))]
+
+
+def test_stitch_removes_seam_duplicates():
+    """块边界处重复的段被去除，非边界处的重复保留"""
+    chunks = [
+        [Segment(0.0, 2.0, "hello"), Segment(2.0, 4.0, "Thank you.")],
+        [Segment(4.2, 5.0, "thank you"), Segment(5.0, 7.0, "next part")],
+        [Segment(30.0, 31.0, "next part")],
+    ]
+    texts = [seg.text for seg in stitch_segments(chunks)]
+    assert texts == ["hello", "Thank you.", "next part", "next part"]
+
+
+def test_chunk_offsets_are_applied(monkeypatch):
+    """块内时间戳加上块起始偏移"""
+    class FakeModel:
+        def transcribe(self, audio, **params):
+            segments = [SimpleNamespace(start=0.5, end=1.5, text=" hi")]
+            return iter(segments), SimpleNamespace(language="en")
+
+    monkeypatch.setattr(chunked, "_worker_model", FakeModel())
+    segments, language, duration = chunked._transcribe_chunk(np.zeros(SAMPLE_RATE * 2, np.float32), 60.0, {})
+    assert segments == [Segment(60.5, 61.5, " hi")]
+    assert language == "en"
+    assert duration == 2.0
+
+
+def test_pool_is_shut_down_only_when_idle(monkeypatch):
+    """换用其他模型时，仍在使用的旧进程池等任务结束后才关闭，并释放预留的模型内存"""
+    monkeypatch.setattr(chunked, "available_cpus", lambda: 4)
+    monkeypatch.setattr(chunked, "_transcribers", {})
+    registry = chunked.ModelRegistry(memory_budget_mb=10000)
+
+    with chunked.chunked_transcriber("tiny", 2, registry=registry) as tiny:
+        assert tiny.workers == 2
+        assert registry.memory_used_mb == 2 * chunked.MODEL_MEMORY_MB["tiny"]
+        with chunked.chunked_transcriber("base", 2, registry=registry) as base:
+            # tiny 的进程池已被替换但仍在使用，不能关闭
+            assert tiny.retired and not tiny._executor._shutdown_thread
+        assert registry.memory_used_mb == 2 * (chunked.MODEL_MEMORY_MB["tiny"] + chunked.MODEL_MEMORY_MB["base"])
+    assert tiny._executor._shutdown_thread
+    assert registry.memory_used_mb == 2 * chunked.MODEL_MEMORY_MB["base"]
+    base.shutdown()
+
+
+def test_pool_size_respects_cpu_and_memory_budget(monkeypatch):
+    """进程数不超过可用CPU和内存预算，不足2个进程时不启用分块转录"""
+    monkeypatch.setattr(chunked, "_transcribers", {})
+    monkeypatch.setattr(chunked, "available_cpus", lambda: 8)
+    registry = chunked.ModelRegistry(memory_budget_mb=3 * chunked.MODEL_MEMORY_MB["small"])
+    with chunked.chunked_transcriber("small", 8, registry=registry) as transcriber:
+        assert transcriber.workers == 3
+    transcriber.shutdown()
+
+    monkeypatch.setattr(chunked, "_transcribers", {})
+    monkeypatch.setattr(chunked, "available_cpus", lambda: 1)
+    with chunked.chunked_transcriber("tiny", 4, registry=chunked.ModelRegistry()) as transcriber:
+        assert transcriber is None
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+下载缓存测试：同一视频的并发请求只下载一次、按大小LRU淘汰、清理遗留临时目录、规范视频ID
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from core.download_cache import PARTIAL_PREFIX, DownloadCache, remove_stale_dirs
+from downloader.video_downloader import VideoDownloader
+
+
+def make_download(data: bytes, calls: list, delay: float = 0.0):
+    def download(output_dir):
+        calls.append(output_dir)
+        time.sleep(delay)
+        path = Path(output_dir) / "video.m4a"
+        path.write_bytes(data)
+        return str(path)
+    return download
+
+
+def test_concurrent_requests_share_one_download(tmp_path):
+    """8个并发请求同一视频只下载一次，每个请求都在自己的工作目录得到文件"""
+    cache = DownloadCache(str(tmp_path / "cache"))
+    calls = []
+    download = make_download(b"audio" * 100, calls, delay=0.2)
+
+    def fetch(index):
+        work_dir = tmp_path / f"work{index}"
+        work_dir.mkdir()
+        return cache.fetch("Youtube-abc", download, work_dir)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        paths = list(pool.map(fetch, range(8)))
+
+    assert len(calls) == 1
+    assert all(path.read_bytes() == b"audio" * 100 for path in paths)
+    assert len({path.parent for path in paths}) == 8
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["hits"] + stats["deduplicated"] == 7
+    # 下载用的临时目录已移除
+    assert not list((tmp_path / "cache").glob(f"{PARTIAL_PREFIX}*"))
+
+
+def test_failed_download_is_shared_and_retried(tmp_path):
+    """下载失败时等待中的请求一起失败，之后的请求重新下载"""
+    cache = DownloadCache(str(tmp_path / "cache"))
+    started = threading.Event()
+
+    def failing(output_dir):
+        started.set()
+        time.sleep(0.2)
+        raise RuntimeError("下载失败: 404")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(cache.fetch, "Youtube-abc", failing, tmp_path)
+        started.wait(5)
+        waiter = pool.submit(cache.fetch, "Youtube-abc", failing, tmp_path)
+        for future in (leader, waiter):
+            with pytest.raises(RuntimeError):
+                future.result(5)
+
+    calls = []
+    assert cache.fetch("Youtube-abc", make_download(b"ok", calls), tmp_path).read_bytes() == b"ok"
+    assert len(calls) == 1
+
+
+def test_size_based_lru_eviction(tmp_path):
+    """总大小超限时淘汰最久未使用的文件，重建实例后恢复LRU顺序"""
+    cache_dir = tmp_path / "cache"
+    cache = DownloadCache(str(cache_dir), max_bytes=250)
+    calls = []
+    for video_id in ("a", "b"):
+        cache.fetch(video_id, make_download(b"x" * 100, calls), tmp_path)
+    time.sleep(0.01)
+    cache.fetch("a", make_download(b"x" * 100, calls), tmp_path)  # a 变为最近使用
+    cache.fetch("c", make_download(b"x" * 100, calls), tmp_path)
+
+    assert sorted(path.name for path in cache_dir.iterdir()) == ["a.m4a", "c.m4a"]
+    assert cache.total_bytes == 200
+    assert len(calls) == 3
+
+    reloaded = DownloadCache(str(cache_dir), max_bytes=250)
+    assert len(reloaded) == 2
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    assert reloaded.fetch("a", make_download(b"", calls), work_dir).read_bytes() == b"x" * 100
+    assert len(calls) == 3
+
+
+def test_removes_orphaned_temp_dirs(tmp_path):
+    """遗留的临时下载目录在启动时清理，仍在使用的新目录保留"""
+    cache_dir = tmp_path / "cache"
+    stale = cache_dir / f"{PARTIAL_PREFIX}old"
+    fresh = cache_dir / f"{PARTIAL_PREFIX}new"
+    for path in (stale, fresh):
+        path.mkdir(parents=True)
+        (path / "video.part").write_bytes(b"x")
+    old = time.time() - 7 * 3600
+    os.utime(stale, (old, old))
+
+    cache = DownloadCache(str(cache_dir))
+    assert not stale.exists() and fresh.exists()
+    assert len(cache) == 0
+
+    work_dir = tmp_path / "transcribe_url_abc"
+    work_dir.mkdir()
+    os.utime(work_dir, (old, old))
+    assert remove_stale_dirs(tmp_path, "transcribe_url_") == 1
+    assert not work_dir.exists()
+
+
+def test_canonical_video_id():
+    """同一视频的不同URL写法得到相同ID，通用URL按完整地址区分"""
+    downloader = VideoDownloader(allow_generic=True)
+    video_id = downloader.extract_id("https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=30")
+    assert video_id == "Youtube-dQw4w9WgXcQ"
+    assert downloader.extract_id("https://youtu.be/dQw4w9WgXcQ") == video_id
+    assert downloader.extract_id("http://a.example/video.mp4") != downloader.extract_id("http://b.example/video.mp4")
+
+
+def test_playlist_urls_use_video_id():
+    """下载时忽略播放列表，同一播放列表中不同视频的URL得到各自的视频ID"""
+    downloader = VideoDownloader()
+    first = downloader.extract_id("https://www.youtube.com/watch?v=AAAAAAAAAAA&list=PLxyz")
+    second = downloader.extract_id("https://www.youtube.com/watch?v=BBBBBBBBBBB&list=PLxyz")
+    assert first == "Youtube-AAAAAAAAAAA"
+    assert second == "Youtube-BBBBBBBBBBB"
+    # 只有播放列表的URL无法确定视频，按完整URL区分
+    assert downloader.extract_id("https://www.youtube.com/playlist?list=PLxyz").startswith("Generic-")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+导入耗时基准
+用 python -X importtime 测量导入 app 和核心模块的开销：重依赖必须按需导入，
+app 自身（不含预先导入的 FastAPI/numpy 框架部分）的累计导入耗时不得超过预算
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 只在转录、渲染页面或调用LLM时才需要的依赖
+HEAVY_MODULES = {
+    "faster_whisper", "ctranslate2", "av", "ffmpeg", "jinja2", "openai", "anthropic",
+    "google.generativeai", "multiprocessing.pool", "yt_dlp",
+}
+# 框架依赖不计入预算，先导入它们再测量 app 的增量
+FRAMEWORK_IMPORTS = "import fastapi, fastapi.responses, numpy, pydantic"
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "300"))
+
+
+def import_times(statement: str) -> Dict[str, int]:
+    """返回 {模块名: 累计导入耗时(微秒)}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+        env={**os.environ, "TRANSCRIPT_CACHE_DIR": ""},
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("module", ["app", "core.whisper_transcribe", "core.upload_stream"])
+def test_heavy_modules_are_lazy(module):
+    """导入模块时不加载重依赖"""
+    loaded = set(import_times(f"import {module}")) & HEAVY_MODULES
+    assert not loaded, f"{module} 导入时加载了: {sorted(loaded)}"
+
+
+def test_app_import_budget():
+    """app 在框架之上的导入耗时不超过预算（可用 IMPORT_TIME_BUDGET_MS 调整）"""
+    # 取多次中的最小值以降低抖动
+    elapsed_ms = min(import_times(f"{FRAMEWORK_IMPORTS}; import app")["app"] for _ in range(3)) / 1000
+    print(f"\napp 导入耗时: {elapsed_ms:.1f}ms (预算 {IMPORT_BUDGET_MS:.0f}ms)")
+    assert elapsed_ms <= IMPORT_BUDGET_MS
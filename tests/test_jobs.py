@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+转录任务管理测试
+"""
+
+import threading
+
+import pytest
+
+from core.jobs import Job, JobManager, JobQueueFullError, JOB_COMPLETED, JOB_FAILED, EVENT_DONE, EVENT_PROGRESS
+
+
+def test_job_lifecycle():
+    """任务提交后立即返回，完成后可查询结果"""
+    manager = JobManager(max_workers=1, max_pending=4)
+    release = threading.Event()
+    cleaned = []
+
+    def work(job, value):
+        release.wait(5)
+        return {"value": value}
+
+    job = manager.submit(work, 42, filename="a.mp4", cleanup=lambda: cleaned.append(True))
+    assert not job.done
+    assert manager.get(job.id) is job
+
+    release.set()
+    assert job.future.result(5) == {"value": 42}
+    assert job.status == JOB_COMPLETED
+    assert job.to_dict()["result"] == {"value": 42}
+    assert cleaned == [True]
+    manager.shutdown()
+
+
+def test_job_failure_is_recorded():
+    """任务异常时记录错误信息"""
+    manager = JobManager(max_workers=1)
+
+    def work(job):
+        raise RuntimeError("音频提取失败: boom")
+
+    job = manager.submit(work)
+    with pytest.raises(RuntimeError):
+        job.future.result(5)
+    assert job.status == JOB_FAILED
+    assert "boom" in job.error
+    manager.shutdown()
+
+
+def test_job_queue_is_bounded():
+    """超过 max_pending 的任务被拒绝"""
+    manager = JobManager(max_workers=1, max_pending=2)
+    release = threading.Event()
+    manager.submit(lambda job: release.wait(5))
+    manager.submit(lambda job: release.wait(5))
+    with pytest.raises(JobQueueFullError):
+        manager.submit(lambda job: release.wait(5))
+    release.set()
+    manager.shutdown()
+
+
+def test_job_events():
+    """任务事件按序号递增，连续的进度事件只保留最新一条，并以 done 事件结束"""
+    manager = JobManager(max_workers=1)
+
+    def work(job):
+        job.set_stage("transcribing", "开始语音识别...")
+        for i in range(3):
+            job.emit(EVENT_PROGRESS, segments=i + 1)
+        return {}
+
+    job = manager.submit(work)
+    job.future.result(5)
+    manager.shutdown()
+
+    types = [event["type"] for event in job.events]
+    assert types == ["stage", "stage", "progress", EVENT_DONE]
+    assert [event["id"] for event in job.events] == [1, 2, 5, 6]
+    assert job.events[2]["segments"] == 3
+    assert job.events[-1]["status"] == JOB_COMPLETED
+    # 断线续传只返回之后的事件（包括已被合并的进度事件的最新值）
+    assert [event["id"] for event in job.events_since(4)] == [5, 6]
+    assert [event["id"] for event in job.events_since(3)] == [5, 6]
+
+
+def test_concurrent_emit_ids_are_unique():
+    """多个线程同时上报事件时序号不重复"""
+    job = Job(id="concurrent")
+
+    def emit_logs():
+        for i in range(200):
+            job.log(f"第{i}条")
+
+    threads = [threading.Thread(target=emit_logs) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ids = [event["id"] for event in job.events]
+    assert len(ids) == 1600
+    assert ids == sorted(set(ids))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+LLM结果缓存测试：键、TTL、容量上限、SQLite持久化，以及 /polish 命中时不再调用提供商
+"""
+
+import asyncio
+
+import httpx
+
+import app as app_module
+from core.llm_cache import LLMCache, make_llm_cache_key
+
+
+def test_cache_key_ignores_api_key_but_not_options():
+    """不同风格、目标语言、模型或文本得到不同的键"""
+    base = make_llm_cache_key("openai", "gpt-3.5-turbo", "translate", "en", "你好")
+    assert base == make_llm_cache_key("openai", "gpt-3.5-turbo", "translate", "en", "你好")
+    assert base != make_llm_cache_key("openai", "gpt-3.5-turbo", "translate", "ja", "你好")
+    assert base != make_llm_cache_key("openai", "gpt-3.5-turbo", "polish", "en", "你好")
+    assert base != make_llm_cache_key("openai", "gpt-4", "translate", "en", "你好")
+    assert base != make_llm_cache_key("openai", "gpt-3.5-turbo", "translate", "en", "你好!")
+
+
+def test_ttl_and_size_limit(monkeypatch):
+    """过期条目不再命中，超出容量时淘汰最久未使用的条目"""
+    now = [1000.0]
+    monkeypatch.setattr("core.llm_cache.time.time", lambda: now[0])
+    cache = LLMCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+
+    now[0] += 61
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+
+
+def test_sqlite_backing(tmp_path):
+    """SQLite中的结果在新实例（如重启后）仍可命中，且条目数不超过上限"""
+    db_path = str(tmp_path / "llm_cache.db")
+    cache = LLMCache(max_entries=10, ttl_seconds=60, db_path=db_path, max_db_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key.upper())
+
+    reopened = LLMCache(max_entries=10, ttl_seconds=60, db_path=db_path, max_db_entries=2)
+    assert reopened.get("a") is None
+    assert reopened.get("c") == "C"
+    assert reopened.stats()["hits"] == 1
+
+
+def test_polish_cache_hit(monkeypatch):
+    """相同请求第二次直接返回缓存结果，不调用提供商"""
+    calls = []
+
+    async def fake_provider(request):
+        calls.append(request.text)
+        return "润色后的文本"
+
+    monkeypatch.setattr(app_module, "_call_openai_api", fake_provider)
+    monkeypatch.setattr(app_module, "llm_cache", LLMCache())
+
+    async def main():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            payload = {"text": "需要润色的文本", "api_key": "sk-" + "x" * 40, "provider": "openai"}
+            first = await client.post("/polish", json=payload)
+            second = await client.post("/polish", json={**payload, "api_key": "sk-" + "y" * 40})
+            other_style = await client.post("/polish", json={**payload, "style": "summarize"})
+            return first.json(), second.json(), other_style.json()
+
+    first, second, other_style = asyncio.run(main())
+    assert first["cached"] is False
+    assert second["cached"] is True
+    assert second["polished_text"] == first["polished_text"]
+    assert other_style["cached"] is False
+    assert len(calls) == 2
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+LLM客户端池测试与 /polish 延迟基准（本地模拟OpenAI服务，不访问网络）
+"""
+
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+from core.llm_clients import LLMClientPool
+
+REQUESTS = 20
+
+
+class FakeClient:
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def fake_pool(**kwargs):
+    return LLMClientPool(factories={"openai": lambda key, base_url, idle: FakeClient(key)}, **kwargs)
+
+
+def get(pool, *args):
+    """借用后立即归还，返回客户端"""
+    with pool.lease(*args) as client:
+        return client
+
+
+def test_pool_reuses_and_evicts_lru():
+    """相同 (提供商, base_url, 密钥) 复用同一客户端，超出容量时关闭最久未使用的"""
+    pool = fake_pool(max_clients=2)
+    a = get(pool, "openai", "key-a")
+    assert get(pool, "openai", "key-a") is a
+    assert get(pool, "openai", "key-a", "http://proxy") is not a
+    get(pool, "openai", "key-a")  # a 变为最近使用
+    get(pool, "openai", "key-b")
+    assert len(pool) == 2 and not a.closed
+    assert get(pool, "openai", "key-a") is a
+    with pytest.raises(ValueError):
+        get(pool, "unknown", "key-a")
+
+
+def test_pool_closes_idle_clients():
+    """空闲超时的客户端在下次取用时被关闭并重建"""
+    pool = fake_pool(idle_timeout=0.05)
+    first = get(pool, "openai", "key-a")
+    time.sleep(0.1)
+    second = get(pool, "openai", "key-a")
+    assert first.closed and second is not first
+
+
+def test_pool_does_not_close_clients_in_use():
+    """使用中的客户端超出容量或空闲超时都不会被关闭，归还后再关闭"""
+    pool = fake_pool(max_clients=1, idle_timeout=0.05)
+    with pool.lease("openai", "key-a") as a:
+        time.sleep(0.1)
+        # 空闲超时不针对使用中的客户端
+        assert get(pool, "openai", "key-a") is a and not a.closed
+        # 超出容量被移出池，但仍在使用
+        b = get(pool, "openai", "key-b")
+        assert len(pool) == 1 and not a.closed
+    assert a.closed and not b.closed
+
+    with pool.lease("openai", "key-b") as b2:
+        pool.clear()
+        assert not b2.closed
+    assert b2.closed
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        MockOpenAIHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        body = json.dumps({
+            "id": "chatcmpl-mock", "object": "chat.completion", "created": 0, "model": "gpt-3.5-turbo",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "润色后的文本"},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode()
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mock_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockOpenAIHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def benchmark_polish(client: TestClient, base_url: str, reuse: bool, monkeypatch):
+    """返回每次 /polish 的耗时（秒）和服务端收到的新连接数"""
+    monkeypatch.setattr(app_module, "llm_client_pool", LLMClientPool())
+    # 关闭结果缓存，保证每个请求都访问提供商
+    monkeypatch.setattr(app_module, "llm_cache", None)
+    MockOpenAIHandler.connections = 0
+    timings = []
+    for _ in range(REQUESTS):
+        if not reuse:
+            # 每个请求使用新的客户端池，等同于每次新建客户端
+            monkeypatch.setattr(app_module, "llm_client_pool", LLMClientPool())
+        start = time.perf_counter()
+        response = client.post("/polish", json={
+            "text": "需要润色的文本", "api_key": "sk-" + "x" * 40, "provider": "openai", "base_url": base_url,
+        })
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+        assert response.json()["polished_text"] == "润色后的文本"
+    return timings, MockOpenAIHandler.connections
+
+
+def test_polish_latency_with_pooled_clients(mock_server, monkeypatch):
+    """复用客户端后所有请求共享一个连接"""
+    with TestClient(app_module.app) as client:
+        fresh, fresh_connections = benchmark_polish(client, mock_server, False, monkeypatch)
+        pooled, pooled_connections = benchmark_polish(client, mock_server, True, monkeypatch)
+    print(f"\n每次新建客户端: 中位数 {statistics.median(fresh) * 1000:.1f}ms, {fresh_connections} 个连接"
+          f"\n复用客户端:     中位数 {statistics.median(pooled) * 1000:.1f}ms, {pooled_connections} 个连接")
+    assert fresh_connections == REQUESTS
+    assert pooled_connections == 1
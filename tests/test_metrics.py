@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Prometheus 指标输出测试
+"""
+
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import app as app_module
+from core.jobs import Job
+from core.metrics import MetricsRegistry
+from core.postprocess import LoopDetector
+
+
+def test_histogram_buckets_are_cumulative():
+    """直方图按累积桶输出，并包含 _sum 和 _count"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram("stage_seconds", "阶段耗时", ["stage"], buckets=(0.1, 1, 10))
+    for value in (0.05, 0.5, 0.7, 20):
+        histogram.observe(value, stage="transcribe")
+    text = registry.render()
+    assert '# TYPE stage_seconds histogram' in text
+    assert 'stage_seconds_bucket{stage="transcribe",le="0.1"} 1.0' in text
+    assert 'stage_seconds_bucket{stage="transcribe",le="1.0"} 3.0' in text
+    assert 'stage_seconds_bucket{stage="transcribe",le="10.0"} 3.0' in text
+    assert 'stage_seconds_bucket{stage="transcribe",le="+Inf"} 4.0' in text
+    assert 'stage_seconds_count{stage="transcribe"} 4.0' in text
+    assert 'stage_seconds_sum{stage="transcribe"} 21.25' in text
+
+
+def test_counter_gauge_and_callbacks():
+    """计数器累加，仪表回调在采集时读取，标签不匹配时报错"""
+    registry = MetricsRegistry()
+    counter = registry.counter("jobs_total", "任务数", ["status"])
+    counter.inc(status="completed")
+    counter.inc(2, status="completed")
+    depth = [3]
+    registry.gauge("queue_depth", "队列深度", callback=lambda: depth[0])
+    registry.gauge("load_seconds", "加载耗时", ["model"], callback=lambda: {("tiny",): 1.5})
+
+    depth[0] = 5
+    text = registry.render()
+    assert 'jobs_total{status="completed"} 3.0' in text
+    assert "queue_depth 5.0" in text
+    assert 'load_seconds{model="tiny"} 1.5' in text
+    with pytest.raises(ValueError):
+        counter.inc(provider="openai")
+
+
+def test_loop_detection_counted_as_postprocess(monkeypatch):
+    """循环检测随解码逐段进行，其耗时计入后处理阶段而不是转录阶段"""
+    class FakeModel:
+        def transcribe(self, audio, **params):
+            segments = [SimpleNamespace(start=float(i), end=i + 1.0, text=f"第{i}段") for i in range(3)]
+            return iter(segments), SimpleNamespace(language="zh", duration=3.0)
+
+    feed = LoopDetector.feed
+
+    def slow_feed(self, text):
+        time.sleep(0.05)
+        return feed(self, text)
+
+    registry = MetricsRegistry()
+    stage_seconds = registry.histogram("stage_seconds", "阶段耗时", ["stage"])
+    monkeypatch.setattr(app_module, "stage_seconds", stage_seconds)
+    monkeypatch.setattr(app_module.model_registry, "get", lambda name: FakeModel())
+    monkeypatch.setattr(LoopDetector, "feed", slow_feed)
+
+    result = app_module._transcribe_file(Job(id="metrics"), np.zeros(16000, dtype=np.float32), "zh", "base")
+    assert result["text"] == "第0段 第1段 第2段"
+
+    sums = {line.split('"')[1]: float(line.split()[-1])
+            for line in registry.render().splitlines() if line.startswith("stage_seconds_sum")}
+    assert sums["postprocess"] >= 0.15
+    assert sums["transcribe"] < 0.1
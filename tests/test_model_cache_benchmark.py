@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Whisper模型缓存基准测试
+比较 core.whisper_transcribe.get_model 首次调用（含加载）与后续调用的耗时
+"""
+
+import time
+
+import pytest
+
+import core.whisper_transcribe as whisper_transcribe
+from core.model_registry import ModelRegistry
+
+SIMULATED_LOAD_SECONDS = 0.2
+
+
+def _benchmark_get_model(calls: int = 5):
+    """返回每次 get_model 调用的耗时（秒）"""
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        whisper_transcribe.get_model("tiny")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def test_model_load_only_on_first_call(monkeypatch):
+    """模拟加载耗时，第二次及之后的调用不再付出加载成本"""
+    def slow_loader(name, device, compute_type):
+        time.sleep(SIMULATED_LOAD_SECONDS)
+        return object()
+
+    monkeypatch.setattr(whisper_transcribe, "model_registry", ModelRegistry(loader=slow_loader))
+    timings = _benchmark_get_model()
+    print(f"\n首次调用: {timings[0] * 1000:.1f}ms, 后续平均: {sum(timings[1:]) / len(timings[1:]) * 1e6:.1f}µs")
+    assert timings[0] >= SIMULATED_LOAD_SECONDS
+    assert max(timings[1:]) < SIMULATED_LOAD_SECONDS / 100
+
+
+def test_real_model_load_only_on_first_call(monkeypatch):
+    """使用真实的faster-whisper tiny模型（未安装时跳过）"""
+    pytest.importorskip("faster_whisper")
+    monkeypatch.setattr(whisper_transcribe, "model_registry", ModelRegistry())
+    timings = _benchmark_get_model(3)
+    print(f"\n首次调用: {timings[0]:.2f}s, 后续平均: {sum(timings[1:]) / len(timings[1:]) * 1e6:.1f}µs")
+    assert max(timings[1:]) < timings[0] / 100
+
+
+if __name__ == "__main__":
+    for i, t in enumerate(_benchmark_get_model(), 1):
+        print(f"第{i}次调用 get_model: {t * 1000:.2f}ms")
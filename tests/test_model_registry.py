@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Whisper模型注册表测试（使用假加载器，不依赖faster-whisper）
+"""
+
+import threading
+import time
+
+import pytest
+
+import core.model_registry as model_registry_module
+from core.model_registry import ModelRegistry
+
+
+def make_loader(calls):
+    def loader(name, device, compute_type):
+        calls.append(name)
+        time.sleep(0.01)
+        return object()
+    return loader
+
+
+def test_lru_eviction_by_count():
+    """超过 max_models 时淘汰最近最少使用的模型"""
+    calls = []
+    registry = ModelRegistry(max_models=2, memory_budget_mb=10000, loader=make_loader(calls))
+    registry.get("tiny")
+    registry.get("base")
+    registry.get("tiny")  # tiny 变为最近使用
+    registry.get("small")
+    loaded = [key[0] for key in registry.loaded_models()]
+    assert loaded == ["tiny", "small"]
+    assert calls == ["tiny", "base", "small"]
+
+
+def test_memory_budget():
+    """超过内存预算时淘汰旧模型，单个模型超预算直接拒绝"""
+    registry = ModelRegistry(max_models=4, memory_budget_mb=600, loader=make_loader([]))
+    registry.get("tiny")
+    registry.get("base")
+    registry.get("small")
+    assert registry.memory_used_mb <= 600
+    assert [key[0] for key in registry.loaded_models()] == ["small"]
+    with pytest.raises(ValueError):
+        registry.get("medium")
+    with pytest.raises(ValueError):
+        registry.get("unknown")
+
+
+def test_concurrent_get_loads_once():
+    """并发请求同一模型只加载一次"""
+    calls = []
+    registry = ModelRegistry(loader=make_loader(calls))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("tiny"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == ["tiny"]
+    assert len({id(model) for model in results}) == 1
+
+
+def test_default_budget_follows_container_limit(monkeypatch):
+    """未设置 WHISPER_MEMORY_BUDGET_MB 时预算为容器内存上限减去预留，medium 在1Gi的Pod中被拒绝"""
+    monkeypatch.delenv("WHISPER_MEMORY_BUDGET_MB", raising=False)
+    monkeypatch.setattr(model_registry_module, "container_memory_limit_mb", lambda: 1024)
+    budget = model_registry_module.default_memory_budget_mb()
+    assert budget == 1024 - model_registry_module.MEMORY_HEADROOM_MB
+
+    registry = ModelRegistry(memory_budget_mb=budget, loader=make_loader([]))
+    with pytest.raises(ValueError):
+        registry.get("medium")
+
+    monkeypatch.setattr(model_registry_module, "container_memory_limit_mb", lambda: None)
+    assert model_registry_module.default_memory_budget_mb() == model_registry_module.DEFAULT_MEMORY_BUDGET_MB
+    monkeypatch.setenv("WHISPER_MEMORY_BUDGET_MB", "300")
+    assert model_registry_module.default_memory_budget_mb() == 300
+
+
+def test_evicts_before_loading():
+    """加载新模型前先淘汰旧模型，新旧模型不会同时超出内存预算"""
+    registry = None
+    resident = []
+
+    def loader(name, device, compute_type):
+        resident.append(registry.memory_used_mb)
+        return object()
+
+    registry = ModelRegistry(max_models=2, memory_budget_mb=500, loader=loader)
+    registry.get("tiny")
+    registry.get("small")
+    assert resident == [0, 0]
+    assert [key[0] for key in registry.loaded_models()] == ["small"]
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+/polish 异步调度测试：并发上限和单次调用超时来自沙箱配置（使用假提供商，不访问网络）
+"""
+
+import asyncio
+import time
+
+import httpx
+
+import app as app_module
+from config.sandbox_config import sandbox_manager
+
+PAYLOAD = {"text": "需要润色的文本", "api_key": "sk-" + "x" * 40, "provider": "openai"}
+
+
+def run_concurrent(count: int):
+    async def main():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[client.post("/polish", json=PAYLOAD) for _ in range(count)])
+    return asyncio.run(main())
+
+
+def test_concurrency_capped_by_sandbox_config(monkeypatch):
+    """同时进行的LLM调用不超过 max_concurrent_requests，其余排队而不是失败"""
+    state = {"active": 0, "peak": 0}
+
+    async def fake_provider(request):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.1)
+        state["active"] -= 1
+        return "润色后的文本"
+
+    monkeypatch.setattr(app_module, "_call_openai_api", fake_provider)
+    monkeypatch.setattr(app_module, "llm_cache", None)
+    monkeypatch.setattr(sandbox_manager.config, "max_concurrent_requests", 3)
+    app_module._llm_semaphore.cache_clear()
+    try:
+        start = time.perf_counter()
+        responses = run_concurrent(9)
+        elapsed = time.perf_counter() - start
+    finally:
+        app_module._llm_semaphore.cache_clear()
+
+    assert all(response.status_code == 200 for response in responses)
+    assert state["peak"] == 3
+    # 9个请求分3批完成，而不是串行的0.9秒
+    assert elapsed < 0.6
+
+
+def test_provider_timeout(monkeypatch):
+    """超过 max_execution_time_seconds 的调用返回504"""
+    async def hanging_provider(request):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(app_module, "_call_openai_api", hanging_provider)
+    monkeypatch.setattr(app_module, "llm_cache", None)
+    monkeypatch.setattr(sandbox_manager.config, "max_execution_time_seconds", 0.1)
+    responses = run_concurrent(1)
+    assert responses[0].status_code == 504
+    assert sandbox_manager.active_requests == 0
+
+
+def long_payload(style: str, segments: int):
+    text = "\n".join(f"第{i}段：" + "内容" * 30 + "。" for i in range(segments))
+    return {**PAYLOAD, "text": text, "style": style}
+
+
+def post(payload):
+    async def main():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/polish", json=payload)
+    return asyncio.run(main())
+
+
+def test_long_text_chunks_run_concurrently(monkeypatch):
+    """超长文本分块并发处理，按原顺序拼接，总耗时接近单块耗时"""
+    async def fake_provider(request):
+        await asyncio.sleep(0.1)
+        return request.text.split("：")[0]
+
+    monkeypatch.setattr(app_module, "_call_openai_api", fake_provider)
+    monkeypatch.setattr(app_module, "llm_cache", None)
+    monkeypatch.setattr(app_module, "LLM_CHUNK_CONCURRENCY", 4)
+    monkeypatch.setattr(sandbox_manager.config, "max_input_length", 100)
+    monkeypatch.setattr(sandbox_manager.config, "max_concurrent_requests", 8)
+    app_module._llm_semaphore.cache_clear()
+    try:
+        start = time.perf_counter()
+        response = post(long_payload("polish", 4))
+        elapsed = time.perf_counter() - start
+    finally:
+        app_module._llm_semaphore.cache_clear()
+
+    assert response.status_code == 200, response.text
+    assert response.json()["polished_text"].split("\n") == [f"第{i}段" for i in range(4)]
+    assert response.json()["sandbox_validation"]["valid"] is True
+    assert elapsed < 0.3
+
+
+def test_long_summary_is_reduced(monkeypatch):
+    """summarize 先总结各块，再把各块摘要合并成一份总结"""
+    styles = []
+
+    async def fake_provider(request):
+        styles.append(request.style)
+        if request.style == app_module.REDUCE_STYLE:
+            return "总结:" + request.text.replace("\n\n", "+")
+        return request.text.split("：")[0]
+
+    monkeypatch.setattr(app_module, "_call_openai_api", fake_provider)
+    monkeypatch.setattr(app_module, "llm_cache", None)
+    monkeypatch.setattr(sandbox_manager.config, "max_input_length", 100)
+    response = post(long_payload("summarize", 3))
+
+    assert response.status_code == 200, response.text
+    assert response.json()["polished_text"] == "总结:第0段+第1段+第2段"
+    assert styles == ["summarize"] * 3 + [app_module.REDUCE_STYLE]
+
+
+def test_too_many_chunks_rejected_before_llm_call(monkeypatch):
+    """分块数超过 max_chunks 时直接返回413，不调用提供商"""
+    calls = []
+
+    async def fake_provider(request):
+        calls.append(request.text)
+        return request.text
+
+    monkeypatch.setattr(app_module, "_call_openai_api", fake_provider)
+    monkeypatch.setattr(app_module, "llm_cache", None)
+    monkeypatch.setattr(sandbox_manager.config, "max_input_length", 100)
+    monkeypatch.setattr(sandbox_manager.config, "max_chunks", 3)
+    active = sandbox_manager.active_requests
+
+    response = post(long_payload("polish", 4))
+    assert response.status_code == 413, response.text
+    assert calls == []
+    assert sandbox_manager.active_requests == active
+    assert post(long_payload("polish", 3)).status_code == 200
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+流式 /polish 测试：文本按生成顺序实时推送（使用假提供商，不访问网络）
+"""
+
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+
+import app as app_module
+from config.sandbox_config import sandbox_manager
+
+PAYLOAD = {"text": "需要润色的文本", "api_key": "sk-" + "x" * 40, "provider": "anthropic"}
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    """在后台线程运行真实的HTTP服务（ASGITransport 会缓冲整个响应，无法测量首个文本的延迟）"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join()
+
+
+def read_events(base_url, payload):
+    """返回 [(事件类型, 数据, 距请求开始的秒数)]"""
+    async def main():
+        events = []
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            start = time.perf_counter()
+            async with client.stream("POST", "/polish/stream", json=payload) as response:
+                assert response.status_code == 200
+                event_type = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event_type = line[len("event: "):]
+                    elif line.startswith("data: "):
+                        events.append((event_type, json.loads(line[len("data: "):]), time.perf_counter() - start))
+        return events
+    return asyncio.run(main())
+
+
+def test_tokens_stream_before_completion(server_url, monkeypatch):
+    """第一段文本在提供商生成结束前就推送给客户端"""
+    async def fake_stream(request):
+        for token in ["润色", "后的", "文本"]:
+            yield token
+            await asyncio.sleep(0.1)
+
+    monkeypatch.setattr(app_module, "_stream_anthropic_api", fake_stream)
+    monkeypatch.setattr(app_module, "llm_cache", None)
+    events = read_events(server_url, PAYLOAD)
+
+    tokens = [(data["text"], elapsed) for event_type, data, elapsed in events if event_type == "token"]
+    assert [text for text, _ in tokens] == ["润色", "后的", "文本"]
+    assert tokens[0][1] < 0.1
+    assert events[-1][0] == "done"
+    assert events[-1][1]["polished_text"] == "润色后的文本"
+    assert events[-1][2] >= 0.3
+
+
+def test_long_text_streams_in_order(server_url, monkeypatch):
+    """分块并发生成时仍按原文顺序输出"""
+    async def fake_stream(request):
+        index = int(request.text.split("段")[0][1:])
+        # 后面的块先生成完
+        await asyncio.sleep(0.1 * (3 - index))
+        yield f"第{index}段"
+
+    monkeypatch.setattr(app_module, "_stream_anthropic_api", fake_stream)
+    monkeypatch.setattr(app_module, "llm_cache", None)
+    monkeypatch.setattr(sandbox_manager.config, "max_input_length", 100)
+    text = "\n".join(f"第{i}段：" + "内容" * 30 + "。" for i in range(3))
+    events = read_events(server_url, {**PAYLOAD, "text": text})
+
+    assert events[-1][0] == "done"
+    assert events[-1][1]["polished_text"] == "第0段\n第1段\n第2段"
+
+
+def test_provider_error_is_streamed(server_url, monkeypatch):
+    """开始推送后的提供商错误以 error 事件返回"""
+    async def failing_stream(request):
+        yield "部分"
+        raise Exception("连接中断")
+
+    monkeypatch.setattr(app_module, "_stream_anthropic_api", failing_stream)
+    monkeypatch.setattr(app_module, "llm_cache", None)
+    events = read_events(server_url, PAYLOAD)
+
+    assert [event_type for event_type, _, _ in events] == ["token", "error"]
+    assert events[-1][1]["status"] == 500
+
+
+def test_slot_released_when_client_disconnects_before_streaming(monkeypatch):
+    """推送开始前客户端就已断开（生成器从未执行）时，进行中的请求名额也会释放"""
+    monkeypatch.setattr(app_module, "llm_cache", None)
+    audited = []
+    monkeypatch.setattr(app_module, "_audit_polish", lambda *args, **kwargs: audited.append(kwargs.get("status")))
+
+    async def main():
+        before = sandbox_manager.active_requests
+        response = await app_module.polish_text_stream(app_module.LLMRequest(**PAYLOAD))
+        assert sandbox_manager.active_requests == before + 1
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            raise OSError("客户端已断开")
+
+        scope = {"type": "http", "asgi": {"spec_version": "2.4"}, "method": "POST", "path": "/polish/stream",
+                 "headers": []}
+        with pytest.raises(Exception):
+            await response(scope, receive, send)
+        return before
+
+    before = asyncio.run(main())
+    assert sandbox_manager.active_requests == before
+    assert audited == ["cancelled"]
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+重复循环检测测试与微基准
+基准使用合成的多小时转录（约150词/分钟，每段约10词，随机插入幻觉循环）
+"""
+
+import random
+import time
+
+from core.postprocess import LoopConfig, LoopDetector, collapse_loops
+
+WORDS_PER_MINUTE = 150
+WORDS_PER_SEGMENT = 10
+
+
+def test_collapses_ngram_loops():
+    """单词、多词和中文循环都被折叠为一份"""
+    assert collapse_loops("livin' livin' livin' on a prayer") == "livin' on a prayer"
+    assert collapse_loops("thank you thank you thank you so much") == "thank you so much"
+    assert collapse_loops("我们走吧我们走吧我们走吧") == "我们走吧"
+    # 单字叠词不是循环
+    assert collapse_loops("谢谢大家，我们看看") == "谢谢大家，我们看看"
+
+
+def test_keep_repeats_threshold():
+    """keep_repeats 允许合法的连续重复"""
+    config = LoopConfig(keep_repeats=2)
+    assert collapse_loops("no no no no, I said no", config) == "no no I said no"
+
+
+def test_incremental_segments():
+    """跨段循环被丢弃，不相邻的重复句子保留"""
+    detector = LoopDetector()
+    outputs = [detector.feed(text) for text in
+               ["Hello everyone.", "Thank you.", "Thank you.", "thank you", "See you.", "Thank you."]]
+    assert outputs == ["Hello everyone.", "Thank you.", "", "", "See you.", "Thank you."]
+    assert detector.removed_tokens == 4
+
+
+def synthetic_transcript(hours: float, seed: int = 0):
+    """生成合成转录段，约5%的段后跟随2-6次重复（幻觉循环）"""
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    segments = []
+    for _ in range(int(hours * 60 * WORDS_PER_MINUTE / WORDS_PER_SEGMENT)):
+        text = " ".join(rng.choice(vocabulary) for _ in range(WORDS_PER_SEGMENT))
+        segments.append(text)
+        if rng.random() < 0.05:
+            segments.extend([text] * rng.randint(2, 6))
+    return segments
+
+
+def benchmark(hours: float) -> float:
+    """返回处理 hours 小时合成转录的耗时（秒）"""
+    segments = synthetic_transcript(hours)
+    detector = LoopDetector()
+    start = time.perf_counter()
+    for text in segments:
+        detector.feed(text)
+    return time.perf_counter() - start
+
+
+def test_linear_time_benchmark():
+    """处理时间随转录长度线性增长"""
+    short, long = benchmark(1), benchmark(4)
+    print(f"\n1小时: {short * 1000:.0f}ms, 4小时: {long * 1000:.0f}ms")
+    assert long < short * 4 * 2
+
+
+if __name__ == "__main__":
+    for hours in (1, 2, 4, 8):
+        elapsed = benchmark(hours)
+        words = hours * 60 * WORDS_PER_MINUTE
+        print(f"{hours}小时 (~{words}词): {elapsed * 1000:.0f}ms, {words / elapsed:,.0f} 词/秒")
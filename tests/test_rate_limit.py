@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+限流测试：令牌桶、/polish 的429响应，以及并发争用下的限流开销基准
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+import httpx
+
+import app as app_module
+from config.sandbox_config import sandbox_manager
+from core.rate_limit import RateLimiter
+
+# 单次限流检查的平均耗时预算（微秒）
+ACQUIRE_BUDGET_US = float(os.getenv("RATE_LIMIT_BUDGET_US", "50"))
+
+
+def test_token_bucket_per_key_and_global():
+    """每个键的突发量为每分钟限额，令牌按时间补充；全局桶限制所有键的总和"""
+    now = [0.0]
+    limiter = RateLimiter(per_key_per_minute=2, global_per_minute=3, clock=lambda: now[0])
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == 0
+    # 每分钟2个令牌，补充一个需要30秒
+    assert limiter.acquire("a") == 30.0
+    assert limiter.acquire("b") == 0
+    # 全局桶已用完，b 虽然还有令牌也要等待
+    assert limiter.acquire("b") == 20.0
+
+    now[0] = 30.0
+    assert limiter.acquire("a") == 0
+
+
+def post_polish(count: int, api_key: str = "sk-" + "x" * 40):
+    async def main():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            payload = {"text": "需要润色的文本", "api_key": api_key, "provider": "openai"}
+            return [await client.post("/polish", json=payload) for _ in range(count)]
+    return asyncio.run(main())
+
+
+def test_polish_rate_limited(monkeypatch):
+    """超出每分钟请求数返回429和 Retry-After，其他API密钥不受影响"""
+    async def fake_provider(request):
+        return "润色后的文本"
+
+    monkeypatch.setattr(app_module, "_call_openai_api", fake_provider)
+    monkeypatch.setattr(sandbox_manager, "rate_limiter", RateLimiter(per_key_per_minute=2))
+    responses = post_polish(3)
+
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert responses[2].headers["Retry-After"] == "30"
+    assert post_polish(1, api_key="sk-" + "y" * 40)[0].status_code == 200
+    assert sandbox_manager.active_requests == 0
+
+
+def test_in_flight_limit(monkeypatch):
+    """进行中的请求达到上限时直接返回429，而不是继续排队"""
+    async def slow_provider(request):
+        await asyncio.sleep(0.2)
+        return "润色后的文本"
+
+    monkeypatch.setattr(app_module, "_call_openai_api", slow_provider)
+    monkeypatch.setattr(app_module, "llm_cache", None)
+    monkeypatch.setattr(sandbox_manager.config, "max_in_flight_requests", 2)
+
+    async def main():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[
+                client.post("/polish", json={"text": "文本", "api_key": "sk-" + str(i) * 40, "provider": "openai"})
+                for i in range(3)
+            ])
+
+    statuses = sorted(response.status_code for response in asyncio.run(main()))
+    assert statuses == [200, 200, 429]
+    assert sandbox_manager.active_requests == 0
+
+
+def test_acquire_overhead_under_contention():
+    """8个线程争用同一个限流器时，单次检查的平均耗时在微秒级"""
+    limiter = RateLimiter(per_key_per_minute=1e9, global_per_minute=1e9)
+    threads_count, iterations = 8, 20000
+    keys = [f"key-{i}" for i in range(64)]
+    barrier = threading.Barrier(threads_count)
+
+    def worker(offset: int):
+        barrier.wait()
+        for i in range(iterations):
+            limiter.acquire(keys[(i + offset) % len(keys)])
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(threads_count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    per_acquire_us = elapsed / (threads_count * iterations) * 1e6
+    print(f"\n限流检查: {per_acquire_us:.2f}µs/次 ({threads_count} 线程争用，预算 {ACQUIRE_BUDGET_US:.0f}µs)")
+    assert per_acquire_us <= ACQUIRE_BUDGET_US
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+启动就绪检查测试：模型在后台加载预热，完成前 /ready 返回503（使用假模型）
+"""
+
+import threading
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import app as app_module
+from core.model_registry import ModelRegistry
+
+
+class FakeModel:
+    def transcribe(self, audio, **params):
+        return iter([]), SimpleNamespace(language="en", duration=len(audio) / 16000)
+
+
+def test_ready_after_background_warm_up(monkeypatch):
+    """服务立即可访问，模型加载完成前未就绪，预热后就绪并报告各阶段耗时"""
+    release = threading.Event()
+
+    def loader(name, device, compute_type):
+        release.wait(5)
+        return FakeModel()
+
+    monkeypatch.setattr(app_module, "model_registry", ModelRegistry(loader=loader))
+    monkeypatch.setattr(app_module, "model_status", dict(app_module.model_status, loaded=False, warmed=False))
+    monkeypatch.setattr(app_module, "startup_timings", dict(app_module.startup_timings, model_load=None, warmup=None))
+
+    with TestClient(app_module.app) as client:
+        assert client.get("/health").status_code == 200
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["loaded"] is False
+
+        release.set()
+        for _ in range(100):
+            response = client.get("/ready")
+            if response.status_code == 200:
+                break
+            threading.Event().wait(0.05)
+        assert response.status_code == 200
+        timings = response.json()["startup_seconds"]
+        assert timings["import"] is not None and timings["warmup"] is not None
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+内容过滤测试：预编译过滤器与逐关键词实现的结果一致，并在10万字转录文本上做吞吐基准
+"""
+
+import random
+import re
+import time
+
+from config.sandbox_config import SandboxConfig, SandboxManager
+
+SEPARATORS = r"[\s\-，。,.、:：;；_~!@#$%^&*()\[\]{}|\\'\"<>?/]+"
+TRANSCRIPT_CHARS = 100_000
+
+
+def legacy_validate(text: str, keywords) -> bool:
+    """原来的实现：整段清洗后逐个关键词查找，再逐个匹配敏感信息模式"""
+    text_clean = re.sub(SEPARATORS, "", text.lower())
+    for keyword in keywords:
+        if re.sub(SEPARATORS, "", keyword.lower()) in text_clean:
+            return False
+    for pattern in [r"\d{16}", r"\d{15,18}[xX]?", r"\d{3,4}[- ]?\d{4}[- ]?\d{4}[- ]?\d{4}"]:
+        if re.search(pattern, text):
+            return False
+    return True
+
+
+def make_manager(keywords=None) -> SandboxManager:
+    return SandboxManager(SandboxConfig(max_input_length=10 ** 9, blocked_keywords=keywords))
+
+
+def make_transcript(seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words = ("今天 我们 讨论 一下 视频 转录 的 质量 问题 会议 记录 2024 年 第 3 季度 "
+             "hello world the quick brown fox jumps over the lazy dog").split()
+    parts = []
+    size = 0
+    while size < TRANSCRIPT_CHARS:
+        part = rng.choice(words) + rng.choice([" ", "", "，", "。\n"])
+        parts.append(part)
+        size += len(part)
+    return "".join(parts)[:TRANSCRIPT_CHARS]
+
+
+def test_matches_legacy_filter():
+    """关键词忽略大小写和分隔符，敏感信息模式不变"""
+    manager = make_manager()
+    keywords = manager.config.blocked_keywords
+    samples = [
+        "这是一个正常的文本内容",
+        "我的密码是123456",
+        "我的 密-码 是多少",
+        "PASSWORD reset",
+        "Credit-Card number",
+        "s.s.n",
+        "monkey business",
+        "银行 卡号",
+        "1234-5678-9012-3456",
+        "1234 5678 9012 3456",
+        "123456789012345",
+        "12345678901234",
+        "11010519491231002X",
+        "电话 138 0013 8000",
+        "",
+    ]
+    rng = random.Random(1)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789 -，。密码账户号卡信用"
+    samples += ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 40))) for _ in range(2000)]
+    for text in samples:
+        assert manager._validate_input_content(text) == legacy_validate(text, keywords), text
+
+
+def test_keyword_changes_recompile():
+    """修改关键词列表后使用新的过滤器"""
+    manager = make_manager(["foo"])
+    assert not manager._validate_input_content("f o o")
+    manager.config.blocked_keywords = ["bar"]
+    assert manager._validate_input_content("f o o")
+    assert not manager._validate_input_content("BAR")
+
+
+def test_filter_throughput():
+    """10万字转录文本上的吞吐：与关键词数量无关，且快于逐关键词实现"""
+    text = make_transcript()
+    results = {}
+    for count in (12, 500):
+        manager = make_manager()
+        keywords = manager.config.blocked_keywords + [f"blocked{i}word" for i in range(count - 12)]
+        manager.config.blocked_keywords = keywords
+        assert manager._validate_input_content(text) == legacy_validate(text, keywords)
+
+        timings = {}
+        for name, check in (("precompiled", lambda: manager._validate_input_content(text)),
+                            ("legacy", lambda: legacy_validate(text, keywords))):
+            runs = []
+            for _ in range(5):
+                start = time.perf_counter()
+                check()
+                runs.append(time.perf_counter() - start)
+            timings[name] = min(runs)
+        results[count] = timings
+        print(f"\n{count} 个关键词: 预编译 {timings['precompiled'] * 1000:.2f}ms "
+              f"({TRANSCRIPT_CHARS / timings['precompiled'] / 1e6:.1f}M 字/秒), "
+              f"逐关键词 {timings['legacy'] * 1000:.2f}ms")
+
+    assert all(timings["precompiled"] * 2 < timings["legacy"] for timings in results.values())
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+共享状态后端测试：本地后端（内存、SQLite）的键值和令牌桶语义，
+多进程共享SQLite时的限流正确性，任务状态和LLM缓存的跨进程共享，以及后端不可用或较慢时的行为
+"""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from config.sandbox_config import SandboxConfig, SandboxManager
+from core.jobs import JOB_COMPLETED, JobManager
+from core.llm_cache import LLMCache
+from core.rate_limit import RateLimiter, RateLimitExceeded
+from core.state_backend import MemoryStateBackend, SQLiteStateBackend, create_state_backend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    backend = MemoryStateBackend() if request.param == "memory" else SQLiteStateBackend(str(tmp_path / "state.db"))
+    yield backend
+    backend.close()
+
+
+def test_key_value_with_ttl(backend):
+    """键值读写、删除和过期"""
+    assert backend.get("a") is None
+    backend.set("a", "1")
+    backend.set("b", "2", ttl=0.05)
+    assert backend.get("a") == "1"
+    assert backend.get("b") == "2"
+    time.sleep(0.1)
+    assert backend.get("b") is None
+    backend.delete("a")
+    assert backend.get("a") is None
+
+
+def test_take_tokens_all_or_nothing(backend):
+    """所有桶都有令牌才扣减，否则都不扣减并返回最长等待时间"""
+    assert backend.take_tokens([("k", 2), ("g", 3)], now=0.0) == 0
+    assert backend.take_tokens([("k", 2), ("g", 3)], now=0.0) == 0
+    assert backend.take_tokens([("k", 2), ("g", 3)], now=0.0) == 30.0
+    # 上一次没有扣减全局桶，其他键还能取到最后一个令牌
+    assert backend.take_tokens([("other", 2), ("g", 3)], now=0.0) == 0
+    assert backend.take_tokens([("other", 2), ("g", 3)], now=0.0) == 20.0
+    assert backend.take_tokens([("k", 2), ("g", 3)], now=30.0) == 0
+
+
+def test_create_state_backend(tmp_path):
+    """按URL选择后端"""
+    assert isinstance(create_state_backend(""), MemoryStateBackend)
+    assert isinstance(create_state_backend("memory"), MemoryStateBackend)
+    sqlite_backend = create_state_backend(f"sqlite:///{tmp_path / 'state.db'}")
+    assert isinstance(sqlite_backend, SQLiteStateBackend) and sqlite_backend.shared
+    sqlite_backend.close()
+    with pytest.raises(ValueError):
+        create_state_backend("mongodb://localhost")
+
+
+def _acquire_many(path, count, results):
+    limiter = RateLimiter(per_key_per_minute=0, global_per_minute=50, backend=SQLiteStateBackend(path))
+    results.put(sum(1 for _ in range(count) if limiter.acquire("key") == 0))
+
+
+def test_rate_limit_shared_across_processes(tmp_path):
+    """4个进程共用SQLite后端，通过的请求总数等于全局限额，而不是每个进程各一份"""
+    path = str(tmp_path / "state.db")
+    SQLiteStateBackend(path).close()
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [context.Process(target=_acquire_many, args=(path, 40, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    granted = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(timeout=30)
+
+    # 测试期间补充的令牌不超过1个（每分钟50个）
+    assert 50 <= sum(granted) <= 51
+
+
+def test_job_status_shared(tmp_path):
+    """一个工作进程提交的任务，另一个工作进程可以查询到状态和结果"""
+    path = str(tmp_path / "state.db")
+    worker_a = JobManager(max_workers=1, backend=SQLiteStateBackend(path))
+    worker_b = JobManager(max_workers=1, backend=SQLiteStateBackend(path))
+    try:
+        def work(job):
+            job.set_stage("transcribing")
+            return {"text": "你好"}
+
+        job = worker_a.submit(work, filename="a.wav")
+        job.future.result(timeout=5)
+
+        status = worker_b.get_status(job.id)
+        assert status["status"] == JOB_COMPLETED
+        assert status["result"] == {"text": "你好"}
+        assert status["filename"] == "a.wav"
+        assert worker_b.get(job.id) is None
+        assert worker_b.get_status("missing") is None
+    finally:
+        worker_a.shutdown()
+        worker_b.shutdown()
+
+
+def test_llm_cache_shared(tmp_path):
+    """LLM结果写入共享后端后，其他进程的缓存实例也能命中"""
+    path = str(tmp_path / "state.db")
+    cache_a = LLMCache(backend=SQLiteStateBackend(path))
+    cache_b = LLMCache(backend=SQLiteStateBackend(path))
+    assert cache_b.get("k") is None
+    cache_a.put("k", "润色结果")
+    assert cache_b.get("k") == "润色结果"
+    assert cache_b.stats()["hits"] == 1
+    # 回填到本地内存
+    assert len(cache_b) == 1
+
+
+class BrokenBackend(MemoryStateBackend):
+    shared = True
+
+    def take_tokens(self, buckets, now):
+        raise ConnectionError("后端不可用")
+
+
+def test_rate_limit_fails_open_when_backend_unavailable():
+    """共享状态后端不可用时放行请求，不把后端故障变成500"""
+    limiter = RateLimiter(per_key_per_minute=1, global_per_minute=1, backend=BrokenBackend())
+    assert limiter.acquire("key") == 0
+    assert limiter.acquire("key") == 0
+
+
+def test_sandbox_acquire_off_event_loop():
+    """使用共享后端时 acquire_async 在线程池中检查限流；超限时归还进行中的名额"""
+    threads = []
+
+    class RecordingBackend(MemoryStateBackend):
+        def take_tokens(self, buckets, now):
+            threads.append(threading.current_thread())
+            return super().take_tokens(buckets, now)
+
+    manager = SandboxManager(SandboxConfig(max_requests_per_minute=1, max_global_requests_per_minute=0))
+    manager.rate_limiter = RateLimiter(1, backend=RecordingBackend())
+
+    async def main():
+        await manager.acquire_async("sk-" + "x" * 40)
+        with pytest.raises(RateLimitExceeded):
+            await manager.acquire_async("sk-" + "x" * 40)
+
+    asyncio.run(main())
+    assert manager.active_requests == 1
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+长文本分块测试
+"""
+
+from core.text_chunks import split_text
+
+
+def test_short_text_is_one_chunk():
+    """未超过上限的文本不切分"""
+    assert split_text("你好。", 10) == ["你好。"]
+
+
+def test_split_on_segment_and_sentence_boundaries():
+    """优先在换行处切分，过长的片段按句子切分，拼接后还原原文"""
+    segments = [f"第{i}句话。" for i in range(40)]
+    text = "\n".join(segments) + "\n" + "这是一句很长的话。" * 30 + "No boundary here " * 20
+    chunks = split_text(text, 100)
+
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    # 片段没有被从中间切开
+    assert all(chunk.endswith(("\n", "。", " ")) for chunk in chunks[:-1])
+
+
+def test_hard_split_without_boundaries():
+    """没有任何边界时按长度硬切"""
+    chunks = split_text("字" * 250, 100)
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+转录结果缓存测试
+"""
+
+import time
+
+from core.transcript_cache import TranscriptCache, make_cache_key
+
+RESULT = {"text": "hello world", "segments": [{"start": 0.0, "end": 1.0, "text": "hello world"}], "language": "en"}
+
+
+def test_cache_key_depends_on_params():
+    """媒体哈希或任一解码参数不同，缓存键都不同"""
+    base = make_cache_key("abc", model="tiny", language="auto", beam_size=5, vad_filter=True)
+    assert base == make_cache_key("abc", vad_filter=True, beam_size=5, language="auto", model="tiny")
+    assert base != make_cache_key("abd", model="tiny", language="auto", beam_size=5, vad_filter=True)
+    assert base != make_cache_key("abc", model="base", language="auto", beam_size=5, vad_filter=True)
+    assert base != make_cache_key("abc", model="tiny", language="auto", beam_size=1, vad_filter=True)
+
+
+def test_hit_miss_and_persistence(tmp_path):
+    """命中返回原结果，重建实例后仍可命中"""
+    cache = TranscriptCache(str(tmp_path))
+    key = make_cache_key("abc", model="tiny")
+    assert cache.get(key) is None
+    cache.put(key, RESULT)
+    assert cache.get(key) == RESULT
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    reloaded = TranscriptCache(str(tmp_path))
+    assert len(reloaded) == 1
+    assert reloaded.get(key) == RESULT
+
+
+def test_size_based_lru_eviction(tmp_path):
+    """总大小超限时淘汰最久未访问的条目"""
+    probe = TranscriptCache(str(tmp_path / "probe"))
+    probe.put("0" * 64, RESULT)
+    entry_size = probe.total_bytes
+
+    cache = TranscriptCache(str(tmp_path / "lru"), max_bytes=entry_size * 2)
+    keys = [make_cache_key(str(i)) for i in range(3)]
+    cache.put(keys[0], RESULT)
+    cache.put(keys[1], RESULT)
+    assert cache.get(keys[0]) == RESULT  # keys[0] 变为最近访问
+    cache.put(keys[2], RESULT)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == RESULT
+    assert cache.get(keys[2]) == RESULT
+    assert cache.total_bytes <= entry_size * 2
+    assert len(list((tmp_path / "lru").glob("*/*.json"))) == 2
+
+
+def test_lookup_is_fast(tmp_path):
+    """命中延迟在毫秒级"""
+    cache = TranscriptCache(str(tmp_path))
+    key = make_cache_key("abc")
+    cache.put(key, {**RESULT, "segments": RESULT["segments"] * 2000})
+    start = time.perf_counter()
+    for _ in range(20):
+        assert cache.get(key) is not None
+    elapsed = (time.perf_counter() - start) / 20
+    print(f"\n平均命中耗时: {elapsed * 1000:.2f}ms")
+    assert elapsed < 0.05
+
+
+def test_shared_between_workers(tmp_path):
+    """多个工作进程共用缓存目录：其他进程写入的结果可以命中，淘汰按整个目录的大小进行"""
+    probe = TranscriptCache(str(tmp_path / "probe"))
+    probe.put("0" * 64, RESULT)
+    entry_size = probe.total_bytes
+
+    worker_a = TranscriptCache(str(tmp_path / "shared"), max_bytes=entry_size * 2, sync_interval=0)
+    worker_b = TranscriptCache(str(tmp_path / "shared"), max_bytes=entry_size * 2, sync_interval=0)
+    keys = [make_cache_key(str(i)) for i in range(3)]
+    worker_a.put(keys[0], RESULT)
+    assert worker_b.get(keys[0]) == RESULT
+
+    time.sleep(0.01)
+    worker_a.put(keys[1], RESULT)
+    time.sleep(0.01)
+    worker_b.put(keys[2], RESULT)
+    assert len(list((tmp_path / "shared").glob("*/*.json"))) == 2
+    # 被其他进程淘汰的条目按未命中处理
+    assert worker_a.get(keys[0]) is None
+    assert worker_a.get(keys[2]) == RESULT
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+流式上传处理测试
+"""
+
+import asyncio
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from core.upload_stream import (
+    UnsupportedMediaError, UploadTooLargeError, is_streamable, receive_upload
+)
+from core.whisper_transcribe import SAMPLE_RATE
+
+BOUNDARY = "----transcribe-test-boundary"
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="需要ffmpeg")
+
+
+def build_multipart(fields, filename, content_type, data):
+    """构造 multipart 请求体（文件放在字段之前，模拟浏览器 FormData 顺序）"""
+    body = (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + data + b"\r\n"
+    for name, value in fields.items():
+        body += (
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f"{value}\r\n"
+        ).encode()
+    body += f"--{BOUNDARY}--\r\n".encode()
+    headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+    return headers, body
+
+
+async def chunked(body, size=8192):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+        await asyncio.sleep(0)
+
+
+def make_video(path, *extra_args):
+    subprocess.run(
+        ["ffmpeg", "-y", "-f", "lavfi", "-i", "sine=frequency=440:duration=3",
+         "-f", "lavfi", "-i", "color=size=64x64:duration=3", "-shortest", *extra_args, str(path)],
+        check=True, capture_output=True
+    )
+    return path.read_bytes()
+
+
+def test_iso_bmff_detection():
+    """moov 在 mdat 之前才认为 MP4 可流式解析"""
+    ftyp = (16).to_bytes(4, "big") + b"ftypisom" + b"\0" * 4
+    moov = (8).to_bytes(4, "big") + b"moov"
+    mdat = (8).to_bytes(4, "big") + b"mdat"
+    assert is_streamable(".mp4", ftyp + moov + mdat)
+    assert not is_streamable(".mp4", ftyp + mdat + moov)
+    assert is_streamable(".webm", b"")
+    assert not is_streamable(".avi", b"")
+
+
+@requires_ffmpeg
+def test_streamable_container_is_piped(tmp_path):
+    """mkv 上传直接通过 ffmpeg 管道得到音频，不落盘"""
+    data = make_video(tmp_path / "in.mkv")
+    headers, body = build_multipart({"language": "en", "model": "base"}, "in.mkv", "video/x-matroska", data)
+    upload = asyncio.run(receive_upload(headers, chunked(body), max_bytes=10 * 1024 * 1024))
+    assert upload.streamed
+    assert upload.video_path is None
+    assert upload.fields == {"language": "en", "model": "base"}
+    assert upload.size == len(data)
+    assert abs(len(upload.audio) / SAMPLE_RATE - 3.0) < 0.1
+
+
+@requires_ffmpeg
+def test_moov_at_end_mp4_is_written_to_disk(tmp_path):
+    """moov 在末尾的 MP4 落盘保存，faststart 的 MP4 则流式处理"""
+    data = make_video(tmp_path / "in.mp4")
+    headers, body = build_multipart({}, "in.mp4", "video/mp4", data)
+    upload = asyncio.run(receive_upload(headers, chunked(body), max_bytes=10 * 1024 * 1024))
+    try:
+        assert not upload.streamed
+        assert upload.audio is None
+        assert upload.video_path.read_bytes() == data
+    finally:
+        upload.cleanup()
+    assert not upload.work_dir.exists()
+
+    data = make_video(tmp_path / "fast.mp4", "-movflags", "+faststart")
+    headers, body = build_multipart({}, "fast.mp4", "video/mp4", data)
+    upload = asyncio.run(receive_upload(headers, chunked(body), max_bytes=10 * 1024 * 1024))
+    assert upload.streamed
+    assert abs(len(upload.audio) / SAMPLE_RATE - 3.0) < 0.1
+
+
+def test_rejects_non_video_and_oversized():
+    """非视频类型和超出大小限制的上传被拒绝"""
+    headers, body = build_multipart({}, "a.txt", "text/plain", b"hello")
+    with pytest.raises(UnsupportedMediaError):
+        asyncio.run(receive_upload(headers, chunked(body), max_bytes=1024))
+
+    headers, body = build_multipart({}, "a.avi", "video/x-msvideo", b"\0" * 4096)
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(receive_upload(headers, chunked(body, 512), max_bytes=1024))
+
+
+def test_rejects_missing_and_truncated_file():
+    """缺少文件part、请求体在文件结束前中断时报错，并清理已落盘的临时文件"""
+    headers, body = build_multipart({"language": "zh"}, "a.avi", "video/x-msvideo", b"")
+    body = body.replace(b'name="file"', b'name="other"')
+    with pytest.raises(ValueError, match="缺少上传文件"):
+        asyncio.run(receive_upload(headers, chunked(body), max_bytes=1024))
+
+    work_dirs = set(Path(tempfile.gettempdir()).glob("transcribe_*"))
+    headers, body = build_multipart({}, "a.avi", "video/x-msvideo", b"\0" * (128 * 1024))
+    with pytest.raises(ValueError, match="上传不完整"):
+        asyncio.run(receive_upload(headers, chunked(body[:100 * 1024]), max_bytes=1024 * 1024))
+    assert set(Path(tempfile.gettempdir()).glob("transcribe_*")) == work_dirs
+
+
+@requires_ffmpeg
+def test_extract_time_excludes_upload_time(tmp_path):
+    """客户端上传较慢时，音频提取耗时只包含上传结束后ffmpeg的收尾，上传耗时单独记录"""
+    data = make_video(tmp_path / "in.mkv")
+    headers, body = build_multipart({}, "in.mkv", "video/x-matroska", data)
+
+    async def slow(body):
+        async for chunk in chunked(body, len(body) // 4 + 1):
+            yield chunk
+            await asyncio.sleep(0.2)
+
+    upload = asyncio.run(receive_upload(headers, slow(body), max_bytes=10 * 1024 * 1024))
+    assert upload.streamed
+    assert upload.upload_time >= 0.4
+    assert upload.audio_time < 0.4
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+按URL转录测试：本地HTTP服务代替视频站点，由yt-dlp通用提取器下载，
+只下载音频后送入音频提取和转录（使用假模型，不加载Whisper）
+"""
+
+import asyncio
+import functools
+import http.server
+import tempfile
+import threading
+import wave
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import pytest
+
+import app as app_module
+from core.download_cache import DownloadCache
+from downloader.video_downloader import VideoDownloader
+
+
+@pytest.fixture(scope="module")
+def media_server(tmp_path_factory):
+    """提供 /speech.wav（1秒440Hz正弦波）的本地HTTP服务，返回 (地址, 根目录, 已处理的请求路径)"""
+    root = tmp_path_factory.mktemp("media")
+    samples = (np.sin(np.arange(16000) * 2 * np.pi * 440 / 16000) * 8000).astype(np.int16)
+    with wave.open(str(root / "speech.wav"), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(samples.tobytes())
+
+    requests = []
+
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def send_head(self):
+            requests.append(self.path)
+            return super().send_head()
+
+    handler = functools.partial(QuietHandler, directory=str(root))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", root, requests
+    server.shutdown()
+
+
+def test_download_audio_via_generic_extractor(media_server, tmp_path):
+    """通用提取器按 bestaudio 下载原始文件，不重新编码"""
+    base_url, root, _ = media_server
+    assert VideoDownloader().detect_platform(f"{base_url}/speech.wav") is None
+
+    downloader = VideoDownloader(allow_generic=True)
+    path = downloader.download_audio(f"{base_url}/speech.wav", str(tmp_path))
+    assert path.endswith(".wav")
+    assert open(path, "rb").read() == (root / "speech.wav").read_bytes()
+
+    with pytest.raises(RuntimeError):
+        VideoDownloader(allow_generic=True, max_filesize=100).download_audio(
+            f"{base_url}/speech.wav", str(tmp_path / "limited")
+        )
+
+
+def test_transcribe_url_endpoint(media_server, monkeypatch, tmp_path):
+    """/transcribe/url 下载音频并提取为16kHz数组后交给模型，结束后清理临时目录；
+    同一URL再次请求时使用下载缓存，不再访问源站"""
+    base_url, _, requests = media_server
+    received = []
+
+    class FakeModel:
+        def transcribe(self, audio, **params):
+            received.append(audio)
+            segment = SimpleNamespace(start=0.0, end=1.0, text="你好")
+            return iter([segment]), SimpleNamespace(language="zh", duration=1.0)
+
+    monkeypatch.setattr(app_module, "url_downloader", VideoDownloader(allow_generic=True))
+    monkeypatch.setattr(app_module, "transcript_cache", None)
+    monkeypatch.setattr(app_module, "download_cache", DownloadCache(str(tmp_path / "downloads")))
+    monkeypatch.setattr(app_module.model_registry, "get", lambda name: FakeModel())
+
+    async def post(payload):
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/transcribe/url", json=payload, timeout=30)
+
+    work_dirs = set(Path(tempfile.gettempdir()).glob("transcribe_url_*"))
+    response = asyncio.run(post({"url": f"{base_url}/speech.wav", "language": "zh"}))
+    assert response.status_code == 200, response.text
+    assert response.json()["text"] == "你好"
+    assert response.headers["X-Transcript-Cache"] == "miss"
+    assert len(received) == 1 and abs(app_module.audio_duration(received[0]) - 1.0) < 0.05
+    assert set(Path(tempfile.gettempdir()).glob("transcribe_url_*")) == work_dirs
+
+    served = len(requests)
+    response = asyncio.run(post({"url": f"{base_url}/speech.wav", "language": "zh"}))
+    assert response.status_code == 200 and response.json()["text"] == "你好"
+    assert len(requests) == served
+    assert app_module.download_cache.stats()["hits"] == 1
+
+    assert asyncio.run(post({"url": f"{base_url}/missing.wav"})).status_code == 400
+    assert asyncio.run(post({"url": "ftp://example.com/a.wav"})).status_code == 400
+
+
+def test_platform_detection_uses_hostname(media_server, tmp_path):
+    """平台按主机名判断：查询参数或相似域名中出现平台域名不算，非 http/https 不接受"""
+    base_url, _, requests = media_server
+    downloader = VideoDownloader()
+    assert downloader.detect_platform("https://www.youtube.com/watch?v=dQw4w9WgXcQ") == "youtube"
+    assert downloader.detect_platform("https://youtu.be/dQw4w9WgXcQ") == "youtube"
+    assert downloader.detect_platform("https://m.bilibili.com/video/BV1xx411c7mD") == "bilibili"
+    for url in ("http://169.254.169.254/latest/meta-data/?v=youtube.com", "https://evilyoutube.com/watch",
+                "https://youtube.com.evil.net/", "ftp://youtube.com/a.mp4", f"{base_url}/speech.wav"):
+        assert downloader.detect_platform(url) is None, url
+
+    # 未开启通用提取器时，即使绕过平台检测直接下载也不会访问该地址
+    served = len(requests)
+    with pytest.raises(ValueError):
+        downloader.download_youtube(f"{base_url}/speech.wav?v=youtube.com", str(tmp_path), audio_only=True)
+    assert len(requests) == served
+
+
+def test_transcribe_url_rejects_internal_address(media_server):
+    """默认配置下 /transcribe/url 拒绝非视频平台的地址，不发起任何请求"""
+    base_url, _, requests = media_server
+    served = len(requests)
+
+    async def post():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/transcribe/url", json={"url": f"{base_url}/speech.wav?v=youtube.com"})
+
+    assert asyncio.run(post()).status_code == 400
+    assert len(requests) == served